@@ -16,7 +16,7 @@ setup(
   keywords = ['fuzzy logic', 'sugeno', 'mamdani', 'reasoner', 'python', 'modeling'], # arbitrary keywords
   license='LICENSE.txt',
   install_requires=[
-        "numpy >= 1.12.0",
+        "numpy >= 1.17.0",
         "scipy >= 1.0.0",
         "requests",
     ],
@@ -1,4 +1,7 @@
 from .simpful import FuzzySystem, ProbaFuzzySystem, LinguisticVariable, UndefinedUniverseOfDiscourseError, AutoTriangle
-from .rule_parsing import Clause, Functional, OR, AND, AND_p, NOT, preparse, postparse, find_index_operator, curparse
+from .rule_parsing import Clause, Functional, OR, AND, AND_p, NOT, preparse, postparse, find_index_operator, curparse, canonical_form, rulebase_hash
 from .fuzzy_sets import FuzzySet, MF_object, Sigmoid_MF, InvSigmoid_MF, Gaussian_MF, InvGaussian_MF, DoubleGaussian_MF, Triangular_MF, Trapezoidal_MF, TriangleFuzzySet, TrapezoidFuzzySet, SigmoidFuzzySet, InvSigmoidFuzzySet, GaussianFuzzySet, InvGaussianFuzzySet, DoubleGaussianFuzzySet, Clustering_Gaussian_MF
 from .rules import RuleGen, proba_generator, duplicate
+from .clustering import FuzzyCMeans, ClusteringCache
+from . import metrics
+from .differentiable import ParameterLayout, Adam
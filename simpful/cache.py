@@ -0,0 +1,56 @@
+from collections import OrderedDict
+
+
+class LRUCache(object):
+	"""
+		Bounded mapping which evicts the least recently used entry when full, 
+		and keeps statistics about the lookups.
+
+		Args:
+			max_size: maximum number of stored entries. Default is 128.
+	"""
+
+	def __init__(self, max_size=128):
+		self.max_size = max_size
+		self._entries = OrderedDict()
+		self.hits = 0
+		self.misses = 0
+
+	def get(self, key):
+		"""
+			Returns the value stored for the key (None if missing), updating the statistics.
+		"""
+		if key in self._entries:
+			self.hits += 1
+			self._entries.move_to_end(key)
+			return self._entries[key]
+		self.misses += 1
+		return None
+
+	def put(self, key, value):
+		"""
+			Stores a value, evicting the least recently used one if the cache is full.
+		"""
+		self._entries[key] = value
+		self._entries.move_to_end(key)
+		while len(self._entries) > self.max_size:
+			self._entries.popitem(last=False)
+
+	@property
+	def hit_rate(self):
+		lookups = self.hits + self.misses
+		return self.hits/lookups if lookups > 0 else 0.
+
+	def clear(self):
+		self._entries.clear()
+		self.hits = 0
+		self.misses = 0
+
+	def __contains__(self, key):
+		return key in self._entries
+
+	def __len__(self):
+		return len(self._entries)
+
+	def __repr__(self):
+		return "<%s: %d entries, %d hits, %d misses (hit rate %.2f)>" % (type(self).__name__, len(self), self.hits, self.misses, self.hit_rate)
@@ -0,0 +1,205 @@
+import numpy as np
+from hashlib import blake2b
+from .cache import LRUCache
+
+
+def _squared_distances(X, centers):
+	"""Squared euclidean distances between the rows of X and the centers, shape (n_samples, n_clusters)."""
+	distances = (X**2).sum(axis=1)[:, None] - 2*(X @ centers.T) + (centers**2).sum(axis=1)
+	return np.maximum(distances, 0, out=distances)
+
+
+class FuzzyCMeans(object):
+	"""
+		Fuzzy c-means clustering with k-means++ initialization, optional mini-batch
+		updates and streaming (chunked) fitting.
+
+		The whole dataset can be clustered with fit(); data that do not fit in memory
+		can be fed chunk by chunk to partial_fit(), e.g.:
+
+			fcm = FuzzyCMeans(n_clusters=5, dtype=np.float32)
+			for chunk in chunks:
+				fcm.partial_fit(chunk)
+
+		Args:
+			n_clusters: number of clusters.
+			m: fuzzifier of the memberships (must be greater than 1). Default is 1.75.
+			tol: the fit stops when no center moves more than tol; with mini-batches, when the smoothed objective
+				has not decreased by more than tol (relative) for several mini-batches in a row. Default is 1e-4.
+			max_iter: maximum number of iterations (full passes, or mini-batches if batch_size is set). Default is 300.
+			batch_size: if set, each iteration of fit() uses a random mini-batch of this size. Default is None (full batch).
+			seed: seed of the random number generator used for initialization and mini-batches.
+			dtype: floating point type used for the computation (e.g., np.float32). Default is np.float64.
+	"""
+
+	def __init__(self, n_clusters, m=1.75, tol=1e-4, max_iter=300, batch_size=None, seed=None, dtype=np.float64):
+		if m <= 1: raise Exception("ERROR: the fuzzifier m must be greater than 1")
+		self.n_clusters = n_clusters
+		self.m = m
+		self.tol = tol
+		self.max_iter = max_iter
+		self.batch_size = batch_size
+		self.dtype = dtype
+		self._rng = np.random.default_rng(seed)
+		self.cluster_centers_ = None
+		self.n_iter_ = 0
+		self.n_samples_seen_ = 0
+		self.converged_ = False
+		self._weights = None
+
+	def _check_data(self, X):
+		X = np.asarray(X, dtype=self.dtype)
+		if X.ndim == 1: X = X[:, None]
+		return X
+
+	def _init_centers(self, X):
+		# k-means++ seeding
+		if len(X) < self.n_clusters:
+			raise Exception("ERROR: at least %d samples are required to initialize %d clusters, %d given" % (self.n_clusters, self.n_clusters, len(X)))
+		centers = np.empty((self.n_clusters, X.shape[1]), dtype=self.dtype)
+		centers[0] = X[self._rng.integers(len(X))]
+		closest = _squared_distances(X, centers[:1])[:, 0]
+		for k in range(1, self.n_clusters):
+			total = closest.sum()
+			if total > 0:
+				index = self._rng.choice(len(X), p=closest/total)
+			else:
+				index = self._rng.integers(len(X))
+			centers[k] = X[index]
+			np.minimum(closest, _squared_distances(X, centers[k:k+1])[:, 0], out=closest)
+		self.cluster_centers_ = centers
+		self._weights = np.zeros(self.n_clusters, dtype=self.dtype)
+
+	def memberships(self, X):
+		"""
+			Returns the fuzzy memberships of the samples to the clusters.
+
+			Args:
+				X: array of shape (n_samples, n_features).
+
+			Returns:
+				an ndarray of shape (n_samples, n_clusters) whose rows sum up to one.
+		"""
+		if self.cluster_centers_ is None: raise Exception("ERROR: the clustering was not fitted yet")
+		X = self._check_data(X)
+		return self._memberships(_squared_distances(X, self.cluster_centers_))
+
+	def _memberships(self, distances):
+		# u_ik proportional to d_ik^(-2/(m-1)); samples lying on a center get (almost) full membership
+		logs = -np.log(np.maximum(distances, np.finfo(self.dtype).tiny))/(self.m-1)
+		logs -= logs.max(axis=1, keepdims=True)
+		U = np.exp(logs, out=logs)
+		U /= U.sum(axis=1, keepdims=True)
+		return U
+
+	def predict(self, X):
+		"""
+			Returns the index of the cluster with the highest membership for each sample.
+		"""
+		return np.argmax(self.memberships(X), axis=1)
+
+	# number of consecutive mini-batches without improvement of the smoothed objective after which fit() stops
+	_patience = 10
+
+	def _update(self, X, accumulate):
+		# one (weighted) c-means update of the centers, returns the largest center displacement 
+		# and the objective of the samples before the update, divided by their number
+		distances = _squared_distances(X, self.cluster_centers_)
+		W = self._memberships(distances)**self.m
+		objective = float((W*distances).sum()) / len(X)
+		sums = W.sum(axis=0)
+		weighted = W.T @ X
+		if accumulate:
+			total = self._weights + sums
+			new_centers = (self._weights[:, None]*self.cluster_centers_ + weighted) / np.maximum(total, np.finfo(self.dtype).tiny)[:, None]
+			self._weights = total
+		else:
+			new_centers = weighted / np.maximum(sums, np.finfo(self.dtype).tiny)[:, None]
+		shift = np.sqrt(((new_centers-self.cluster_centers_)**2).sum(axis=1)).max()
+		self.cluster_centers_ = new_centers.astype(self.dtype, copy=False)
+		return shift, objective
+
+	def fit(self, X):
+		"""
+			Clusters the dataset, starting from a k-means++ initialization.
+
+			Args:
+				X: array of shape (n_samples, n_features).
+
+			Returns:
+				the fitted FuzzyCMeans object.
+		"""
+		X = self._check_data(X)
+		self._init_centers(X)
+		mini_batch = self.batch_size is not None and self.batch_size < len(X)
+		self.converged_ = False
+		if mini_batch:
+			# exponential moving average of the objective of the mini-batches, about two passes over the data
+			alpha = min(1., 2.*self.batch_size/(len(X)+1))
+			smoothed, best, no_improvement = None, np.inf, 0
+		for self.n_iter_ in range(1, self.max_iter+1):
+			if mini_batch:
+				# the accumulated weights shrink the shifts as the iterations go on, whatever the
+				# distance from convergence: the smoothed objective is monitored instead
+				batch = X[self._rng.choice(len(X), self.batch_size, replace=False)]
+				objective = self._update(batch, accumulate=True)[1]
+				smoothed = objective if smoothed is None else (1-alpha)*smoothed + alpha*objective
+				if smoothed < best*(1-self.tol):
+					best, no_improvement = smoothed, 0
+				else:
+					no_improvement += 1
+				self.converged_ = no_improvement >= self._patience
+			else:
+				self.converged_ = self._update(X, accumulate=False)[0] <= self.tol
+			if self.converged_:
+				break
+		self.n_samples_seen_ = len(X)
+		return self
+
+	def partial_fit(self, X):
+		"""
+			Updates the centers with a chunk of data (streaming fuzzy c-means).
+			The first chunk is used for the k-means++ initialization.
+
+			Args:
+				X: array of shape (n_samples, n_features).
+
+			Returns:
+				the updated FuzzyCMeans object.
+		"""
+		X = self._check_data(X)
+		if self.cluster_centers_ is None:
+			self._init_centers(X)
+		shift = self._update(X, accumulate=True)[0]
+		self.converged_ = shift <= self.tol
+		self.n_iter_ += 1
+		self.n_samples_seen_ += len(X)
+		return self
+
+
+class ClusteringCache(LRUCache):
+	"""
+		Least recently used cache of clustering results (e.g., centers and widths), 
+		shared among the candidates of a rule search so that the same clustering is not run twice.
+
+		Args:
+			max_size: maximum number of stored results. Default is 128.
+	"""
+
+	@staticmethod
+	def fingerprint(X):
+		"""
+			Returns a digest of the content, shape and type of a dataset.
+		"""
+		X = np.ascontiguousarray(X)
+		digest = blake2b(digest_size=16)
+		digest.update(str((X.shape, X.dtype.str)).encode())
+		digest.update(X.data)
+		return digest.hexdigest()
+
+	def make_key(self, var_names, n_centers, X, seed, *args):
+		"""
+			Builds the key of a clustering: variable subset, number of centers, data fingerprint and seed.
+			Any further argument that affects the result can be appended.
+		"""
+		return (tuple(var_names), int(n_centers), self.fingerprint(X), seed) + args
@@ -0,0 +1,250 @@
+import numpy as np
+from .fuzzy_sets import Gaussian_MF, Triangular_MF
+from .rule_parsing import Clause, collect_clauses
+
+
+def membership_gradients(mf, x):
+	"""Computes the memberships of an array of values together with their derivatives with respect to
+	the parameters of the membership function. Gaussian_MF (mu, sigma) and Triangular_MF (a, b, c) are
+	differentiable; the other membership functions are treated as constant. Truncation is ignored.
+
+	Args:
+		mf (MF_object): the membership function.
+		x (ndarray): 1-D array of values.
+
+	Returns:
+		tuple: the memberships, and a dictionary mapping the name of each parameter (e.g., '_mu')
+		to the derivatives of the memberships.
+	"""
+	if isinstance(mf, Gaussian_MF):
+		distance = x - mf._mu
+		values = np.exp(-distance**2 / (2*mf._sigma**2))
+		return values, {"_mu": values*distance/mf._sigma**2, "_sigma": values*distance**2/mf._sigma**3}
+	if isinstance(mf, Triangular_MF):
+		a, b, c = mf._a, mf._b, mf._c
+		values = np.clip(mf._execute_array(x), 0, 1)
+		gradients = {"_a": np.zeros_like(x), "_b": np.zeros_like(x), "_c": np.zeros_like(x)}
+		if a != b:
+			rising = (x > a) & (x < b)
+			gradients["_a"][rising] = (x[rising]-b) / (b-a)**2
+			gradients["_b"][rising] = -(x[rising]-a) / (b-a)**2
+		if b != c:
+			falling = (x >= b) & (x < c)
+			gradients["_b"][falling] += (c-x[falling]) / (c-b)**2
+			gradients["_c"][falling] = (x[falling]-b) / (c-b)**2
+		return values, gradients
+	return mf.evaluate_array(x), {}
+
+
+class ParameterLayout(object):
+	"""
+		Maps the parameters of a fuzzy system to the positions of a vector: the parameters of the
+		differentiable membership functions (see membership_gradients) appearing in the antecedents
+		of the rules, followed by the crisp consequents of the rules of an output variable, if given.
+		The shoulders of triangular sets (a=b or b=c) are preserved by tying the two vertices.
+
+		Args:
+			FuzzySystem: the fuzzy system.
+			output: name of the output variable whose crisp consequents are parameters. Default is None.
+	"""
+
+	def __init__(self, FuzzySystem, output=None):
+		self._FS = FuzzySystem
+		self.entries = []
+		self._offsets = {}
+		size = 0
+		pairs = sorted(set((c._variable, c._term) for rule in FuzzySystem._rules for c in collect_clauses(rule[0])))
+		for variable, term in pairs:
+			lv = FuzzySystem._lvs.get(variable)
+			if lv is None or lv.get_index(term) == -1: continue
+			mf = getattr(lv._FSlist[lv.get_index(term)], "_funpointer", None)
+			if isinstance(mf, Gaussian_MF):
+				names, tied = ["_mu", "_sigma"], {}
+			elif isinstance(mf, Triangular_MF):
+				names, tied = ["_a", "_b", "_c"], {}
+				if mf._a == mf._b: names, tied = ["_b", "_c"], {"_a": "_b"}
+				elif mf._b == mf._c: names, tied = ["_a", "_b"], {"_c": "_b"}
+			else:
+				continue
+			self._offsets[(variable, term)] = (size, names, tied)
+			self.entries.append((variable, term, mf, names, tied))
+			size += len(names)
+		self.n_membership = size
+		self.consequents = []
+		if output is not None:
+			self.consequents = sorted(set(rule[1][1] for rule in FuzzySystem._rules
+				if rule[1][0] == output and rule[1][1] in FuzzySystem._crispvalues))
+		self.size = size + len(self.consequents)
+
+	def clause_gradients(self, clause, data):
+		"""Returns the memberships of a clause and the dictionary mapping positions to their derivatives."""
+		lv = self._FS._lvs[clause._variable]
+		fs = lv._FSlist[lv.get_index(clause._term)]
+		x = np.asarray(data[clause._variable], dtype=float)
+		if (clause._variable, clause._term) not in self._offsets:
+			return np.asarray(fs.get_value_array(x), dtype=float), {}
+		offset, names, tied = self._offsets[(clause._variable, clause._term)]
+		values, gradients = membership_gradients(fs._funpointer, x)
+		for follower, leader in tied.items():
+			gradients[leader] = gradients[leader] + gradients[follower]
+		return values, {offset+i: gradients[name] for i, name in enumerate(names)}
+
+	def clause_log_gradients(self, clause, data):
+		"""Returns the logarithm of the memberships of a clause and the dictionary mapping positions 
+		to its derivatives."""
+		lv = self._FS._lvs[clause._variable]
+		mf = getattr(lv._FSlist[lv.get_index(clause._term)], "_funpointer", None)
+		if (clause._variable, clause._term) in self._offsets and isinstance(mf, Gaussian_MF):
+			offset = self._offsets[(clause._variable, clause._term)][0]
+			distance = np.asarray(data[clause._variable], dtype=float) - mf._mu
+			return -distance**2 / (2*mf._sigma**2), {offset: distance/mf._sigma**2, offset+1: distance**2/mf._sigma**3}
+		values, gradients = self.clause_gradients(clause, data)
+		inverse = np.divide(1., values, out=np.zeros_like(values), where=values>0)
+		with np.errstate(divide="ignore"):
+			return np.log(values), {position: gradient*inverse for position, gradient in gradients.items()}
+
+	def get_vector(self):
+		"""Returns the current values of the parameters."""
+		theta = [getattr(mf, name) for _, _, mf, names, _ in self.entries for name in names]
+		theta += [self._FS._crispvalues[term] for term in self.consequents]
+		return np.array(theta, dtype=float)
+
+	def set_vector(self, theta):
+		"""Sets the parameters of the fuzzy system, keeping the sigmas positive and the vertices of the
+		triangles sorted, and returns the values actually set. The lookup tables of the variables
+		whose parameters change are removed."""
+		theta = np.array(theta, dtype=float)
+		offset = 0
+		for variable, _, mf, names, tied in self.entries:
+			block = theta[offset:offset+len(names)]
+			if isinstance(mf, Gaussian_MF):
+				block[1] = max(block[1], 1e-6)
+			else:
+				block.sort()
+			for name, value in zip(names, block): setattr(mf, name, float(value))
+			for follower, leader in tied.items(): setattr(mf, follower, getattr(mf, leader))
+			mf.__dict__.pop("_moments_cache", None)
+			offset += len(names)
+		for term, value in zip(self.consequents, theta[self.n_membership:]):
+			self._FS._crispvalues[term] = float(value)
+		for variable in set(entry[0] for entry in self.entries):
+			lv = self._FS._lvs[variable]
+			lv.clear_lookup_table()
+			for fs in lv._FSlist: fs.__dict__.pop("_moments_cache", None)
+		self._FS._rule_index = None
+		return theta
+
+
+def _combine(weight_A, gradients_A, weight_B, gradients_B):
+	# derivatives of weight_A*A + weight_B*B, given those of A and B
+	result = {}
+	for key, gradient in gradients_A.items():
+		result[key] = weight_A*gradient
+	for key, gradient in gradients_B.items():
+		result[key] = result[key] + weight_B*gradient if key in result else weight_B*gradient
+	return result
+
+
+def log_antecedent_gradients(node, layout, data):
+	"""Evaluates the logarithm of an antecedent on a dataset together with its derivatives (chain rule 
+	through the AND (minimum), AND_p (product), OR (maximum) and NOT operators). Products of Gaussian 
+	clauses are computed as sums of logarithms, so that they do not underflow with many variables.
+
+	Args:
+		node (Clause OR Functional Object): the antecedent of a rule.
+		layout (ParameterLayout): the positions of the parameters.
+		data (dict): contains, for each variable, a 1-D array of values.
+
+	Returns:
+		tuple: the logarithm of the firing strengths (-inf where they are zero), and a dictionary 
+		mapping positions of parameters to the derivatives of the logarithm.
+	"""
+	if isinstance(node, Clause):
+		return layout.clause_log_gradients(node, data)
+	log_B, gradients_B = log_antecedent_gradients(node._B, layout, data)
+	if node._A == "":
+		if node._fun != "NOT": raise Exception("ERROR: operator '%s' not supported" % node._fun)
+		# d log(1-B) = -B/(1-B) d log B
+		B = np.exp(log_B)
+		factor = -np.divide(B, 1-B, out=np.zeros_like(B), where=B<1)
+		with np.errstate(divide="ignore"):
+			return np.log1p(-B), {key: factor*gradient for key, gradient in gradients_B.items()}
+	log_A, gradients_A = log_antecedent_gradients(node._A, layout, data)
+	if node._fun == "AND_p":
+		return log_A+log_B, _combine(1, gradients_A, 1, gradients_B)
+	if node._fun in ("AND", "OR"):
+		first = log_A <= log_B if node._fun == "AND" else log_A >= log_B
+		return np.where(first, log_A, log_B), _combine(first, gradients_A, ~first, gradients_B)
+	raise Exception("ERROR: operator '%s' not supported" % node._fun)
+
+
+def log_firing_strengths_gradients(FuzzySystem, data, layout, rules=None):
+	"""Computes the logarithm of the firing strengths of the rules on a dataset together with its derivatives.
+
+	Args:
+		FuzzySystem: the fuzzy system.
+		data (dict): contains, for each variable, a 1-D array of values.
+		layout (ParameterLayout): the positions of the parameters.
+		rules (list, optional): indices of the rules to evaluate. Defaults to all the rules.
+
+	Returns:
+		tuple: the logarithm of the firing strengths, shape (n_samples, n_rules), and the list of 
+		the dictionaries of the derivatives of each rule.
+	"""
+	if rules is None: rules = range(len(FuzzySystem._rules))
+	n_samples = len(next(iter(data.values())))
+	log_firing = np.empty((n_samples, len(rules)))
+	gradients = []
+	for column, r in enumerate(rules):
+		values, rule_gradients = log_antecedent_gradients(FuzzySystem._rules[r][0], layout, data)
+		log_firing[:, column] = values
+		gradients.append(rule_gradients)
+	return log_firing, gradients
+
+
+def jacobian(gradients, weights, size):
+	"""Returns the matrix J[n, k] = sum_r weights[n, r] * d log firing[n, r] / d theta_k."""
+	result = np.zeros((len(weights), size))
+	for column, rule_gradients in enumerate(gradients):
+		for key, gradient in rule_gradients.items():
+			result[:, key] += weights[:, column]*gradient
+	return result
+
+
+class Adam(object):
+	"""
+		Adam optimizer (Kingma and Ba, 2015) over a vector of parameters.
+
+		Args:
+			learning_rate: step size. Default is 0.01.
+			beta1: decay of the first moment. Default is 0.9.
+			beta2: decay of the second moment. Default is 0.999.
+			eps: term added to the denominator. Default is 1e-8.
+	"""
+
+	def __init__(self, learning_rate=0.01, beta1=0.9, beta2=0.999, eps=1e-8):
+		self.learning_rate = learning_rate
+		self.beta1 = beta1
+		self.beta2 = beta2
+		self.eps = eps
+		self._moments = None
+		self._t = 0
+
+	def step(self, theta, gradient):
+		"""Returns the parameters updated against the gradient."""
+		if self._moments is None: self._moments = (np.zeros_like(theta), np.zeros_like(theta))
+		first, second = self._moments
+		self._t += 1
+		first = self.beta1*first + (1-self.beta1)*gradient
+		second = self.beta2*second + (1-self.beta2)*gradient**2
+		self._moments = (first, second)
+		corrected = first / (1-self.beta1**self._t)
+		return theta - self.learning_rate*corrected / (np.sqrt(second/(1-self.beta2**self._t)) + self.eps)
+
+
+def minibatches(n_samples, batch_size, rng):
+	"""Returns the indices of the shuffled mini-batches of an epoch (a single batch if batch_size is None)."""
+	if batch_size is None or batch_size >= n_samples:
+		return [np.arange(n_samples)]
+	order = rng.permutation(n_samples)
+	return [order[start:start+batch_size] for start in range(0, n_samples, batch_size)]
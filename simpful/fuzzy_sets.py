@@ -1,15 +1,208 @@
 from numpy import array, linspace
 import numpy as np
+import math
 from scipy.interpolate import interp1d
 
 class MF_object(object):
 
+	# memberships below this threshold are approximated to zero (None: exact memberships)
+	_epsilon = None
+
 	def __init__(self):
 		pass
 
 	def __call__(self, x):
 		ret = self._execute(x)
-		return min(1, max(0, ret))
+		ret = min(1, max(0, ret))
+		if self._epsilon is not None and ret < self._epsilon: return 0
+		return ret
+
+	def evaluate_array(self, x):
+		""" Return the memberships of an array of elements of the universe of discourse.
+
+			Args:
+				x: 1-D array of elements of the universe of discourse.
+
+			Returns:
+				a 1-D ndarray containing the memberships.
+		"""
+		ret = np.clip(self._execute_array(np.asarray(x, dtype=float)), 0, 1)
+		if self._epsilon is not None: ret[ret < self._epsilon] = 0
+		return ret
+
+	def _execute_array(self, x):
+		# fallback for membership functions without a vectorized implementation
+		return np.array([self._execute(v) for v in x], dtype=float)
+
+	def set_truncation(self, epsilon):
+		""" Approximates to zero all memberships below a threshold, so that the membership function 
+			gets a finite support. Each membership is changed by less than epsilon.
+
+			Args:
+				epsilon: the truncation threshold; None restores the exact membership function.
+		"""
+		if epsilon is not None and not 0 < epsilon < 1:
+			raise Exception("ERROR: the truncation threshold must be in (0, 1), Simpful received epsilon=%s" % epsilon)
+		self._epsilon = epsilon
+		self.__dict__.pop("_moments_cache", None)
+
+	def get_support(self):
+		""" Return the interval outside of which the membership is zero.
+
+			Returns:
+				a tuple (left, right); unbounded sides are reported as -inf/inf.
+		"""
+		return (-np.inf, np.inf)
+
+	def get_area(self, cut=1, x0=-np.inf, x1=np.inf):
+		""" Return the area under the membership function capped to the cut value.
+
+			Args:
+				cut: alpha cut of the membership function (default: 1, i.e., no cut).
+				x0: left integration bound (default: -inf).
+				x1: right integration bound (default: inf).
+
+			Returns:
+				the area of min(cut, mu(x)) over [x0, x1].
+		"""
+		return self._clipped_moments(cut, x0, x1)[0]
+
+	def get_centroid(self, cut=1, x0=-np.inf, x1=np.inf):
+		""" Return the centroid of the membership function capped to the cut value.
+
+			Args:
+				cut: alpha cut of the membership function (default: 1, i.e., no cut).
+				x0: left integration bound (default: -inf).
+				x1: right integration bound (default: inf).
+
+			Returns:
+				the centroid of min(cut, mu(x)) over [x0, x1], or nan if the area is zero or unbounded.
+		"""
+		return _centroid(*self._clipped_moments(cut, x0, x1))
+
+	def _clipped_moments(self, cut, x0, x1):
+		# the function is zero outside of the support (in particular, when truncated)
+		left, right = self.get_support()
+		return self._moments(cut, max(x0, left), min(x1, right))
+
+	def _moments(self, cut, x0, x1):
+		# numerical fallback for membership functions without a closed form, cached
+		cache = self.__dict__.setdefault("_moments_cache", {})
+		key = (cut, x0, x1)
+		if key not in cache:
+			cache[key] = _numeric_moments(self, cut, x0, x1)
+		return cache[key]
+
+###################################
+# HELPERS FOR AREAS AND CENTROIDS #
+###################################
+
+def _centroid(area, moment):
+	if area == 0 or np.isinf(area):
+		return np.nan
+	return moment / area
+
+def _numeric_moments(f, cut, lo, hi):
+	import scipy.integrate as integrate
+	if lo >= hi:
+		return (0., 0.)
+	if np.isinf(lo) or np.isinf(hi):
+		raise Exception("ERROR: cannot integrate a membership function with unbounded support, please specify the integration bounds")
+	area = integrate.quad(lambda x: min(cut, f(x)), lo, hi)[0]
+	moment = integrate.quad(lambda x: x*min(cut, f(x)), lo, hi)[0]
+	return (area, moment)
+
+def _linear_moments(xa, ya, xb, yb):
+	# exact area and first moment of a linear segment
+	dx = xb - xa
+	return (dx*(ya+yb)/2., dx*(xa*(2*ya+yb) + xb*(ya+2*yb))/6.)
+
+def _polyline_moments(xs, ys, left, right, cut, x0, x1):
+	"""
+		Area and first moment of min(cut, f) over [x0, x1], where f is the piecewise 
+		linear function through (xs, ys), constant to left/right outside of the points.
+	"""
+	pieces = [(-np.inf, left, xs[0], left)]
+	pieces += [(xs[i], ys[i], xs[i+1], ys[i+1]) for i in range(len(xs)-1)]
+	pieces.append((xs[-1], right, np.inf, right))
+	area = 0.; moment = 0.
+	for xa, ya, xb, yb in pieces:
+		lo = max(xa, x0); hi = min(xb, x1)
+		if lo >= hi: continue
+		if np.isinf(lo) or np.isinf(hi):
+			if min(cut, ya) > 0: return (np.inf, np.nan)
+			continue
+		if ya != yb:
+			if xa != lo: ya = ya + (lo-xa) * (yb-ya) / (xb-xa)
+			if xb != hi: yb = ya + (hi-lo) * (yb-ya) / (xb-lo)
+		points = [(lo, ya)]
+		if (ya-cut)*(yb-cut) < 0:
+			points.append((lo + (cut-ya) * (hi-lo) / (yb-ya), cut))
+		points.append((hi, yb))
+		for (pa, va), (pb, vb) in zip(points[:-1], points[1:]):
+			a, m = _linear_moments(pa, min(cut, va), pb, min(cut, vb))
+			area += a; moment += m
+	return (area, moment)
+
+def _truncate_polyline(xs, ys, left, right, epsilon):
+	"""
+		Returns the polyline (points and constant values outside of them) of the piecewise linear 
+		function through (xs, ys) with the values below epsilon set to zero. Where a segment crosses 
+		epsilon the point is repeated, so that the jump is a vertical segment.
+	"""
+	if epsilon is None:
+		return list(xs), list(ys), left, right
+	new_xs, new_ys = [], []
+	for i in range(len(xs)):
+		if i > 0 and (ys[i-1]-epsilon)*(ys[i]-epsilon) < 0:
+			crossing = xs[i-1] + (epsilon-ys[i-1]) * (xs[i]-xs[i-1]) / (ys[i]-ys[i-1])
+			steps = [0., epsilon] if ys[i] > epsilon else [epsilon, 0.]
+			new_xs += [crossing, crossing]; new_ys += steps
+		new_xs.append(xs[i]); new_ys.append(ys[i] if ys[i] >= epsilon else 0.)
+	return new_xs, new_ys, left if left >= epsilon else 0., right if right >= epsilon else 0.
+
+def _polyline_support(xs, ys, left, right):
+	# interval outside of which a polyline (see _polyline_moments) is zero
+	nonzero = np.nonzero(ys)[0]
+	if len(nonzero) == 0:
+		support = (xs[0], xs[0])
+	else:
+		support = (xs[max(nonzero[0]-1, 0)], xs[min(nonzero[-1]+1, len(xs)-1)])
+	return (-np.inf if left != 0 else support[0], np.inf if right != 0 else support[1])
+
+def _gaussian_moments(mu, sigma, lo, hi):
+	# exact area and first moment of a Gaussian over [lo, hi]
+	if lo >= hi: return (0., 0.)
+	s = sigma*math.sqrt(2)
+	area = sigma*math.sqrt(math.pi/2) * (math.erf((hi-mu)/s) - math.erf((lo-mu)/s))
+	g = lambda x: 0. if np.isinf(x) else math.exp(-(x-mu)**2/(2*sigma**2))
+	return (area, mu*area + sigma**2*(g(lo)-g(hi)))
+
+def _constant_moments(value, lo, hi):
+	if lo >= hi or value == 0: return (0., 0.)
+	if np.isinf(lo) or np.isinf(hi): return (np.inf, np.nan)
+	return (value*(hi-lo), value*(hi**2-lo**2)/2.)
+
+def _gaussian_radius(sigma, cut):
+	# distance from the mean at which a Gaussian crosses the cut value
+	if cut >= 1: return 0.
+	return sigma*math.sqrt(-2*math.log(cut))
+
+def _sigmoid_crossing(c, a, value):
+	# point at which a sigmoid crosses value
+	return c + math.log(value/(1-value))/a
+
+def _piecewise_gaussian_moments(pieces, x0, x1):
+	area = 0.; moment = 0.
+	for kind, lo, hi, par in pieces:
+		lo = max(lo, x0); hi = min(hi, x1)
+		if kind == "gaussian":
+			a, m = _gaussian_moments(par[0], par[1], lo, hi)
+		else:
+			a, m = _constant_moments(par, lo, hi)
+			if np.isinf(a): return (a, m)
+		area += a; moment += m
+	return (area, moment)
 		
 #########################################
 # USEFUL PRE-BAKED MEMBERSHIP FUNCTIONS #
@@ -59,6 +252,22 @@ class Triangular_MF(MF_object):
 			else:
 				return 1
 
+	def _execute_array(self, x):
+		left = (x-self._a) * (1/(self._b-self._a)) if self._a != self._b else np.ones_like(x)
+		right = 1 + (x-self._b) * (-1/(self._c-self._b)) if self._b != self._c else np.ones_like(x)
+		return np.where(x < self._b, left, right)
+
+	def _polyline(self):
+		# the (truncated) membership function as a polyline, see _polyline_moments
+		return _truncate_polyline([self._a, self._b, self._c], [float(self._a==self._b), 1., float(self._b==self._c)],
+			float(self._a==self._b), float(self._b==self._c), self._epsilon)
+
+	def get_support(self):
+		return _polyline_support(*self._polyline())
+
+	def _moments(self, cut, x0, x1):
+		return _polyline_moments(*self._polyline(), cut, x0, x1)
+
 	def __repr__(self):
 		return "<Triangular MF (%f, %f, %f)>"% (self._a, self._b, self._c)
 
@@ -94,6 +303,22 @@ class Trapezoidal_MF(MF_object):
 			else:
 				return 1
 
+	def _execute_array(self, x):
+		left = (x-self._a) * (1/(self._b-self._a)) if self._a != self._b else np.ones_like(x)
+		right = 1 + (x-self._c) * (-1/(self._d-self._c)) if self._c != self._d else np.ones_like(x)
+		return np.where(x < self._b, left, np.where(x <= self._c, 1., right))
+
+	def _polyline(self):
+		# the (truncated) membership function as a polyline, see _polyline_moments
+		return _truncate_polyline([self._a, self._b, self._c, self._d], [float(self._a==self._b), 1., 1., float(self._c==self._d)],
+			float(self._a==self._b), float(self._c==self._d), self._epsilon)
+
+	def get_support(self):
+		return _polyline_support(*self._polyline())
+
+	def _moments(self, cut, x0, x1):
+		return _polyline_moments(*self._polyline(), cut, x0, x1)
+
 class Sigmoid_MF(MF_object):
 	"""
 		Creates a sigmoidal membership function.
@@ -110,6 +335,14 @@ class Sigmoid_MF(MF_object):
 	def _execute(self, x):
 		return 1.0/(1.0 + np.exp(-self._a*(x-self._c))) 
 
+	def _execute_array(self, x):
+		return self._execute(x)
+
+	def get_support(self):
+		if self._epsilon is None or self._a == 0: return (-np.inf, np.inf)
+		crossing = _sigmoid_crossing(self._c, self._a, self._epsilon)
+		return (crossing, np.inf) if self._a > 0 else (-np.inf, crossing)
+
 class InvSigmoid_MF(MF_object):
 	"""
 		Creates an inversed sigmoid membership function.
@@ -126,6 +359,14 @@ class InvSigmoid_MF(MF_object):
 	def _execute(self, x):
 		return 1.0 - 1.0/(1.0 + np.exp(-self._a*(x-self._c)))
 
+	def _execute_array(self, x):
+		return self._execute(x)
+
+	def get_support(self):
+		if self._epsilon is None or self._a == 0: return (-np.inf, np.inf)
+		crossing = _sigmoid_crossing(self._c, self._a, 1-self._epsilon)
+		return (-np.inf, crossing) if self._a > 0 else (crossing, np.inf)
+
 class Clustering_Gaussian_MF(MF_object):    
 	"""
 	
@@ -148,6 +389,9 @@ class Clustering_Gaussian_MF(MF_object):
 		sum_acts = sum([np.exp(- (x-mu)**2 / sig**2) for mu, sig in zip(self.all_mus, self.all_sigs)])
 		return act/sum_acts
 
+	def _execute_array(self, x):
+		return self._execute(x)
+
 class Gaussian_MF(MF_object):
 	"""
 		Creates a Gaussian membership function.
@@ -165,6 +409,22 @@ class Gaussian_MF(MF_object):
 	def _execute(self, x):
 		return _gaussian(x, self._mu, self._sigma)
 
+	def _execute_array(self, x):
+		return self._execute(x)
+
+	def get_support(self):
+		if self._epsilon is None: return (-np.inf, np.inf)
+		r = _gaussian_radius(self._sigma, self._epsilon)
+		return (self._mu-r, self._mu+r)
+
+	def _moments(self, cut, x0, x1):
+		if cut <= 0: return (0., 0.)
+		r = _gaussian_radius(self._sigma, cut)
+		return _piecewise_gaussian_moments([
+			("gaussian", -np.inf, self._mu-r, (self._mu, self._sigma)),
+			("constant", self._mu-r, self._mu+r, min(cut, 1)),
+			("gaussian", self._mu+r, np.inf, (self._mu, self._sigma))], x0, x1)
+
 class InvGaussian_MF(MF_object):
 	"""
 		Creates an inversed Gaussian membership function.
@@ -181,6 +441,9 @@ class InvGaussian_MF(MF_object):
 	def _execute(self, x):
 		return 1.-_gaussian(x, self._mu, self._sigma)
 
+	def _execute_array(self, x):
+		return self._execute(x)
+
 class DoubleGaussian_MF(MF_object):
 	"""
 		Creates a double Gaussian membership function.
@@ -212,6 +475,24 @@ class DoubleGaussian_MF(MF_object):
 		else:
 			return 1.0
 
+	def _execute_array(self, x):
+		first = _gaussian(x, self._mu1, self._sigma1)
+		second = _gaussian(x, self._mu2, self._sigma2)
+		return np.where(x <= self._mu1, first, np.where(x >= self._mu2, second, 1.))
+
+	def get_support(self):
+		if self._epsilon is None: return (-np.inf, np.inf)
+		return (self._mu1-_gaussian_radius(self._sigma1, self._epsilon), self._mu2+_gaussian_radius(self._sigma2, self._epsilon))
+
+	def _moments(self, cut, x0, x1):
+		if cut <= 0: return (0., 0.)
+		r1 = _gaussian_radius(self._sigma1, cut)
+		r2 = _gaussian_radius(self._sigma2, cut)
+		return _piecewise_gaussian_moments([
+			("gaussian", -np.inf, self._mu1-r1, (self._mu1, self._sigma1)),
+			("constant", self._mu1-r1, self._mu2+r2, min(cut, 1)),
+			("gaussian", self._mu2+r2, np.inf, (self._mu2, self._sigma2))], x0, x1)
+
 
 class Crisp_MF(MF_object):
 	"""
@@ -231,6 +512,15 @@ class Crisp_MF(MF_object):
 		if x>self._right: return 0
 		return 1
 
+	def _execute_array(self, x):
+		return ((x >= self._left) & (x <= self._right)).astype(float)
+
+	def get_support(self):
+		return (self._left, self._right)
+
+	def _moments(self, cut, x0, x1):
+		return _constant_moments(min(cut, 1), max(x0, self._left), min(x1, self._right))
+
 class FuzzySet(object):
 	"""
 		Creates a new fuzzy set.
@@ -295,6 +585,23 @@ class FuzzySet(object):
 			return self.get_value_fast(v)
 
 
+	def get_value_array(self, v):
+		""" Return the membership values of an array of elements to this Fuzzy Set.
+
+			Args:
+				v: 1-D array of elements of the universe of discourse.
+
+			Returns: 
+				a 1-D ndarray containing the membership values.
+		"""
+		if self._type == "function":
+			if isinstance(self._funpointer, MF_object):
+				return self._funpointer.evaluate_array(v)
+			return np.array([self._funpointer(x) for x in v], dtype=float)
+		return np.interp(v, self._points.T[0], self._points.T[1], 
+			left=self.boundary_values[0], right=self.boundary_values[1])
+
+
 	def get_term(self):
 		""" Return the linguistic term associated to this fuzzy set.
 		"""
@@ -332,10 +639,64 @@ class FuzzySet(object):
 		return y0 + (x-x0) * ((y1-y0)/(x1-x0))
 
 
+	def get_support(self):
+		""" Return the interval outside of which the membership to this Fuzzy Set is zero.
+
+			Returns:
+				a tuple (left, right); unbounded sides are reported as -inf/inf.
+		"""
+		if self._type == "function":
+			if isinstance(self._funpointer, MF_object):
+				return self._funpointer.get_support()
+			return (-np.inf, np.inf)
+		x = self._points.T[0]
+		y = self._points.T[1]
+		nonzero = np.nonzero(y)[0]
+		if len(nonzero) == 0:
+			left = right = x[0]
+		else:
+			left = x[max(nonzero[0]-1, 0)]
+			right = x[min(nonzero[-1]+1, len(x)-1)]
+		if self.boundary_values[0] != 0: left = -np.inf
+		if self.boundary_values[1] != 0: right = np.inf
+		return (left, right)
+
+	def get_area(self, cut=1, x0=-np.inf, x1=np.inf):
+		""" Return the area of this Fuzzy Set, capped to the cut value.
+
+			Args:
+				cut: alpha cut of the fuzzy set (default: 1, i.e., no cut).
+				x0: left integration bound (default: -inf).
+				x1: right integration bound (default: inf).
+		"""
+		return self._moments(cut, x0, x1)[0]
+
+	def get_centroid(self, cut=1, x0=-np.inf, x1=np.inf):
+		""" Return the centroid of this Fuzzy Set, capped to the cut value.
+
+			Args:
+				cut: alpha cut of the fuzzy set (default: 1, i.e., no cut).
+				x0: left integration bound (default: -inf).
+				x1: right integration bound (default: inf).
+
+			Returns:
+				the centroid, or nan if the area is zero or unbounded.
+		"""
+		return _centroid(*self._moments(cut, x0, x1))
+
+	def _moments(self, cut, x0, x1):
+		if self._type == "function":
+			if isinstance(self._funpointer, MF_object):
+				return self._funpointer._clipped_moments(cut, x0, x1)
+			cache = self.__dict__.setdefault("_moments_cache", {})
+			if (cut, x0, x1) not in cache:
+				cache[(cut, x0, x1)] = _numeric_moments(self._funpointer, cut, x0, x1)
+			return cache[(cut, x0, x1)]
+		return _polyline_moments(self._points.T[0], self._points.T[1], 
+			self.boundary_values[0], self.boundary_values[1], cut, x0, x1)
+
 	def integrate(self, x0, x1, cut=1):
-		import scipy.integrate as integrate
-		result = integrate.quad(self.get_value_cut, x0, x1, args=(cut))
-		return result[0]
+		return self.get_area(cut=cut, x0=x0, x1=x1)
 
 
 ###############################
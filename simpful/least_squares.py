@@ -0,0 +1,136 @@
+import numpy as np
+from scipy.linalg import cholesky, solve_triangular, cho_factor, cho_solve
+from scipy.optimize import lsq_linear
+
+
+def _factorize(gram):
+	"""Cholesky factor (lower triangular) of a Gram matrix. A tiny ridge term is added 
+	when the matrix is singular (e.g., two rules with identical activations).
+	"""
+	jitter = 0.
+	scale = max(np.trace(gram)/len(gram), 1e-300)
+	while True:
+		try:
+			return cholesky(gram + jitter*np.eye(len(gram)), lower=True)
+		except np.linalg.LinAlgError:
+			jitter = scale*1e-12 if jitter == 0 else jitter*100
+
+
+def bounded_least_squares(gram, rhs, yty, bounds=(0, 1)):
+	"""Solves min ||A b - y||^2 subject to bounds on b, given only the precomputed 
+	A^T A, A^T y and y^T y, so that the cost of the solve does not depend on the number of samples.
+
+	Args:
+		gram (ndarray): A^T A, shape (n_rules, n_rules).
+		rhs (ndarray): A^T y, shape (n_rules,).
+		yty (float): y^T y.
+		bounds (tuple, optional): lower and upper bounds on b. Defaults to (0, 1).
+
+	Returns:
+		tuple: the solution b and a dictionary with the solver diagnostics.
+	"""
+	L = _factorize(gram)
+	# ||A b - y||^2 = ||L^T b - L^-1 A^T y||^2 + const
+	target = solve_triangular(L, rhs, lower=True)
+	res = lsq_linear(L.T, target, bounds=bounds, method="bvls")
+	b = res.x
+	info = {
+		"status": res.status,
+		"message": res.message,
+		"iterations": res.nit,
+		"cost": float(b @ gram @ b - 2*b @ rhs + yty),
+		"active_bounds": int(np.count_nonzero(res.active_mask)),
+	}
+	return b, info
+
+
+def project_rows_to_simplex(B):
+	"""Euclidean projection of each row of B onto the probability simplex.
+
+	Args:
+		B (ndarray): shape (n_rows, n_columns).
+
+	Returns:
+		ndarray: the projected matrix, whose rows are non-negative and sum up to one.
+	"""
+	n_columns = B.shape[1]
+	sorted_B = -np.sort(-B, axis=1)
+	cumulative = np.cumsum(sorted_B, axis=1) - 1
+	index = np.arange(1, n_columns+1)
+	rho = np.count_nonzero(sorted_B - cumulative/index > 0, axis=1)
+	theta = cumulative[np.arange(len(B)), rho-1] / rho
+	return np.maximum(B - theta[:, None], 0)
+
+
+def simplex_least_squares(gram, rhs, yty, tol=1e-10, max_iter=10000):
+	"""Solves min ||A B - Y||^2 subject to each row of B lying on the probability simplex 
+	(i.e., non-negative and summing up to one), for all the columns of Y together. 
+	The unconstrained solution, computed with a single Cholesky factorization of A^T A, 
+	is refined with accelerated projected gradient iterations that only involve 
+	A^T A and A^T Y, so that their cost does not depend on the number of samples.
+
+	Args:
+		gram (ndarray): A^T A, shape (n_rules, n_rules).
+		rhs (ndarray): A^T Y, shape (n_rules, n_classes).
+		yty (float): the squared Frobenius norm of Y.
+		tol (float, optional): tolerance on the change of B to stop the iterations. Defaults to 1e-10.
+		max_iter (int, optional): maximum number of iterations. Defaults to 10000.
+
+	Returns:
+		tuple: the solution B and a dictionary with the solver diagnostics.
+	"""
+	L = _factorize(gram)
+	B = project_rows_to_simplex(solve_triangular(L.T, solve_triangular(L, rhs, lower=True), lower=False))
+	step = 1. / max(np.linalg.eigvalsh(gram)[-1], 1e-300)
+	momentum = B.copy()
+	t = 1.
+	status = 0
+	for iteration in range(1, max_iter+1):
+		new_B = project_rows_to_simplex(momentum - step*(gram @ momentum - rhs))
+		new_t = (1 + np.sqrt(1 + 4*t**2)) / 2
+		momentum = new_B + ((t-1)/new_t)*(new_B - B)
+		change = np.abs(new_B - B).max()
+		B, t = new_B, new_t
+		if change < tol:
+			status = 1
+			break
+	info = {
+		"status": status,
+		"message": "converged" if status == 1 else "maximum number of iterations reached",
+		"iterations": iteration,
+		"cost": float(np.sum(B * (gram @ B)) - 2*np.sum(B * rhs) + yty),
+		"active_bounds": int(np.count_nonzero(B == 0)),
+	}
+	return B, info
+
+
+def recursive_least_squares(P, B, A, Y, forgetting=1.):
+	"""One step of recursive least squares with exponential forgetting, for a chunk of samples: 
+	updates the solution B of min sum_i forgetting^(age of i) ||a_i B - y_i||^2 and the inverse 
+	(weighted) Gram matrix P, using the Woodbury identity. The cost of the update depends on the 
+	size of the chunk, not on the number of samples seen before.
+
+	Args:
+		P (ndarray): inverse of the (weighted, regularized) Gram matrix, shape (n_rules, n_rules).
+		B (ndarray): current solution, shape (n_rules, n_targets).
+		A (ndarray): rows of the chunk, shape (n_samples, n_rules), oldest first.
+		Y (ndarray): targets of the chunk, shape (n_samples, n_targets).
+		forgetting (float, optional): weight of each sample relative to the following one, in (0, 1]. Defaults to 1.
+
+	Returns:
+		tuple: the updated P and B.
+	"""
+	n_rules = len(P)
+	# chunks larger than the number of rules are processed in blocks, to keep the cost linear in the chunk size
+	for start in range(0, len(A), n_rules):
+		block, targets = A[start:start+n_rules], Y[start:start+n_rules]
+		n = len(block)
+		P = P / forgetting**n
+		PAt = P @ block.T
+		S = block @ PAt
+		S[np.diag_indices(n)] += forgetting**(-np.arange(n-1, -1, -1.))
+		gain = cho_solve(cho_factor(S), PAt.T).T
+		B = B + gain @ (targets - block @ B)
+		P = P - gain @ PAt.T
+		P = (P + P.T) / 2
+	return P, B
@@ -0,0 +1,73 @@
+import numpy as np
+
+
+def confusion_matrix(y_true, y_pred, labels=None):
+	"""Computes the confusion matrix of one or many prediction vectors at once.
+
+	Args:
+		y_true (array): the true classes, shape (n_samples,).
+		y_pred (array): the predicted classes, either of shape (n_samples,) or,
+			for a batch of predictions (e.g., many candidates), of shape (n_batch, n_samples).
+		labels (array, optional): the sorted classes indexing the matrix. Defaults to
+			the sorted classes appearing in y_true or y_pred.
+
+	Returns:
+		ndarray: C[i, j] counts the samples of class labels[i] predicted as labels[j];
+		shape (n_classes, n_classes), or (n_batch, n_classes, n_classes) for a batch.
+	"""
+	y_true = np.asarray(y_true)
+	y_pred = np.asarray(y_pred)
+	if labels is None:
+		labels = np.union1d(y_true, y_pred)
+	labels = np.asarray(labels)
+	n_classes = len(labels)
+	true_index = np.searchsorted(labels, y_true)
+	pred_index = np.searchsorted(labels, y_pred)
+	if np.any(labels[np.minimum(true_index, n_classes-1)] != y_true) or np.any(labels[np.minimum(pred_index, n_classes-1)] != y_pred):
+		raise Exception("ERROR: some classes are not among the labels " + str(list(labels)))
+
+	cells = true_index*n_classes + pred_index
+	if cells.ndim == 1:
+		return np.bincount(cells, minlength=n_classes**2).reshape(n_classes, n_classes)
+	# one block of cells per prediction vector
+	cells = cells + n_classes**2*np.arange(len(cells))[:, None]
+	return np.bincount(cells.ravel(), minlength=len(cells)*n_classes**2).reshape(len(cells), n_classes, n_classes)
+
+
+def recalls(cm):
+	"""Recall of each class (sensitivity and specificity in the binary case), nan for classes without samples.
+
+	Args:
+		cm (ndarray): confusion matrix, or batch of confusion matrices (see confusion_matrix).
+
+	Returns:
+		ndarray: shape (..., n_classes).
+	"""
+	support = cm.sum(axis=-1)
+	with np.errstate(divide="ignore", invalid="ignore"):
+		return np.diagonal(cm, axis1=-2, axis2=-1)/support
+
+
+def fitness(cm):
+	"""Product of the recalls of the classes, i.e., sensitivity times specificity in the binary case.
+	Classes without samples are ignored.
+
+	Args:
+		cm (ndarray): confusion matrix, or batch of confusion matrices (see confusion_matrix).
+
+	Returns:
+		float, or ndarray of shape (n_batch,) for a batch.
+	"""
+	return np.nanprod(recalls(cm), axis=-1)
+
+
+def accuracy(cm):
+	"""Fraction of correctly classified samples.
+
+	Args:
+		cm (ndarray): confusion matrix, or batch of confusion matrices (see confusion_matrix).
+
+	Returns:
+		float, or ndarray of shape (n_batch,) for a batch.
+	"""
+	return np.trace(cm, axis1=-2, axis2=-1)/cm.sum(axis=(-2, -1))
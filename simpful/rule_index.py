@@ -0,0 +1,91 @@
+from .rule_parsing import Clause
+from collections import defaultdict
+import numpy as np
+
+class RuleIndex(object):
+	"""
+		Creates an index over the supports of the fuzzy sets of a fuzzy system, used to 
+		skip the evaluation of the rules that cannot fire given the values of the input variables.
+		For each variable the supports are kept as arrays of endpoints sorted by their left extreme, 
+		while each rule is indexed under groups of clauses such that, for the rule to fire, every group 
+		must contain at least one clause with a non-zero membership. Rules whose groups cannot be 
+		determined (e.g., because of a NOT) are always evaluated.
+
+		Args:
+			FuzzySystem: the fuzzy system whose linguistic variables and rules must be indexed.
+	"""
+
+	def __init__(self, FuzzySystem):
+		self._supports = {}
+		for name, lv in FuzzySystem._lvs.items():
+			supports = [fs.get_support() for fs in lv._FSlist]
+			order = np.argsort([s[0] for s in supports], kind="stable")
+			lefts = np.array([supports[i][0] for i in order], dtype=float)
+			rights = np.array([supports[i][1] for i in order], dtype=float)
+			terms = [lv._FSlist[i]._term for i in order]
+			self._supports[name] = (lefts, rights, terms)
+
+		self._rules_by_clause = defaultdict(list)
+		self._number_of_groups = {}
+		self._always_evaluated = []
+		for n, rule in enumerate(FuzzySystem._rules):
+			groups = self._guard(rule[0])
+			if groups is None:
+				self._always_evaluated.append(n)
+				continue
+			self._number_of_groups[n] = len(groups)
+			for g, group in enumerate(groups):
+				for key in group: self._rules_by_clause[key].append((n, g))
+
+	def _guard(self, node):
+		""" Returns a list of sets of (variable, term) pairs such that node can be non-zero only if, 
+			for each set, at least one of the pairs has a non-zero membership; None if the list 
+			cannot be determined.
+		"""
+		if isinstance(node, Clause):
+			if node._variable not in self._supports or node._term not in self._supports[node._variable][2]:
+				return None
+			return [{(node._variable, node._term)}]
+		if node._A == "":
+			# NOT can be non-zero when its argument is zero
+			return None
+		guard_A = self._guard(node._A)
+		guard_B = self._guard(node._B)
+		if node._fun == "OR":
+			if guard_A is None or guard_B is None: return None
+			return [set().union(*guard_A, *guard_B)]
+		# AND, AND_p: both arguments must be non-zero
+		if guard_A is None: return guard_B
+		if guard_B is None: return guard_A
+		return guard_A + guard_B
+
+	def get_active_terms(self, name, value):
+		""" Returns the linguistic terms of a variable whose support contains value.
+
+			Args:
+				name: name of the linguistic variable.
+				value: numerical value of the variable.
+		"""
+		lefts, rights, terms = self._supports[name]
+		last = np.searchsorted(lefts, value, side="right")
+		return [terms[i] for i in np.nonzero(rights[:last] >= value)[0]]
+
+	def get_active_rules(self, variables):
+		""" Returns the sorted indices of the rules that can have a non-zero firing strength.
+
+			Args:
+				variables: dictionary containing the current values of the variables.
+		"""
+		satisfied = set()
+		for name, (lefts, rights, terms) in self._supports.items():
+			if name in variables:
+				active_terms = self.get_active_terms(name, variables[name])
+			else:
+				# unset variables are evaluated anyway, so that the errors are raised as usual
+				active_terms = terms
+			for term in active_terms:
+				satisfied.update(self._rules_by_clause.get((name, term), ()))
+		counts = defaultdict(int)
+		for n, g in satisfied: counts[n] += 1
+		active = [n for n, c in counts.items() if c == self._number_of_groups[n]]
+		return sorted(active + self._always_evaluated)
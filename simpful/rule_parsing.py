@@ -1,4 +1,5 @@
 import re
+from hashlib import blake2b
 from numpy import array
 import numpy as np
 
@@ -32,6 +33,29 @@ class Clause(object):
 				+ " ---- PROBLEMATIC CLAUSE:\n"
 				+ str(self))
 
+	def evaluate_array(self, FuzzySystem, data):
+		""" Vectorized version of evaluate.
+
+		Args:
+			FuzzySystem: the fuzzy system containing the linguistic variables.
+			data (<class 'dict'>): contains, for each variable, a 1-D array of values.
+
+		Returns:
+			<class 'numpy.ndarray'>: the memberships of the values of the variable to the term.
+		"""
+		try:
+			lv = FuzzySystem._lvs[self._variable]
+			values = data[self._variable]
+		except KeyError:
+			raise Exception("ERROR: variable '" + self._variable + "' not defined.\n"
+				+ " ---- PROBLEMATIC CLAUSE:\n"
+				+ str(self))
+		if lv.get_index(self._term) == -1:
+			raise Exception("ERROR: term '" + self._term + "'' not defined.\n"
+				+ " ---- PROBLEMATIC CLAUSE:\n"
+				+ str(self))
+		return lv.get_term_values_array(self._term, values)
+
 	def __repr__(self):
 		return "c.(%s IS %s)" % (self._variable, self._term)
 
@@ -46,6 +70,8 @@ class Functional(object):
 	def __init__(self, fun, A, B, operators=None):
 		self._A = A
 		self._B = B
+		# bugfix for not @ nikhil
+		fun = re.sub(r'[)]\s', '', fun).strip()
 
 		if operators is None:
 			self._fun = fun
@@ -59,29 +85,200 @@ class Functional(object):
 				self._fun = fun
 
 	def evaluate(self, FuzzySystem):
+		try:
+			fun = _operators[self._fun]
+		except KeyError:
+			raise Exception("ERROR: operator '" + self._fun + "' not supported.\n"
+				+ " ---- PROBLEMATIC CLAUSE:\n"
+				+ str(self))
 		if self._A=="":
 			# support for unary operators
 			# print("Unary detected")
 			B = self._B.evaluate(FuzzySystem)
-			return array(eval(self._fun+"(%s)" % B))
+			return array(fun(B))
 		else:
 			A = self._A.evaluate(FuzzySystem)
+			# short-circuit: the second operand cannot change the result
+			if (A == 0 and self._fun in ("AND", "AND_p")) or (A == 1 and self._fun == "OR"):
+				return array(A)
 			B = self._B.evaluate(FuzzySystem)
-			# bugfix for not @ nikhil
-			if re.match(r'[)]\s', self._fun) is not None:
-				self._fun = re.sub('[)]\s', '', self._fun)
-			return array(eval(self._fun+"(%s, %s)" % (A,B)))
+			return array(fun(A, B))
 		
+	def evaluate_array(self, FuzzySystem, data):
+		""" Vectorized version of evaluate.
+
+		Args:
+			FuzzySystem: the fuzzy system containing the linguistic variables.
+			data (<class 'dict'>): contains, for each variable, a 1-D array of values.
+
+		Returns:
+			<class 'numpy.ndarray'>: the truth values of the Functional for each sample.
+		"""
+		try:
+			fun = _array_operators[self._fun]
+		except KeyError:
+			raise Exception("ERROR: operator '" + self._fun + "' not supported.\n"
+				+ " ---- PROBLEMATIC CLAUSE:\n"
+				+ str(self))
+		if self._A=="":
+			return fun(self._B.evaluate_array(FuzzySystem, data))
+		return fun(self._A.evaluate_array(FuzzySystem, data), self._B.evaluate_array(FuzzySystem, data))
+
 	def __repr__(self):
 		return "f.(" + str(self._A) + " " + self._fun + " " + str(self._B) + ")"
 
 
+def count_clauses(node):
+	"""Counts the Clauses contained in a parsed antecedent.
+
+	Args:
+		node (Clause OR Functional Object): the antecedent of a rule.
+
+	Returns:
+		<class 'int'>: the number of Clauses.
+	"""
+	if isinstance(node, Clause): return 1
+	if node._A == "": return count_clauses(node._B)
+	return count_clauses(node._A) + count_clauses(node._B)
+
+
 # basic definitions of operators
 def OR(x,y): return max(x, y)
 def AND(x,y): return min(x, y)
 def AND_p(x,y): return x*y
 def NOT(x): return 1.-x
 
+_operators = {"OR": OR, "AND": AND, "AND_p": AND_p, "NOT": NOT}
+
+# element-wise versions, for the evaluation over whole datasets
+_array_operators = {"OR": np.maximum, "AND": np.minimum, "AND_p": np.multiply, "NOT": NOT}
+
+# operators whose operands can be reordered
+_commutative_operators = ("OR", "AND", "AND_p")
+
+
+def reorder_operands(node, estimate):
+	"""Reorders the operands of chains of commutative operators (AND, AND_p, OR), so that 
+	the operands most likely to short-circuit the evaluation (i.e., to be zero for AND and AND_p, 
+	one for OR) at the lowest cost are evaluated first. Operands are assumed to be independent.
+
+	Args:
+		node (Clause OR Functional Object): the antecedent of a rule.
+		estimate (function): given a Clause, returns a tuple containing the probability that 
+		its membership is zero, the probability that it is one, and its evaluation cost.
+
+	Returns:
+		tuple: the reordered antecedent, the probability that it is zero, the probability 
+		that it is one, and its expected evaluation cost.
+	"""
+	if isinstance(node, Clause):
+		return (node,) + tuple(estimate(node))
+	if node._A == "":
+		B, p_zero, p_one, cost = reorder_operands(node._B, estimate)
+		node._B = B
+		return node, p_one, p_zero, cost
+
+	# flatten chains of the same operator, which is associative
+	operands = []
+	stack = [node]
+	while stack:
+		current = stack.pop()
+		if isinstance(current, Functional) and current._A != "" and current._fun == node._fun and node._fun in _commutative_operators:
+			stack += [current._B, current._A]
+		else:
+			operands.append(reorder_operands(current, estimate))
+	# cost per short-circuit probability, ties are broken by the cost alone
+	if node._fun == "OR":
+		operands.sort(key=lambda op: (op[3]/op[2] if op[2]>0 else np.inf, op[3]))
+	elif node._fun in _commutative_operators:
+		operands.sort(key=lambda op: (op[3]/op[1] if op[1]>0 else np.inf, op[3]))
+
+	# rebuild the chain and compute its statistics, from the last operand
+	result, p_zero, p_one, cost = operands[-1]
+	for A, A_zero, A_one, A_cost in reversed(operands[:-1]):
+		if node._fun == "OR":
+			cost = A_cost + (1-A_one)*cost
+			p_zero, p_one = A_zero*p_zero, 1-(1-A_one)*(1-p_one)
+		else:
+			cost = A_cost + (1-A_zero)*cost
+			p_zero, p_one = 1-(1-A_zero)*(1-p_zero), A_one*p_one
+		result = Functional(node._fun, A, result)
+	return result, p_zero, p_one, cost
+
+
+def collect_clauses(node):
+	"""Returns the Clauses of the antecedent of a rule, from left to right.
+
+	Args:
+		node (Clause OR Functional Object): the antecedent of a rule.
+
+	Returns:
+		<class 'list'>: the Clause objects.
+	"""
+	if isinstance(node, Clause):
+		return [node]
+	clauses = [] if node._A == "" else collect_clauses(node._A)
+	return clauses + collect_clauses(node._B)
+
+
+def render_antecedent(node):
+	"""Renders the antecedent of a rule as a string, with explicit parentheses, 
+	which curparse parses back into the same tree.
+
+	Args:
+		node (Clause OR Functional Object): the antecedent of a rule.
+
+	Returns:
+		<class 'str'>: the antecedent, e.g. '((OXI IS low_flow) AND (NOT (POWER IS HIGH)))'.
+	"""
+	if isinstance(node, Clause):
+		return "(%s IS %s)" % (node._variable, node._term)
+	if node._A == "":
+		return "(%s %s)" % (node._fun, render_antecedent(node._B))
+	return "(%s %s %s)" % (render_antecedent(node._A), node._fun, render_antecedent(node._B))
+
+
+def canonical_form(node):
+	"""Returns a string representing the antecedent of a rule, which does not depend on the 
+	order of the operands of commutative operators (AND, AND_p, OR) nor on how their chains are nested.
+
+	Args:
+		node (Clause OR Functional Object): the antecedent of a rule.
+
+	Returns:
+		<class 'str'>: the canonical form of the antecedent.
+	"""
+	if isinstance(node, Clause):
+		return node._variable + " IS " + node._term
+	if node._A == "":
+		return node._fun + "(" + canonical_form(node._B) + ")"
+	operands = []
+	stack = [node]
+	while stack:
+		current = stack.pop()
+		if isinstance(current, Functional) and current._A != "" and current._fun == node._fun and node._fun in _commutative_operators:
+			stack += [current._B, current._A]
+		else:
+			operands.append(canonical_form(current))
+	if node._fun in _commutative_operators:
+		operands.sort()
+	return node._fun + "(" + ",".join(operands) + ")"
+
+
+def rulebase_hash(rules):
+	"""Returns a hash of a rule base, which does not depend on the order of the rules 
+	nor on the order of the operands of commutative operators.
+
+	Args:
+		rules (<class 'list'>): the rules, as (antecedent, consequent) pairs of parsed rules.
+
+	Returns:
+		<class 'str'>: hexadecimal digest of the rule base.
+	"""
+	canonical_rules = sorted(canonical_form(antecedent) + " => " + str(np.asarray(consequent, dtype=object).tolist()) 
+		for antecedent, consequent in rules)
+	return blake2b("\n".join(canonical_rules).encode(), digest_size=16).hexdigest()
+
 
 def preparse(STRINGA):
 	"""Extracts the antecedent of a defined rule.
@@ -130,7 +327,8 @@ def postparse(STRINGA, verbose=False):
 						+ " ---- PROBLEMATIC RULE:\n"
 						+ STRINGA)
 	if re.match(r"P\(", stripped) is not None:
-		probas = [float(i) for i in (re.findall(r"\d\.?\d*", stripped))]
+		# only the values after '=', so that numeric outcome names are not taken as probabilities
+		probas = [float(i) for i in (re.findall(r"=\s*([0-9.]+(?:[eE][-+]?\d+)?)", stripped))]
 		if not probas:
 			class_info = re.findall(r"\w+(?=\sIS)|(?<=IS\s)\w+|\d\.\d\d|None", stripped)
 			number_of_probas = class_info.count('None')
@@ -1,7 +1,7 @@
 import numpy as np
 import operator
 import regex as re
-from .rule_parsing import preparse, postparse
+from .rule_parsing import preparse, postparse, Clause, Functional, collect_clauses, render_antecedent
 import itertools
 import random
 from random import randint, randrange
@@ -95,6 +95,8 @@ class RuleGen:
         self.pfs = None
         self.var_len = var_len
         self.unique_vars = None if unique_vars is None else unique_vars
+        self.rule_trees = None
+        self.rule_probas = None
     
     def var_selector(self):
         """
@@ -302,12 +304,15 @@ class RuleGen:
                     RULE += '({} IS cluster{}) {} '.format(var_name,
                                                            i, _operator[0])
 
+            if self.generateprobas is True:
+
+                # one draw per rule, so that its probabilities sum up to one
+                self.interpret_consequents()
+
             for k in range(len(self.n_consequents)):
 
                 if self.generateprobas is True:
 
-                    self.interpret_consequents()
-
                     if k == 0:
 
                         # first part of end of rule
@@ -359,8 +364,87 @@ class RuleGen:
 
         flatten = [
             item for sublist in var_check_mut for item in sublist]
-        unique = list(set(flatten))
+        unique = sorted(set(flatten))
         self.unique_vars = unique
 
         self.p_rules = RULES
         return RULES
+
+    def generate_proba_rule_trees(self, select=False):
+        """
+        Generates PFS rules randomly, like generate_proba_rules, but returns them directly as parsed 
+        antecedents (Clause/Functional trees) and an array of probabilities, so that they can be added 
+        to a ProbaFuzzySystem (see add_proba_rule_trees) without being rendered and parsed.
+        The antecedents are grouped as curparse groups the strings of generate_proba_rules: binary operators 
+        are nested to the right and NOT applies to everything that follows it, e.g. NOT (A AND_p (B OR C)), 
+        so that, with the same random state, both methods generate the same rules. 
+        Use render_proba_rules to obtain the rules as strings.
+
+        Returns:
+            tuple: the list of antecedents and the probabilities, an ndarray of shape (n_rules, n_consequents), 
+            or None if the probabilities have to be estimated.
+        """
+        if select is True:
+            self.var_selector()
+
+        trees = []
+        probas = []
+
+        for i in range(self.cluster_centers):
+            probas_for_rule = list(proba_generator(len(self.var_names)))
+            indexed = list(enumerate(probas_for_rule))
+            vars_to_be_incl = randint(1, len(self.var_names))
+            top_vars = sorted(indexed, key=operator.itemgetter(1))[-vars_to_be_incl:]
+            sorted_incl_indexes = sorted([i[0] for i in top_vars])
+
+            clauses = []
+            negated = []
+            connectors = []
+            for j in sorted_incl_indexes:
+                _operator = self.generate_operator()
+                clauses.append(Clause(self.var_names[j], 'cluster{}'.format(i)))
+                negated.append(_operator[0] == 'NOT')
+                connectors.append(_operator[-1])
+
+            # right fold, grouped as curparse groups the strings: a NOT applies to its clause
+            # and to everything that follows it; the connector after the last clause is not used
+            tree = Functional('NOT', "", clauses[-1]) if negated[-1] else clauses[-1]
+            for k in reversed(range(len(clauses)-1)):
+                tree = Functional(connectors[k], clauses[k], tree)
+                if negated[k]:
+                    tree = Functional('NOT', "", tree)
+            trees.append(tree)
+
+            if self.generateprobas is True:
+                probas.append(proba_generator(len(self.n_consequents)))
+            elif self.probas is not None:
+                probas.append(self.probas[i])
+
+        probas = np.array(probas) if probas else None
+
+        self.unique_vars = sorted(set(clause._variable for tree in trees for clause in collect_clauses(tree)))
+        self.rule_trees = trees
+        self.rule_probas = probas
+        return trees, probas
+
+    def render_proba_rules(self, trees=None, probas=None):
+        """
+        Renders probabilistic rules given as parsed antecedents and probabilities as strings, 
+        in the syntax of generate_proba_rules (explicit parentheses are added to the antecedents).
+
+        Args:
+            trees ([list], optional): the antecedents. Defaults to the last trees generated by generate_proba_rule_trees.
+            probas ([ndarray], optional): shape (n_rules, n_consequents), None for probabilities to be estimated. 
+            Defaults to the last probabilities generated by generate_proba_rule_trees.
+
+        Returns:
+            [list]: the rules as strings.
+        """
+        if trees is None:
+            trees, probas = self.rule_trees, self.rule_probas
+        RULES = []
+        for i, tree in enumerate(trees):
+            consequents = ['P(OUTCOME IS {})={}'.format(consequent, None if probas is None else probas[i][k])
+                           for k, consequent in enumerate(self.n_consequents)]
+            RULES.append('IF ' + render_antecedent(tree) + ' THEN ' + ', '.join(consequents))
+        return RULES
@@ -0,0 +1,455 @@
+from .simpful import ProbaFuzzySystem
+from .rule_parsing import preparse, postparse, curparse, rulebase_hash, collect_clauses
+from .cache import LRUCache
+from .clustering import ClusteringCache
+from multiprocessing import Pool
+from contextlib import contextmanager
+from hashlib import blake2b
+import itertools
+import numpy as np
+import random
+import os
+
+
+# data preloaded in each worker process by _init_worker
+_worker_data = {}
+
+
+def _init_worker(X, y, X_test, y_test, var_names, threshold):
+	# the clustering cache of the worker is shared by the candidates that it scores
+	_worker_data.update(X=X, y=y, X_test=X_test, y_test=y_test, var_names=var_names, threshold=threshold, 
+		cluster_cache=ClusteringCache())
+
+
+class FitnessMemo(LRUCache):
+	"""
+		Bounded memo of the scores of the candidates already evaluated, keyed by the canonical hash 
+		of their rule base (see rulebase_hash), their other arguments and the data (see candidate_key), 
+		so that the rule search does not fit twice equivalent candidates.
+		Values are (fitness, accuracy) tuples.
+
+		Args:
+			max_size: maximum number of stored scores. Default is 10000.
+	"""
+
+	def __init__(self, max_size=10000):
+		super().__init__(max_size=max_size)
+
+
+def parse_proba_rules(rules):
+	"""
+		Parses probabilistic rules (strings) into antecedents and probabilities.
+
+		Returns:
+			tuple: the list of antecedents and the probabilities, an ndarray of shape (n_rules, n_consequents), 
+			or None if the probabilities have to be estimated.
+	"""
+	trees = [curparse(preparse(rule)) for rule in rules]
+	consequents = [postparse(rule) for rule in rules]
+	if all(consequent[1] is True for consequent in consequents):
+		return trees, None
+	return trees, np.array(consequents, dtype=float)
+
+
+def hash_rule_trees(trees, probas, n_consequents):
+	"""
+		Returns the canonical hash of a probabilistic rule base given as antecedents and probabilities
+		(the same as ProbaFuzzySystem.get_rulebase_hash after add_proba_rule_trees).
+	"""
+	if probas is None:
+		consequents = [np.array([n_consequents, True])]*len(trees)
+	else:
+		consequents = [np.asarray(p, dtype=float) for p in probas]
+	return rulebase_hash(list(zip(trees, consequents)))
+
+
+def hash_rules(rules):
+	"""
+		Returns the canonical hash of a list of probabilistic rules (strings).
+	"""
+	trees, probas = parse_proba_rules(rules)
+	return hash_rule_trees(trees, probas, None if probas is not None else postparse(rules[0])[0])
+
+
+@contextmanager
+def _seeded(seed):
+	# seeds the global random number generators used by ProbaFuzzySystem, restoring the caller's state afterwards
+	if seed is None:
+		yield
+		return
+	states = random.getstate(), np.random.get_state()
+	random.seed(seed)
+	np.random.seed(seed)
+	try:
+		yield
+	finally:
+		random.setstate(states[0])
+		np.random.set_state(states[1])
+
+
+def _normalize(value):
+	# hashable description of an argument of ProbaFuzzySystem, which does not depend on the order of dictionaries
+	if isinstance(value, np.ndarray):
+		return ("ndarray", ClusteringCache.fingerprint(value))
+	if isinstance(value, dict):
+		return tuple(sorted((str(k), _normalize(v)) for k, v in value.items()))
+	if isinstance(value, (list, tuple)):
+		return tuple(_normalize(v) for v in value)
+	return repr(value)
+
+
+def data_fingerprint(*arrays):
+	"""
+		Returns a digest of the content of some datasets (e.g., training and test data).
+	"""
+	return "".join(ClusteringCache.fingerprint(array) for array in arrays)
+
+
+def candidate_key(rules_key, kwargs, data_key):
+	"""
+		Returns the key of the score of a candidate: the canonical hash of its rule base, the other
+		arguments of ProbaFuzzySystem (sorted) and the fingerprint of the data.
+	"""
+	digest = blake2b(digest_size=16)
+	digest.update(repr((rules_key, _normalize(kwargs), data_key)).encode())
+	return digest.hexdigest()
+
+
+def generate_candidate_rules(candidate, var_names, consequents, seed=None):
+	"""
+		Returns the rules of a candidate of the rule search: the rules themselves if given,
+		otherwise random rules generated as in ProbaFuzzySystem.generate_proba_rule_trees.
+
+		Args:
+			candidate: either a list of probabilistic rules (strings), or a dictionary of arguments of
+				ProbaFuzzySystem (e.g., numb_rules, threshold) used to generate random rules;
+				the dictionary may also contain the rules, either as strings under the key "rules", 
+				or as antecedents and probabilities under the keys "trees" and "rule_probas".
+			var_names: names of the variables which can appear in the rules.
+			consequents: the classes.
+			seed: if given, the seed of the random number generators used to generate the rules
+				(the state of the global generators is restored afterwards).
+
+		Returns:
+			tuple: the antecedents, the probabilities (None if they have to be estimated) 
+			and the remaining arguments of ProbaFuzzySystem.
+	"""
+	kwargs = dict(candidate) if isinstance(candidate, dict) else {"rules": candidate}
+	rules = kwargs.pop("rules", None)
+	trees = kwargs.pop("trees", None)
+	probas = kwargs.pop("rule_probas", None)
+	kwargs.setdefault("consequents", consequents)
+	if rules is not None:
+		trees, probas = parse_proba_rules(rules)
+	elif trees is None:
+		kwargs.setdefault("var_names", var_names)
+		with _seeded(seed):
+			trees, probas = ProbaFuzzySystem(all_var_names=var_names, **kwargs).generate_proba_rule_trees()
+	return list(trees), probas, kwargs
+
+
+def build_candidate(candidate, X, y, X_test, y_test, var_names, seed=None, cluster_cache=None):
+	"""
+		Builds a ProbaFuzzySystem from a candidate of the rule search, ready to be scored on the test set.
+
+		Args:
+			candidate: either a list of probabilistic rules (strings), or a dictionary of arguments of
+				ProbaFuzzySystem (see generate_candidate_rules).
+			X, y: training data, shape (n_samples, n_variables) and (n_samples,).
+			X_test, y_test: test data.
+			var_names: names of the columns of X.
+			seed: if given, the seed of the random number generators used to build the candidate
+				(the state of the global generators is restored afterwards).
+			cluster_cache: optional ClusteringCache used to reuse the centers and widths of previous candidates.
+
+		Returns:
+			the ProbaFuzzySystem, with rules and linguistic variables.
+	"""
+	trees, probas, kwargs = generate_candidate_rules(candidate, var_names, [str(c) for c in np.unique(y)], seed=seed)
+	kwargs["numb_rules"] = len(trees)
+	kwargs["unique_vars"] = sorted(set(clause._variable for tree in trees for clause in collect_clauses(tree)))
+	kwargs.setdefault("var_names", var_names)
+	if cluster_cache is not None:
+		kwargs["cluster_cache"] = cluster_cache
+	with _seeded(seed):
+		pfs = ProbaFuzzySystem(all_var_names=var_names, X=X, X_test=X_test, y=y, y_test=y_test,
+							   pred_test=True, _return_class=True, **kwargs)
+		pfs.add_proba_rule_trees(trees, probas)
+		pfs.X_reformatter()
+		pfs.add_linguistic_variables()
+	return pfs
+
+
+def score_candidate(candidate, X, y, X_test, y_test, var_names, seed=None, threshold=None, cluster_cache=None):
+	"""
+		Builds a candidate (see build_candidate), predicts the test set and returns its fitness and accuracy.
+		If a threshold is given, the test set is scored in chunks and the scoring stops as soon as 
+		the candidate cannot reach the threshold (see ProbaFuzzySystem.evaluate_racing).
+	"""
+	return _score(candidate, X, y, X_test, y_test, var_names, seed, threshold, cluster_cache)[:2]
+
+
+def _score(candidate, X, y, X_test, y_test, var_names, seed, threshold, cluster_cache=None):
+	# fitness, accuracy and whether the racing stopped early (i.e., the scores are only estimates)
+	pfs = build_candidate(candidate, X, y, X_test, y_test, var_names, seed=seed, cluster_cache=cluster_cache)
+	if threshold is not None:
+		fitness, accuracy, _, stopped = pfs.evaluate_racing(threshold, seed=seed)
+		return fitness, accuracy, stopped
+	pfs.predict_pfs()
+	return pfs.evaluate_fitness(), pfs.evaluate_accuracy(), False
+
+
+def _score_in_worker(args):
+	candidate, seed = args
+	return _score(candidate, seed=seed, **_worker_data)
+
+
+def candidate_seeds(n_candidates, seed=None):
+	"""
+		Returns one independent seed per candidate, derived from a single seed,
+		so that each candidate gets the same seed whatever the number of workers.
+	"""
+	return [int(s.generate_state(1)[0]) for s in np.random.SeedSequence(seed).spawn(n_candidates)]
+
+
+def evaluate_population(candidates, X, y, X_test, y_test, var_names, n_jobs=None, seed=None, memo=None, threshold=None):
+	"""
+		Scores a population of candidates of the rule search, in parallel.
+		Training and test data are sent once to each worker process, which keeps a ClusteringCache, 
+		so that the clustering of the training data is reused by the candidates that it scores.
+
+		The rules of each candidate are generated first, then each candidate is fitted with a seed 
+		derived from its key: the canonical hash of its rule base, its other arguments and the data 
+		(see candidate_key), so that equivalent candidates get the same scores.
+		Candidates found in the memo, or repeated in the population, are fitted only once.
+
+		Args:
+			candidates: list of candidates (see build_candidate).
+			X, y: training data, shape (n_samples, n_variables) and (n_samples,).
+			X_test, y_test: test data.
+			var_names: names of the columns of X.
+			n_jobs: number of worker processes; None or -1 uses all the cores, 1 runs in the current process.
+			seed: seed from which the seed of each candidate is derived.
+			memo: optional FitnessMemo, consulted before fitting and updated with the new exact scores 
+				(not with the estimates of the candidates stopped early, see threshold).
+			threshold: if given, the scoring of a candidate stops as soon as it cannot reach this fitness, 
+				and its scores are estimated on the test samples scored so far.
+
+		Returns:
+			two ndarrays of shape (n_candidates,): the fitness and the accuracy of each candidate.
+	"""
+	entropy = np.random.SeedSequence(seed).entropy
+	consequents = [str(c) for c in np.unique(y)]
+	data_key = data_fingerprint(X, y, X_test, y_test) + repr(list(var_names))
+	keys, jobs, scores = [], {}, {}
+	for candidate, candidate_seed in zip(candidates, candidate_seeds(len(candidates), entropy)):
+		trees, probas, kwargs = generate_candidate_rules(candidate, var_names, consequents, seed=candidate_seed)
+		# build_candidate derives the number of rules and the variables from the rules themselves
+		fit_kwargs = {name: value for name, value in kwargs.items() if name not in ("numb_rules", "unique_vars")}
+		fit_kwargs.setdefault("var_names", var_names)
+		key = candidate_key(hash_rule_trees(trees, probas, len(kwargs["consequents"])), fit_kwargs, data_key)
+		keys.append(key)
+		if key in jobs or key in scores:
+			continue
+		cached = memo.get(key) if memo is not None else None
+		if cached is not None:
+			scores[key] = cached
+			continue
+		kwargs["trees"], kwargs["rule_probas"] = trees, probas
+		jobs[key] = (kwargs, int(np.random.SeedSequence([entropy, int(key, 16)]).generate_state(1)[0]))
+
+	if n_jobs is None or n_jobs < 1:
+		n_jobs = os.cpu_count()
+	n_jobs = min(n_jobs, len(jobs))
+	if n_jobs <= 1:
+		cluster_cache = ClusteringCache()
+		computed = [_score(candidate, X, y, X_test, y_test, var_names, s, threshold, cluster_cache) for candidate, s in jobs.values()]
+	else:
+		with Pool(processes=n_jobs, initializer=_init_worker, initargs=(X, y, X_test, y_test, var_names, threshold)) as pool:
+			chunksize = max(1, len(jobs) // (4*n_jobs))
+			computed = pool.map(_score_in_worker, list(jobs.values()), chunksize=chunksize)
+
+	for key, (fitness, accuracy, stopped) in zip(jobs.keys(), computed):
+		scores[key] = (fitness, accuracy)
+		# the estimates of the candidates stopped early are not stored, the memo holds exact scores only
+		if memo is not None and not stopped:
+			memo.put(key, (fitness, accuracy))
+	results = np.array([scores[key] for key in keys], dtype=float).reshape(len(candidates), 2)
+	return results[:, 0], results[:, 1]
+
+
+def kfold_indices(n_samples, n_folds=5, seed=None):
+	"""
+		Splits the samples into folds, after a random permutation.
+
+		Returns:
+			list: for each fold, a tuple containing the indices of the training and of the test samples.
+	"""
+	folds = np.array_split(np.random.default_rng(seed).permutation(n_samples), n_folds)
+	return [(np.sort(np.concatenate(folds[:k] + folds[k+1:])), np.sort(folds[k])) for k in range(n_folds)]
+
+
+def parameter_grid(grid):
+	"""
+		Returns all the combinations of the values of a grid of arguments of ProbaFuzzySystem.
+
+		Args:
+			grid (dict): maps each argument to the list of its values, e.g. {"numb_rules": [2, 4], "threshold": [2, 3]}.
+
+		Returns:
+			list: the configurations, as dictionaries.
+	"""
+	names = sorted(grid)
+	return [dict(zip(names, values)) for values in itertools.product(*(grid[name] for name in names))]
+
+
+def sample_parameters(distributions, n_iter, seed=None):
+	"""
+		Samples random configurations of arguments of ProbaFuzzySystem.
+
+		Args:
+			distributions (dict): maps each argument either to a list of values, sampled uniformly, 
+				or to a function which takes a numpy Generator and returns a value.
+			n_iter (int): number of configurations.
+			seed: seed of the sampling.
+
+		Returns:
+			list: the configurations, as dictionaries.
+	"""
+	rng = np.random.default_rng(seed)
+	names = sorted(distributions)
+	configurations = []
+	for _ in range(n_iter):
+		configuration = {}
+		for name in names:
+			values = distributions[name]
+			configuration[name] = values(rng) if callable(values) else values[rng.integers(len(values))]
+		configurations.append(configuration)
+	return configurations
+
+
+def _init_cv_worker(shared, var_names):
+	# attaches the shared training data (kept alive in _worker_data) and creates the clustering cache of the worker;
+	# without shared memory (Python < 3.8) the data are copies
+	for name, value in shared.items():
+		if isinstance(value, np.ndarray):
+			_worker_data[name] = value
+			continue
+		from multiprocessing.shared_memory import SharedMemory
+		shm_name, shape, dtype = value
+		shm = SharedMemory(name=shm_name)
+		array = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+		array.flags.writeable = False
+		_worker_data[name] = array
+		_worker_data[name+"_shm"] = shm
+	_worker_data.update(var_names=var_names, cluster_cache=ClusteringCache())
+
+
+def _score_fold(X, y, var_names, candidate, train, test, seed, cluster_cache):
+	return score_candidate(candidate, X[train], y[train], X[test], y[test], var_names, seed=seed, cluster_cache=cluster_cache)
+
+
+def _score_fold_in_worker(args):
+	return _score_fold(_worker_data["X"], _worker_data["y"], _worker_data["var_names"], *args, cluster_cache=_worker_data["cluster_cache"])
+
+
+def cross_validate(configurations, X, y, var_names, n_folds=5, n_jobs=None, seed=None):
+	"""
+		Estimates the fitness and the accuracy of configurations of ProbaFuzzySystem with k-fold cross-validation. 
+		All the folds of all the configurations are run in a process pool; the data are shared with the 
+		workers through shared memory (copied to each worker before Python 3.8), and each worker keeps 
+		a ClusteringCache, so that the clustering of a fold is reused by the configurations with the 
+		same variables and number of rules. 
+		All the configurations use the same folds and the same seed in each fold.
+
+		Args:
+			configurations: list of candidates (see build_candidate), e.g. dictionaries of arguments.
+			X, y: data, shape (n_samples, n_variables) and (n_samples,).
+			var_names: names of the columns of X.
+			n_folds: number of folds. Default is 5.
+			n_jobs: number of worker processes; None or -1 uses all the cores, 1 runs in the current process.
+			seed: seed of the folds and of the candidates.
+
+		Returns:
+			list: one row (dictionary) per configuration, with the configuration ("params"), the scores 
+			of each fold, their mean and standard deviation, and the rank of the mean fitness.
+	"""
+	X = np.ascontiguousarray(X, dtype=float)
+	y = np.ascontiguousarray(y)
+	entropy = np.random.SeedSequence(seed).entropy
+	folds = kfold_indices(len(X), n_folds, seed=entropy)
+	fold_seeds = candidate_seeds(n_folds, entropy)
+	tasks = [(configuration, train, test, fold_seed) for configuration in configurations for (train, test), fold_seed in zip(folds, fold_seeds)]
+
+	if n_jobs is None or n_jobs < 1:
+		n_jobs = os.cpu_count()
+	n_jobs = min(n_jobs, len(tasks))
+	if n_jobs <= 1:
+		cluster_cache = ClusteringCache()
+		scores = [_score_fold(X, y, var_names, *task, cluster_cache=cluster_cache) for task in tasks]
+	else:
+		shared, memories = {}, []
+		try:
+			try:
+				from multiprocessing.shared_memory import SharedMemory
+			except ImportError:
+				shared.update(X=X, y=y)
+			else:
+				for name, array in (("X", X), ("y", y)):
+					shm = SharedMemory(create=True, size=max(array.nbytes, 1))
+					memories.append(shm)
+					np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf)[...] = array
+					shared[name] = (shm.name, array.shape, array.dtype)
+			with Pool(processes=n_jobs, initializer=_init_cv_worker, initargs=(shared, var_names)) as pool:
+				# the configurations sharing a fold are sent together, to reuse the clustering
+				order = sorted(range(len(tasks)), key=lambda t: (t % n_folds, t // n_folds))
+				chunksize = max(1, len(tasks) // (4*n_jobs))
+				ordered_scores = pool.map(_score_fold_in_worker, [tasks[t] for t in order], chunksize=chunksize)
+			scores = [None]*len(tasks)
+			for t, score in zip(order, ordered_scores):
+				scores[t] = score
+		finally:
+			for shm in memories:
+				shm.close()
+				shm.unlink()
+
+	scores = np.array(scores, dtype=float).reshape(len(configurations), n_folds, 2)
+	mean_fitness = scores[:, :, 0].mean(axis=1)
+	ranks = np.empty(len(configurations), dtype=int)
+	ranks[np.argsort(-mean_fitness, kind="stable")] = np.arange(1, len(configurations)+1)
+	results = []
+	for i, configuration in enumerate(configurations):
+		results.append({
+			"params": configuration,
+			"fold_fitness": scores[i, :, 0].tolist(),
+			"fold_accuracy": scores[i, :, 1].tolist(),
+			"mean_fitness": float(mean_fitness[i]),
+			"std_fitness": float(scores[i, :, 0].std()),
+			"mean_accuracy": float(scores[i, :, 1].mean()),
+			"std_accuracy": float(scores[i, :, 1].std()),
+			"rank_fitness": int(ranks[i]),
+		})
+	return results
+
+
+def grid_search(grid, X, y, var_names, n_folds=5, n_jobs=None, seed=None):
+	"""
+		Cross-validates all the configurations of a grid of arguments of ProbaFuzzySystem (see parameter_grid 
+		and cross_validate), e.g. grid_search({"numb_rules": [2, 3, 4], "threshold": [2, 3]}, X, y, var_names).
+
+		Returns:
+			list: one row (dictionary) per configuration, see cross_validate.
+	"""
+	return cross_validate(parameter_grid(grid), X, y, var_names, n_folds=n_folds, n_jobs=n_jobs, seed=seed)
+
+
+def random_search(distributions, n_iter, X, y, var_names, n_folds=5, n_jobs=None, seed=None):
+	"""
+		Cross-validates random configurations of arguments of ProbaFuzzySystem (see sample_parameters 
+		and cross_validate).
+
+		Returns:
+			list: one row (dictionary) per configuration, see cross_validate.
+	"""
+	configurations = sample_parameters(distributions, n_iter, seed=seed)
+	return cross_validate(configurations, X, y, var_names, n_folds=n_folds, n_jobs=n_jobs, seed=seed)
@@ -1,18 +1,20 @@
-from .rules import proba_generator
 import operator
-from .fuzzy_sets import FuzzySet, MF_object, Sigmoid_MF, InvSigmoid_MF, Gaussian_MF, InvGaussian_MF, DoubleGaussian_MF, Triangular_MF, Trapezoidal_MF
-from .rule_parsing import curparse, preparse, postparse
+from .fuzzy_sets import FuzzySet, MF_object, Sigmoid_MF, InvSigmoid_MF, Gaussian_MF, InvGaussian_MF, DoubleGaussian_MF, Triangular_MF, Trapezoidal_MF, Crisp_MF, Clustering_Gaussian_MF
+from .rule_parsing import Clause, Functional, curparse, preparse, postparse, count_clauses, reorder_operands, rulebase_hash, render_antecedent
 from .rules import RuleGen
+from .rule_index import RuleIndex
+from .least_squares import bounded_least_squares, simplex_least_squares, recursive_least_squares, project_rows_to_simplex
+from .clustering import FuzzyCMeans
+from . import metrics
+from .differentiable import ParameterLayout, log_firing_strengths_gradients, jacobian, Adam, minibatches
 from numpy import array, linspace
 from scipy.interpolate import interp1d
-from scipy.optimize import least_squares
+from scipy.spatial import cKDTree
+from scipy.spatial.distance import cdist
+from scipy.sparse import csr_matrix, issparse, vstack as sparse_vstack
 from copy import deepcopy
 from collections import defaultdict
-from sklearn.metrics import confusion_matrix
-from itertools import combinations
-from skfuzzy import cmeans
 from random import randint
-import random
 import numpy as np
 import re
 import string
@@ -27,6 +29,10 @@ linestyles= ["-", "--", ":", "-."]
 # for sanitization
 valid_characters = string.ascii_letters + string.digits + "()_ "
 
+# relative cost of evaluating the pre-baked membership functions
+membership_costs = {Triangular_MF: 1, Trapezoidal_MF: 1, Crisp_MF: 1, Gaussian_MF: 2, InvGaussian_MF: 2,
+	Sigmoid_MF: 2, InvSigmoid_MF: 2, DoubleGaussian_MF: 3}
+
 
 
 class UndefinedUniverseOfDiscourseError(Exception):
@@ -53,15 +59,121 @@ class LinguisticVariable(object):
 		self._universe_of_discourse = universe_of_discourse
 		self._FSlist = FS_list
 		self._concept = concept
+		self._lookup_table = None
 
 
 	def get_values(self, v):
+		if self._lookup_table is not None:
+			result = self._lookup(v)
+			if result is not None: return result
 		result = {}
 		for fs in self._FSlist:
 			result[fs._term] = fs.get_value(v)
 		return result
 
 
+	def get_term_values_array(self, term, v):
+		"""
+		Returns the memberships of an array of values to one of the fuzzy sets.
+
+		Args:
+			term: the linguistic term of the fuzzy set.
+			v: 1-D array of values of the variable.
+
+		Returns:
+			a 1-D ndarray containing the memberships.
+		"""
+		n = self.get_index(term)
+		v = np.asarray(v, dtype=float)
+		if self._lookup_table is None:
+			return np.asarray(self._FSlist[n].get_value_array(v), dtype=float)
+		low, step, table, interpolate, _ = self._lookup_table
+		position = (v-low)/step
+		inside = (position >= 0) & (position <= table.shape[1]-1)
+		result = np.empty(len(v))
+		if interpolate:
+			i = np.minimum(position[inside].astype(int), table.shape[1]-2)
+			weight = position[inside] - i
+			result[inside] = table[n, i]*(1-weight) + table[n, i+1]*weight
+		else:
+			result[inside] = table[n, np.rint(position[inside]).astype(int)]
+		# values outside of the universe of discourse are evaluated exactly
+		result[~inside] = self._FSlist[n].get_value_array(v[~inside])
+		return result
+
+
+	def build_lookup_table(self, resolution=4096, interpolate=True):
+		"""
+		Precomputes the memberships of all fuzzy sets on a regular grid over the universe of discourse, 
+		so that the memberships of values within the universe of discourse are obtained by table lookup. 
+		Values outside of the universe of discourse are evaluated exactly.
+
+		Args:
+			resolution: number of points of the grid (e.g., 4096 for 12-bit quantized inputs spanning the universe of discourse).
+			interpolate: True/False, toggles the linear interpolation between grid points. If False, the membership of the nearest grid point is used.
+
+		Returns:
+			a dictionary containing the memory occupied by the table (in bytes) and the maximum 
+			approximation error, measured at several points of each cell of the grid and around 
+			the breakpoints of the fuzzy sets.
+		"""
+		if resolution<2:
+			raise Exception("ERROR: the lookup table requires at least 2 points")
+		low, high = self.get_universe_of_discourse()
+		self._lookup_table = None
+		grid = linspace(low, high, resolution)
+		table = np.array([[float(fs.get_value(x)) for x in grid] for fs in self._FSlist])
+		self._lookup_table = (low, (high-low)/(resolution-1), table, interpolate, [fs._term for fs in self._FSlist])
+
+		# measure the error at several points inside each cell and around the breakpoints of the fuzzy sets
+		# (vertices, discontinuities), where the error of the interpolation peaks
+		fractions = (np.arange(self._error_samples)+0.5)/self._error_samples
+		points = (grid[:-1, None] + (grid[1]-grid[0])*fractions).ravel()
+		breakpoints = np.array([x for fs in self._FSlist for x in self._breakpoints(fs) if low <= x <= high], dtype=float)
+		points = np.concatenate((points, breakpoints, np.nextafter(breakpoints, -np.inf), np.nextafter(breakpoints, np.inf)))
+		points = points[(points >= low) & (points <= high)]
+		max_error = 0.
+		for fs in self._FSlist:
+			exact = np.array([float(fs.get_value(x)) for x in points])
+			max_error = max(max_error, float(np.max(np.abs(exact-self.get_term_values_array(fs._term, points)))))
+		return {"memory": table.nbytes, "max_error": max_error}
+
+	# number of points per cell of the lookup table where the approximation error is measured
+	_error_samples = 8
+
+	@staticmethod
+	def _breakpoints(fs):
+		# abscissae where the membership function is not smooth: the points of polygonal sets, 
+		# the vertices of the pre-baked piecewise linear functions and the ends of the supports
+		if fs._type != "function":
+			return list(fs._points[:, 0])
+		mf = fs._funpointer
+		result = [getattr(mf, name) for name in ("_a", "_b", "_c", "_d") if isinstance(getattr(mf, name, None), (int, float))]
+		if isinstance(mf, MF_object):
+			result += [x for x in mf.get_support() if np.isfinite(x)]
+		return result
+
+
+	def clear_lookup_table(self):
+		"""
+		Removes the lookup table, restoring the exact evaluation of the memberships.
+		"""
+		self._lookup_table = None
+
+
+	def _lookup(self, v):
+		low, step, table, interpolate, terms = self._lookup_table
+		position = (v-low)/step
+		if not 0 <= position <= table.shape[1]-1: return None
+		if interpolate:
+			i = min(int(position), table.shape[1]-2)
+			weight = position - i
+			values = table[:, i]*(1-weight) + table[:, i+1]*weight
+		else:
+			values = table[:, int(round(position))]
+		return dict(zip(terms, values.tolist()))
+
+
 	def get_index(self, term):
 		for n, fs in enumerate(self._FSlist):
 			if fs._term == term: return n
@@ -215,10 +327,11 @@ class FuzzySystem(object):
 			operators: a list of strings, specifying fuzzy operators to be used instead of defaults. Currently supported operators: 'AND_PRODUCT'.
 			show_banner: True/False, toggles display of banner.
 			sanitize_input: sanitize variables' names to eliminate non-accepted characters (under development).
+			index_rules: True/False, toggles an index over the supports of the fuzzy sets, used to skip the evaluation of the rules that cannot fire (default: False).
 			verbose: True/False, toggles verbose mode.
 	"""
 
-	def __init__(self,  operators=None, show_banner=False, sanitize_input=False, verbose=False):
+	def __init__(self,  operators=None, show_banner=False, sanitize_input=False, index_rules=False, verbose=False):
 
 		self._rules = []
 		self._lvs = {}
@@ -232,6 +345,9 @@ class FuzzySystem(object):
 		self._operators = operators
 		self._sanitize_input = sanitize_input
 		self._detected_type = None
+		self._index_rules = index_rules
+		self._rule_index = None
+		self._epsilon = None
 		if sanitize_input and verbose:
 			print (" * Warning: Simpful rules sanitization is enabled, please pay attention to possible collisions of symbols.")
 
@@ -322,6 +438,7 @@ class FuzzySystem(object):
 			if verbose:
 				print(" * Added rule IF", parsed_antecedent, "THEN", parsed_consequent)
 				print()
+		self._rule_index = None
 		if verbose: print(" * %d rules successfully added" % len(rules))
 	
 
@@ -339,6 +456,7 @@ class FuzzySystem(object):
 		if LV._concept is None: 
 			LV._concept = name
 		self._lvs[name]=deepcopy(LV)
+		self._rule_index = None
 		if verbose: print(" * Linguistic variable '%s' successfully added" % name)
 
 
@@ -371,6 +489,254 @@ class FuzzySystem(object):
 		if verbose: print(" * Output function for '%s' set to '%s'" % (name, function))
 		self._set_model_type("Sugeno")
 
+	def fit_consequents(self, X, y, output, var_names, order=0, mode="global", verbose=False):
+		"""
+		Learns the consequents of the Sugeno rules of an output variable from data, by least squares 
+		on the normalized firing strengths, computed at once for the whole dataset, and installs them 
+		as crisp output values (order 0) or linear output functions of the input variables (order 1).
+		Rules sharing the same output term share its parameters.
+
+		Args:
+			X: array of shape (n_samples, n_variables) containing the values of the input variables.
+			y: array of shape (n_samples,) containing the desired outputs.
+			output: name of the output variable.
+			var_names: names of the variables corresponding to the columns of X.
+			order: 0 for constant consequents, 1 for linear functions of the variables in var_names.
+			mode: "global" minimizes the error of the output of the system; "local" fits each 
+				consequent separately, weighting the samples by the normalized firing strengths 
+				(more interpretable consequents).
+			verbose: True/False, toggles verbose mode.
+
+		Returns:
+			a dictionary containing, for each output term, the constant (order 0) or the array of 
+			coefficients of the variables followed by the intercept (order 1).
+		"""
+		if order not in (0, 1): raise Exception("ERROR: order must be 0 or 1")
+		if mode not in ("global", "local"): raise Exception("ERROR: mode must be 'global' or 'local'")
+		if self._sanitize_input: output = self._sanitize(output)
+		X = np.asarray(X, dtype=float)
+		y = np.asarray(y, dtype=float)
+
+		rule_indices = [n for n, rule in enumerate(self._rules) if rule[1][0] == output]
+		if not rule_indices: raise Exception("ERROR: no rule has '%s' as consequent" % output)
+		terms = sorted(set(self._rules[n][1][1] for n in rule_indices))
+		# normalized firing strengths, summed over the rules sharing the same term
+		firing = self.get_firing_strengths_array(X, var_names=var_names)[:, rule_indices]
+		totals = firing.sum(axis=1)
+		active = totals > 0
+		if verbose and not np.all(active): print(" * %d samples do not activate any rule and are ignored" % np.sum(~active))
+		weights = np.zeros((np.sum(active), len(terms)))
+		for column, n in enumerate(rule_indices):
+			weights[:, terms.index(self._rules[n][1][1])] += firing[active, column] / totals[active]
+		X, y = X[active], y[active]
+		regressors = np.ones((len(X), 1)) if order == 0 else np.column_stack((X, np.ones(len(X))))
+
+		if mode == "global":
+			design = (weights[:, :, None] * regressors[:, None, :]).reshape(len(X), -1)
+			parameters = np.linalg.lstsq(design, y, rcond=None)[0].reshape(len(terms), -1)
+		else:
+			parameters = np.empty((len(terms), regressors.shape[1]))
+			for t in range(len(terms)):
+				root = np.sqrt(weights[:, t])[:, None]
+				parameters[t] = np.linalg.lstsq(root*regressors, root[:, 0]*y, rcond=None)[0]
+
+		names = [self._sanitize(name) if self._sanitize_input else name for name in var_names]
+		result = {}
+		for term, theta in zip(terms, parameters):
+			if order == 0:
+				self._outputfunctions.pop(term, None)
+				self.set_crisp_output_value(term, float(theta[0]), verbose=verbose)
+				result[term] = float(theta[0])
+			else:
+				self._crispvalues.pop(term, None)
+				function = " + ".join("%r*%s" % (float(c), name) for c, name in zip(theta[:-1], names)) + " + %r" % float(theta[-1])
+				self.set_output_function(term, function, verbose=verbose)
+				result[term] = theta
+		return result
+
+	def generate_rules_from_data(self, X, y, var_names, output, verbose=False):
+		"""
+		Extracts a rule base from data with the Wang-Mendel method, using the linguistic variables 
+		already added to the fuzzy system, and adds the rules to the system. Each sample generates the 
+		rule made of the terms with the highest membership of its values; among the samples sharing 
+		the same antecedent, the one with the highest degree (product of its memberships) determines 
+		the consequent. The whole dataset is processed at once with array operations.
+
+		Args:
+			X: array of shape (n_samples, n_variables) containing the values of the input variables.
+			y: array of shape (n_samples,) containing the values of the output variable.
+			var_names: names of the variables corresponding to the columns of X.
+			output: name of the output variable. If a linguistic variable of the output was added, the 
+				consequent of a rule is the output term with the highest membership; otherwise, it is a 
+				new crisp output value (named output_1, output_2, ...) equal to the average of the outputs 
+				of the samples generating the rule, weighted by their degrees (zero-order Sugeno).
+			verbose: True/False, toggles verbose mode.
+
+		Returns:
+			the list of the added rules as strings.
+		"""
+		if self._sanitize_input:
+			var_names = [self._sanitize(name) for name in var_names]
+			output = self._sanitize(output)
+		X = np.asarray(X, dtype=float)
+		y = np.asarray(y, dtype=float)
+		for name in var_names:
+			if name not in self._lvs: raise Exception("ERROR: linguistic variable '%s' not defined" % name)
+
+		def strongest_terms(lv, values):
+			memberships = np.column_stack([lv.get_term_values_array(fs._term, values) for fs in lv._FSlist])
+			indices = np.argmax(memberships, axis=1)
+			return indices, memberships[np.arange(len(values)), indices]
+
+		# mixed radix signature of the antecedent of each sample
+		radices = [len(self._lvs[name]._FSlist) for name in var_names]
+		signature = np.zeros(len(X), dtype=np.int64)
+		degree = np.ones(len(X))
+		for column, (name, radix) in enumerate(zip(var_names, radices)):
+			indices, memberships = strongest_terms(self._lvs[name], X[:, column])
+			signature *= radix
+			signature += indices
+			degree *= memberships
+		if int(np.prod(radices, dtype=object)) > np.iinfo(np.int64).max:
+			raise Exception("ERROR: too many combinations of terms to encode the antecedents")
+
+		mamdani = output in self._lvs
+		if mamdani:
+			out_indices, memberships = strongest_terms(self._lvs[output], y)
+			degree *= memberships
+		covered = degree > 0
+		signature, degree, y = signature[covered], degree[covered], y[covered]
+		if mamdani: out_indices = out_indices[covered]
+
+		# the first sample of each signature, sorted by decreasing degree, wins the conflicts
+		order = np.lexsort((-degree, signature))
+		first = np.ones(len(order), dtype=bool)
+		first[1:] = signature[order][1:] != signature[order][:-1]
+		winners = order[first]
+		if not mamdani:
+			groups = np.cumsum(first) - 1
+			weights = np.bincount(groups, weights=degree[order])
+			values = np.bincount(groups, weights=(degree*y)[order]) / weights
+
+		added = []
+		for r, sample in enumerate(winners):
+			code = int(signature[sample])
+			clauses = []
+			for name, radix in zip(reversed(var_names), reversed(radices)):
+				code, index = divmod(code, radix)
+				clauses.append(Clause(name, self._lvs[name]._FSlist[index]._term))
+			antecedent = clauses[0]
+			for clause in clauses[1:]:
+				antecedent = Functional("AND", clause, antecedent, operators=self._operators)
+			if mamdani:
+				term = self._lvs[output]._FSlist[out_indices[sample]]._term
+			else:
+				term, suffix = None, len(self._crispvalues)
+				while term is None or term in self._crispvalues:
+					suffix += 1
+					term = "%s_%d" % (output, suffix)
+				self.set_crisp_output_value(term, float(values[r]))
+			self._rules.append([antecedent, (output, term)])
+			added.append("IF %s THEN (%s IS %s)" % (render_antecedent(antecedent), output, term))
+		self._rule_index = None
+		if verbose: print(" * %d rules extracted from %d samples" % (len(added), len(X)))
+		return added
+
+	def _named_columns(self, X, var_names):
+		# dictionary of the columns of a dataset, named by the (sanitized) variables
+		if self._sanitize_input: var_names = [self._sanitize(name) for name in var_names]
+		return {name: np.asarray(X[:, i], dtype=float) for i, name in enumerate(var_names)}
+
+	def get_output_gradients(self, X, var_names, output, layout=None):
+		"""
+		Performs Sugeno inference on a whole dataset, returning the outputs together with their 
+		analytic derivatives with respect to the parameters of the Gaussian and triangular membership 
+		functions of the antecedents and to the crisp consequents of the rules.
+		Output functions are evaluated on the dataset and treated as constant.
+
+		Args:
+			X: array of shape (n_samples, n_variables) containing the values of the input variables.
+			var_names: names of the variables corresponding to the columns of X.
+			output: name of the output variable.
+			layout: the ParameterLayout defining the order of the parameters. Default is 
+				ParameterLayout(self, output), i.e., all of them.
+
+		Returns:
+			a tuple containing the outputs, shape (n_samples,), the jacobian, shape (n_samples, layout.size), 
+			and the layout. Samples that do not activate any rule have output and derivatives equal to 0.
+		"""
+		if self._sanitize_input: output = self._sanitize(output)
+		if layout is None: layout = ParameterLayout(self, output)
+		data = self._named_columns(np.asarray(X, dtype=float), var_names)
+		rules = [n for n, rule in enumerate(self._rules) if rule[1][0] == output]
+		if not rules: raise Exception("ERROR: no rule has '%s' as consequent" % output)
+
+		log_firing, gradients = log_firing_strengths_gradients(self, data, layout, rules=rules)
+		activations = self.normalize_log_activations(log_firing)
+		consequents = np.empty_like(activations)
+		for column, n in enumerate(rules):
+			term = self._rules[n][1][1]
+			if term in self._crispvalues:
+				consequents[:, column] = self._crispvalues[term]
+			elif term in self._outputfunctions and not isinstance(self._outputfunctions[term], MF_object):
+				consequents[:, column] = self._evaluate_output_function_array(term, data)
+			else:
+				raise Exception("ERROR: cannot find the output term '%s' of variable '%s'" % (term, output))
+		outputs = (activations*consequents).sum(axis=1)
+
+		# dy/dtheta = sum_r dw_r/dtheta * (z_r - y) / sum_r w_r = sum_r a_r * dlog w_r/dtheta * (z_r - y)
+		result = jacobian(gradients, activations*(consequents-outputs[:, None]), layout.size)
+		for column, n in enumerate(rules):
+			term = self._rules[n][1][1]
+			if term in layout.consequents:
+				result[:, layout.n_membership+layout.consequents.index(term)] += activations[:, column]
+		return outputs, result, layout
+
+	def tune(self, X, y, var_names, output, epochs=30, learning_rate=0.01, batch_size=None, hybrid=False, order=0, seed=None, verbose=False):
+		"""
+		Tunes the parameters of the Gaussian and triangular membership functions of the antecedents 
+		and the crisp consequents of the rules of a Sugeno output, minimizing the mean squared error 
+		by gradient descent (Adam) with analytic derivatives, as in ANFIS.
+
+		Args:
+			X: array of shape (n_samples, n_variables) containing the values of the input variables.
+			y: array of shape (n_samples,) containing the desired outputs.
+			var_names: names of the variables corresponding to the columns of X.
+			output: name of the output variable.
+			epochs: number of passes over the dataset. Default is 30.
+			learning_rate: step size of the optimizer, in the units of the parameters. Default is 0.01.
+			batch_size: number of samples of each step. Default is None (one step per epoch on the whole dataset).
+			hybrid: if True, the consequents are not tuned by gradient descent but fitted by least squares 
+				at the beginning of each epoch (hybrid learning), see fit_consequents. Default is False.
+			order: order of the consequents fitted in hybrid mode (0 or 1). Default is 0.
+			seed: seed of the random number generator shuffling the mini-batches.
+			verbose: True/False, toggles verbose mode.
+
+		Returns:
+			the list of the mean squared errors of the epochs (averaged over the steps).
+		"""
+		X = np.asarray(X, dtype=float)
+		y = np.asarray(y, dtype=float)
+		if self._sanitize_input: output = self._sanitize(output)
+		layout = ParameterLayout(self, None if hybrid else output)
+		if layout.size == 0: raise Exception("ERROR: the fuzzy system has no parameter to tune")
+		optimizer = Adam(learning_rate=learning_rate)
+		rng = np.random.default_rng(seed)
+		theta = layout.get_vector()
+		history = []
+		for epoch in range(epochs):
+			if hybrid: self.fit_consequents(X, y, output, var_names, order=order)
+			errors = []
+			for batch in minibatches(len(X), batch_size, rng):
+				outputs, result, _ = self.get_output_gradients(X[batch], var_names, output, layout=layout)
+				residuals = outputs - y[batch]
+				errors.append(np.mean(residuals**2))
+				theta = layout.set_vector(optimizer.step(theta, 2*(residuals @ result)/len(batch)))
+			history.append(float(np.mean(errors)))
+			if verbose: print(" * Epoch %d, mean squared error: %f" % (epoch+1, history[-1]))
+		if hybrid: self.fit_consequents(X, y, output, var_names, order=order)
+		return history
+
 	def _set_model_type(self, model_type):
 		if self._detected_type == "inconsistent": return
 		if self._detected_type is  None:
@@ -381,6 +747,149 @@ class FuzzySystem(object):
 			print("WARNING: model type is unclear (simpful detected %s, but I received a %s output)" % (self._detected_type, model_type))
 			self._detected_type = 'inconsistent'
 
+	def get_firing_strengths_array(self, data, var_names=None, out=None):
+		"""
+			This method returns the firing strengths of the rules for a whole dataset, 
+			evaluating each rule at once on all samples.
+
+			Args:
+				data: either a dictionary containing, for each variable, a 1-D array of values, 
+					or a 2-D array of shape (n_samples, n_variables) whose columns are named by var_names.
+				var_names: names of the variables corresponding to the columns of data (if data is an array).
+				out: optional ndarray of shape (n_samples, n_rules) where the result is stored.
+
+			Returns:
+				an ndarray of shape (n_samples, n_rules) containing rules' firing strengths
+		"""
+		if var_names is not None:
+			data = {name: data[:, i] for i, name in enumerate(var_names)}
+		if self._sanitize_input:
+			data = {self._sanitize(name): values for name, values in data.items()}
+		n_samples = len(next(iter(data.values())))
+		if out is None:
+			out = np.empty((n_samples, len(self._rules)))
+		for n, rule in enumerate(self._rules):
+			out[:, n] = rule[0].evaluate_array(self, data)
+		return out
+
+	def get_log_firing_strengths_array(self, data, var_names=None, out=None, rules=None):
+		"""
+			This method returns the logarithm of the firing strengths of the rules for a whole dataset.
+			Rules consisting of products (AND_p) of Gaussian clauses are evaluated at once, in log space, 
+			as a weighted squared distance computed with matrix products: their firing strengths 
+			do not underflow, even with many variables.
+
+			Args:
+				data: either a dictionary containing, for each variable, a 1-D array of values, 
+					or a 2-D array of shape (n_samples, n_variables) whose columns are named by var_names.
+				var_names: names of the variables corresponding to the columns of data (if data is an array).
+				out: optional ndarray of shape (n_samples, n_rules) where the result is stored.
+				rules: optional list of indices of the rules to evaluate (default: all the rules).
+
+			Returns:
+				an ndarray of shape (n_samples, n_rules) containing the logarithm of rules' firing strengths
+		"""
+		if var_names is not None:
+			data = {name: data[:, i] for i, name in enumerate(var_names)}
+		if self._sanitize_input:
+			data = {self._sanitize(name): values for name, values in data.items()}
+		names = list(data.keys())
+		position = {name: i for i, name in enumerate(names)}
+		n_samples = len(data[names[0]])
+		if rules is None:
+			rules = range(len(self._rules))
+		if out is None:
+			out = np.empty((n_samples, len(rules)))
+
+		fused = []
+		weights = []
+		for n, rule in enumerate(self._rules[r] for r in rules):
+			clauses = self._gaussian_product_clauses(rule[0])
+			if clauses is None or any(variable not in position for variable, _, _ in clauses):
+				with np.errstate(divide="ignore"):
+					out[:, n] = np.log(rule[0].evaluate_array(self, data))
+				continue
+			# sum over clauses of (x-mu)^2/(2 sigma^2) = x^2*w - 2*x*w*mu + w*mu^2, with w = 1/(2 sigma^2)
+			w = np.zeros(2*len(names)+1)
+			for variable, mu, sigma in clauses:
+				i = position[variable]
+				w[i] += 1/(2*sigma**2)
+				w[len(names)+i] += mu/(2*sigma**2)
+				w[-1] += mu**2/(2*sigma**2)
+			fused.append(n)
+			weights.append(w)
+
+		if fused:
+			weights = np.array(weights)
+			X = np.column_stack([np.asarray(data[name], dtype=float) for name in names])
+			distances = (X**2) @ weights[:, :len(names)].T - 2*(X @ weights[:, len(names):2*len(names)].T) + weights[:, -1]
+			out[:, fused] = -np.maximum(distances, 0)
+		return out
+
+	@staticmethod
+	def normalize_log_activations(log_firing_strengths, out=None):
+		"""
+			Normalizes the firing strengths of each sample so that they sum up to one, 
+			starting from their logarithm (log-sum-exp normalization). 
+			Samples that do not activate any rule get a row of zeros.
+
+			Args:
+				log_firing_strengths: ndarray of shape (n_samples, n_rules).
+				out: optional ndarray where the result is stored, can be log_firing_strengths itself.
+
+			Returns:
+				an ndarray containing the normalized activations, same shape.
+		"""
+		if out is None:
+			out = np.empty_like(log_firing_strengths)
+		maxima = log_firing_strengths.max(axis=1, keepdims=True)
+		maxima[~np.isfinite(maxima)] = 0
+		np.subtract(log_firing_strengths, maxima, out=out)
+		np.exp(out, out=out)
+		sums = out.sum(axis=1, keepdims=True)
+		return np.divide(out, sums, out=out, where=sums>0)
+
+	def _gaussian_product_clauses(self, node):
+		# returns the (variable, mu, sigma) of each clause if node is a product of exact Gaussian clauses, None otherwise
+		if isinstance(node, Clause):
+			lv = self._lvs.get(node._variable)
+			if lv is None or lv._lookup_table is not None or lv.get_index(node._term) == -1: return None
+			fs = lv._FSlist[lv.get_index(node._term)]
+			if fs._type != "function" or type(fs._funpointer) is not Gaussian_MF: return None
+			mf = fs._funpointer
+			if mf._epsilon is not None or mf._sigma <= 0: return None
+			return [(node._variable, mf._mu, mf._sigma)]
+		if node._A == "" or node._fun != "AND_p": return None
+		clauses_A = self._gaussian_product_clauses(node._A)
+		clauses_B = self._gaussian_product_clauses(node._B)
+		if clauses_A is None or clauses_B is None: return None
+		return clauses_A + clauses_B
+
+	def get_rulebase_hash(self):
+		"""
+			Returns a hash of the rule base which does not depend on the order of the rules, 
+			nor on the order of the operands of commutative operators (AND, AND_p, OR). 
+			Rule bases with the same hash are equivalent.
+
+			Returns:
+				a string containing the hexadecimal digest.
+		"""
+		return rulebase_hash(self._rules)
+
+	def get_active_rules(self):
+		"""
+			This method returns the indices of the rules that can have a non-zero firing strength, 
+			given the current state of input variables. If the rules' index is disabled, all rules are returned.
+
+			Returns:
+				a list containing the indices of the active rules
+		"""
+		if not self._index_rules:
+			return list(range(len(self._rules)))
+		if self._rule_index is None:
+			self._rule_index = RuleIndex(self)
+		return self._rule_index.get_active_rules(self._variables)
+
 	def get_firing_strengths(self):
 		"""
 			This method returns a list of the firing strengths of the the rules, 
@@ -389,7 +898,11 @@ class FuzzySystem(object):
 			Returns:
 				a list containing rules' firing strengths
 		"""
-		results = [float(antecedent[0].evaluate(self)) for antecedent in self._rules]
+		if not self._index_rules:
+			return [float(antecedent[0].evaluate(self)) for antecedent in self._rules]
+		results = [0.]*len(self._rules)
+		for n in self.get_active_rules():
+			results[n] = float(self._rules[n][0].evaluate(self))
 		return results
 
 
@@ -422,15 +935,7 @@ class FuzzySystem(object):
 					elif isinstance(self._outputfunctions[outterm], MF_object):
 						raise Exception("ERROR in consequent of rule %s.\nSugeno reasoning does not support output fuzzy sets." % ("IF " + str(ant) + " THEN " + str(res)))
 					else:
-						string_to_evaluate = self._outputfunctions[outterm]
-						for k,v in self._variables.items():
-							# old version
-							# string_to_evaluate = string_to_evaluate.replace(k,str(v))
-
-							# match a variable name preceeded or followed by non-alphanumeric and _ characters
-							# substitute it with its numerical value
-							string_to_evaluate = re.sub(r"(?P<front>\W|^)"+k+r"(?P<end>\W|$)", r"\g<front>"+str(v)+r"\g<end>", string_to_evaluate)
-						crispvalue = eval(string_to_evaluate)						
+						crispvalue = self._evaluate_output_function(outterm)
 
 					try:
 						value = ant.evaluate(self) 
@@ -459,7 +964,152 @@ class FuzzySystem(object):
 		return final_result
 
 
-	def mediate_Mamdani(self, outputs, antecedent, results, ignore_errors=False, verbose=False, subdivisions=1000):
+	def _evaluate_output_function(self, outterm):
+		string_to_evaluate = self._outputfunctions[outterm]
+		for k,v in self._variables.items():
+			# old version
+			# string_to_evaluate = string_to_evaluate.replace(k,str(v))
+
+			# match a variable name preceeded or followed by non-alphanumeric and _ characters
+			# substitute it with its numerical value
+			string_to_evaluate = re.sub(r"(?P<front>\W|^)"+k+r"(?P<end>\W|$)", r"\g<front>"+str(v)+r"\g<end>", string_to_evaluate)
+		return eval(string_to_evaluate)
+
+
+	def _evaluate_output_function_array(self, outterm, data):
+		# vectorized version of _evaluate_output_function: the variables are bound to arrays
+		namespace = dict(self._variables)
+		namespace.update(data)
+		n_samples = len(next(iter(data.values())))
+		return np.broadcast_to(eval(self._outputfunctions[outterm], globals(), namespace), (n_samples,))
+
+
+	def reorder_rule_clauses(self, data=None, verbose=False):
+		"""
+		Reorders the operands of AND, AND_p and OR operators in the rules, so that the clauses most 
+		likely to determine the result (i.e., zero for AND and AND_p, one for OR) and cheapest to evaluate 
+		are evaluated first, letting the evaluation short-circuit the remaining ones. The result of the 
+		inference is not affected.
+
+		Args:
+			data: dictionary containing, for each variable, a list of representative values used to observe 
+				the rates of zero and one memberships. If None (default value), these rates are estimated 
+				from the portion of the universe of discourse covered by the support of the fuzzy sets.
+			verbose: True/False, toggles verbose mode.
+		"""
+		for rule in self._rules:
+			rule[0] = reorder_operands(rule[0], lambda clause: self._estimate_clause(clause, data))[0]
+			if verbose: print(" * Reordered rule IF", rule[0], "THEN", rule[1])
+		self._rule_index = None
+
+	def _estimate_clause(self, clause, data):
+		# returns the probabilities of zero and one memberships, and the evaluation cost of a clause
+		lv = self._lvs.get(clause._variable)
+		if lv is None or lv.get_index(clause._term) == -1:
+			return (0., 0., 1.)
+		fs = lv._FSlist[lv.get_index(clause._term)]
+		if fs._type == "pointbased":
+			cost = len(fs._points)
+		elif isinstance(fs._funpointer, Clustering_Gaussian_MF):
+			cost = 2*(len(fs._funpointer.all_mus)+1)
+		else:
+			cost = membership_costs.get(type(fs._funpointer), 2)
+
+		if data is not None and clause._variable in data:
+			values = np.array([float(fs.get_value(v)) for v in data[clause._variable]])
+			return (np.mean(values==0), np.mean(values==1), cost)
+		try:
+			low, high = lv.get_universe_of_discourse()
+		except UndefinedUniverseOfDiscourseError:
+			return (0., 0., cost)
+		left, right = fs.get_support()
+		covered = max(0, min(high, right)-max(low, left))
+		return (1-covered/(high-low), 0., cost)
+
+
+	def build_lookup_tables(self, resolution=4096, interpolate=True, verbose=False):
+		"""
+		Precomputes the memberships of the fuzzy sets of all linguistic variables on a regular grid 
+		over their universe of discourse (see LinguisticVariable.build_lookup_table). Linguistic 
+		variables without a universe of discourse are skipped.
+
+		Args:
+			resolution: number of points of the grids (e.g., 4096 for 12-bit quantized inputs spanning the universe of discourse).
+			interpolate: True/False, toggles the linear interpolation between grid points.
+			verbose: True/False, toggles verbose mode.
+
+		Returns:
+			a dictionary, containing as keys the variables' names and as values the memory occupied 
+			by their table (in bytes) and the maximum approximation error.
+		"""
+		reports = {}
+		for name, lv in self._lvs.items():
+			try:
+				reports[name] = lv.build_lookup_table(resolution=resolution, interpolate=interpolate)
+			except UndefinedUniverseOfDiscourseError:
+				if verbose: print(" * Variable '%s' has no universe of discourse, lookup table skipped" % name)
+				continue
+			if verbose: print(" * Lookup table for '%s': %d bytes, maximum error %e" % (name, reports[name]["memory"], reports[name]["max_error"]))
+		return reports
+
+
+	def set_truncation(self, epsilon, verbose=False):
+		"""
+		Approximates to zero all memberships below a threshold, giving a finite support to 
+		non-zero everywhere membership functions (e.g., Gaussian_MF, Sigmoid_MF, InvSigmoid_MF, DoubleGaussian_MF)
+		and shrinking the supports of the piecewise linear ones (Triangular_MF, Trapezoidal_MF). Combined with index_rules, it allows to skip the rules whose memberships are negligible.
+		The error introduced can be assessed with get_truncation_error_bound().
+
+		Args:
+			epsilon: the truncation threshold; None restores the exact membership functions.
+			verbose: True/False, toggles verbose mode.
+		"""
+		for name, lv in self._lvs.items():
+			for fs in lv._FSlist:
+				if fs._type == "function" and isinstance(fs._funpointer, MF_object):
+					fs._funpointer.set_truncation(epsilon)
+					if verbose: print(" * Support of '%s' in variable '%s':" % (fs._term, name), fs.get_support())
+			if lv._lookup_table is not None:
+				# the memberships changed, the lookup table must be recomputed
+				lv.build_lookup_table(resolution=lv._lookup_table[2].shape[1], interpolate=lv._lookup_table[3])
+		self._epsilon = epsilon
+		self._rule_index = None
+
+
+	def get_truncation_error_bound(self, terms=None):
+		"""
+		Returns a bound on the error of Sugeno inference due to truncated memberships (see set_truncation), 
+		given the current state of input variables. Each membership differs by less than epsilon from the exact one, 
+		so that the firing strength of a rule with n clauses differs by less than n*epsilon.
+
+		Args:
+			terms: list of the names of the variables on which inference is performed. If empty, all variables appearing in the consequent of a fuzzy rule are considered.
+
+		Returns:
+			a dictionary, containing as keys the variables' names and as values the bounds on the absolute error of their inferred values.
+		"""
+		if terms is None:
+			terms = list(set([rule[1][0] for rule in self._rules]))
+		epsilon = 0 if self._epsilon is None else self._epsilon
+		bounds = {}
+		for output in terms:
+			rules = [rule for rule in self._rules if rule[1][0]==output]
+			strengths = array([float(rule[0].evaluate(self)) for rule in rules])
+			deltas = array([epsilon*count_clauses(rule[0]) for rule in rules])
+			values = array([self._crispvalues[rule[1][1]] if rule[1][1] in self._crispvalues 
+				else self._evaluate_output_function(rule[1][1]) for rule in rules])
+			den = sum(strengths) - sum(deltas)
+			if sum(deltas) == 0:
+				bounds[output] = 0.
+			elif den <= 0:
+				bounds[output] = np.inf
+			else:
+				inferred = np.dot(strengths, values) / sum(strengths)
+				bounds[output] = np.dot(deltas, np.abs(values-inferred)) / den
+		return bounds
+
+
+	def mediate_Mamdani(self, outputs, antecedent, results, ignore_errors=False, verbose=False, subdivisions=1000, active_rules=None):
 
 		final_result = {}
 
@@ -473,7 +1123,7 @@ class FuzzySystem(object):
 
 			x0, x1 = self._lvs[output].get_universe_of_discourse()
 
-			for (ant, res) in zip(antecedent, results):
+			for n, (ant, res) in enumerate(zip(antecedent, results)):
 
 				outname = res[0]
 				outterm = res[1]
@@ -483,6 +1133,11 @@ class FuzzySystem(object):
 
 				if outname==output:
 
+					if active_rules is not None and n not in active_rules:
+						# the rule cannot fire, skip its evaluation
+						cuts_list.setdefault(outterm, 0.)
+						continue
+
 					try:
 						value = ant.evaluate(self) 
 					except RuntimeError: 
@@ -490,7 +1145,8 @@ class FuzzySystem(object):
 						+ " --- PROBLEMATIC RULE:\n"
 						+ "IF " + str(ant) + " THEN " + str(res) + "\n")
 
-					cuts_list[outterm] = value
+					# rules sharing the same output term are aggregated by maximum
+					cuts_list[outterm] = max(cuts_list.get(outterm, 0.), value)
 
 			values = []
 			weightedvalues = []
@@ -542,13 +1198,16 @@ class FuzzySystem(object):
 			temp = [rule[1][0] for rule in self._rules] 
 			terms= list(set(temp))
 
-		array_rules = array(self._rules, dtype='object')
+		# rules that cannot fire do not contribute to Sugeno inference
+		active_rules = [self._rules[n] for n in self.get_active_rules()]
+		antecedents = [rule[0] for rule in active_rules]
+		consequents = [rule[1] for rule in active_rules]
 		if len(self._constants)==0:
-			result = self.mediate(terms, array_rules.T[0], array_rules.T[1], ignore_errors=ignore_errors)
+			result = self.mediate(terms, antecedents, consequents, ignore_errors=ignore_errors)
 		else:
 			#remove constant variables from list of variables to infer
 			ncost_terms = [t for t in terms if t not in self._constants]
-			result = self.mediate(ncost_terms, array_rules.T[0], array_rules.T[1], ignore_errors=ignore_errors)
+			result = self.mediate(ncost_terms, antecedents, consequents, ignore_errors=ignore_errors)
 			#add values of constant variables
 			cost_terms = [t for t in terms if t in self._constants]
 			for name in cost_terms:
@@ -579,12 +1238,13 @@ class FuzzySystem(object):
 			terms= list(set(temp))
 
 		array_rules = array(self._rules, dtype=object)
+		active_rules = set(self.get_active_rules()) if self._index_rules else None
 		if len(self._constants)==0:
-			result = self.mediate_Mamdani(terms, array_rules.T[0], array_rules.T[1], ignore_errors=ignore_errors, verbose=verbose , subdivisions=subdivisions)
+			result = self.mediate_Mamdani(terms, array_rules.T[0], array_rules.T[1], ignore_errors=ignore_errors, verbose=verbose , subdivisions=subdivisions, active_rules=active_rules)
 		else:
 			#remove constant variables from list of variables to infer
 			ncost_terms = [t for t in terms if t not in self._constants]
-			result = self.mediate_Mamdani(ncost_terms, array_rules.T[0], array_rules.T[1], ignore_errors=ignore_errors, verbose=verbose , subdivisions=subdivisions)
+			result = self.mediate_Mamdani(ncost_terms, array_rules.T[0], array_rules.T[1], ignore_errors=ignore_errors, verbose=verbose , subdivisions=subdivisions, active_rules=active_rules)
 			#add values of constant variables
 			cost_terms = [t for t in terms if t in self._constants]
 			for name in cost_terms:
@@ -674,7 +1334,8 @@ class ProbaFuzzySystem(FuzzySystem, RuleGen):
 	def __init__(self, _return_class = False, consequents=None, var_names=None, centers=None, widths=None,
 			  X=None,  X_test=None, y=None, y_test=None,probas=None, threshold=None, generateprobas=False,
 			  operators=['AND_p', 'OR', 'AND', 'NOT'], ops=['AND_p', 'OR', 'AND'],
-			  all_var_names=None, pred_test = False, numb_rules=None, unique_vars=None):
+			  all_var_names=None, pred_test = False, numb_rules=None, unique_vars=None, per_dimension_widths=False,
+			  cluster_cache=None, sparse=False):
 		
 		"""
 		Args:
@@ -684,7 +1345,11 @@ class ProbaFuzzySystem(FuzzySystem, RuleGen):
 			self.var_names = var_names: The variable names of the predictor variables.
 			self.widths = widths: Essentially these will be estimated automatically based on the data. 
 									Keep in mind that they are not tuned, therefore the widths in diferrent clusters will be the same.
-			self.A = []: Helper matrix, containing rule activations
+			self.per_dimension_widths = per_dimension_widths: If set to true the widths are estimated separately along each dimension.
+			self.cluster_cache = cluster_cache: Optional ClusteringCache, shared among candidates, to reuse estimated centers and widths.
+			self.sparse = sparse: If set to true the activation matrices are scipy.sparse CSR matrices, built in blocks of samples 
+									(useful with many rules and memberships with a finite support, see set_truncation).
+			self.A = []: Helper matrix, containing normalized rule activations of shape (n_samples, n_rules)
 			self.just_beta = None: Helper matrix, containing rule weigths.
 			self.probas_ = None: After the probabilities were either estimated or given they are saved here.
 			self.__estimate = False: Helper variable for knowing whether or not to estimate probabilities.
@@ -696,6 +1361,10 @@ class ProbaFuzzySystem(FuzzySystem, RuleGen):
 			self._X = X: The dataset containing train predictors.
 			self._X_test = X_test:  The dataset containing test predictors.
 			self.seed = None: For debugging purposes (to know exact clustering seed).
+			self.solver_info_ = None: Diagnostics of the last estimation of probabilities.
+			self.classes_ = None: The sorted classes, set when probabilities are estimated.
+			self.log_firing_ = None: Logarithm of the firing strengths on the training set, shape (n_samples, n_rules), see prepare_a.
+			self.log_firing_test_ = None: Logarithm of the firing strengths on the test set, from the last prediction on the test set.
 
 		"""		
 
@@ -723,6 +1392,9 @@ class ProbaFuzzySystem(FuzzySystem, RuleGen):
 		self._y_test = y_test
 		self.var_names = var_names
 		self.widths = widths
+		self.per_dimension_widths = per_dimension_widths
+		self.cluster_cache = cluster_cache
+		self.sparse = sparse
 		self.A = []
 		self.just_beta = None
 		self.probas_ = None
@@ -735,6 +1407,12 @@ class ProbaFuzzySystem(FuzzySystem, RuleGen):
 		self._X = X
 		self._X_test = X_test
 		self.seed = None
+		self.solver_info_ = None
+		self.classes_ = None
+		self.log_firing_ = None
+		self.log_firing_test_ = None
+		self._confusion = None
+		self._rls = None
 #		self._probas = self.estimate_probas() if probas is None else probas
 	
 	def placeholder(self):
@@ -808,6 +1486,7 @@ class ProbaFuzzySystem(FuzzySystem, RuleGen):
 			consequent = postparse(rule)
 			parsed_consequent = np.array(consequent)
 			self._rules.append([parsed_antecedent, parsed_consequent])
+		self._rule_index = None
 		
 		self.router()
 
@@ -818,66 +1497,101 @@ class ProbaFuzzySystem(FuzzySystem, RuleGen):
 		if verbose:
 			print(" * %d rules successfully added" % len(rules))
 	
-	def estimate_centers(self):
+	def add_proba_rule_trees(self, trees, probas=None, verbose=False):
+		
+		""" 
+		
+		Adds probabilistic rules given as parsed antecedents (Clause/Functional trees), e.g. generated 
+		by generate_proba_rule_trees, without parsing any string.
+
+		Args:
+			trees (list): the antecedents of the rules.
+			probas (ndarray, optional): probabilities of the rules, shape (n_rules, n_consequents). 
+			Defaults to None, meaning that the probabilities will be estimated.
+			verbose (bool, optional): Will print out the antecedent and consequent. Defaults to False.
+		
+		"""
+
+		for i, antecedent in enumerate(trees):
+			if probas is None:
+				consequent = np.array([len(self.n_consequents), True])
+			else:
+				consequent = np.asarray(probas[i], dtype=float)
+			self._rules.append([antecedent, consequent])
+			if verbose:
+				print(" * Added rule IF", antecedent, "THEN", consequent, '\n')
+		self._rule_index = None
+
+		self.router()
+
+		self._set_model_type('probabilistic')
+		if verbose:
+			print(" * %d rules successfully added" % len(trees))
+
+	def estimate_centers(self, seed=None):
 
 		"""
 		
 		Helper method for finding centers when using automatic modelling (designed for Genetic Programming in this case).
 
+		Args:
+			seed (int, optional): seed of the clustering. Defaults to a random integer between 1 and 10.
 
 		"""		
 
-		self.seed = randint(1, 10)
-		cluster_centers,_,_,_,_,p,fpc = cmeans(self._X.T,
-											 c=self.centers,
-											 m=1.75,
-											 error=0.005,
-											 maxiter=1000,
-											 seed=self.seed)
-		self.centers = cluster_centers
+		self.seed = randint(1, 10) if seed is None else seed
+		clustering = FuzzyCMeans(n_clusters=self.centers, m=1.75, tol=0.005, max_iter=1000, seed=self.seed).fit(self._X)
+		self.centers = clustering.cluster_centers_
 
-	def estimate_widths(self):
+	def estimate_widths(self, per_dimension=None):
 		
 		"""
 		
-		Calculate the widths of the membership functions as in equation (6).
+		Calculate the widths of the membership functions as in equation (6), i.e., 
+		the euclidean distance from each center to its nearest neighbouring center.
 		Replicate across each dimension (convenient for later tuning with 
 		gradient descent).
 
 		Output shape: (n_rules, n_features).
+
+		Args:
+			per_dimension (bool, optional): if True, the width of each center along each dimension is the 
+				distance to the nearest other center along that dimension. Defaults to self.per_dimension_widths.
 		
 		"""
 
-		#Enumerate all combinations of two centers + calculate euclidean dist
-		center_indices = [i for i in range(len(self.centers))]
-		combs = [comb for comb in combinations(center_indices, 2)]
-		comb_coords = np.array([
-			[self.centers[i], self.centers[j]]
-			for i, j in combs
-		])
-
-		dists = []
-		for comb, coord in zip(combs, comb_coords):
-			euc_dist = np.linalg.norm(coord[0] - coord[1])
-			dists.append([comb[0], comb[1], euc_dist])
-
-		#Enter everything in a matrix for minimum finding
-		dist_matrix = np.full(
-			shape=(len(self.centers), len(self.centers)),
-			fill_value=np.inf
-		)
-		for i, j, dist in dists:
-			dist_matrix[i, j] = dist
-
-		#Find the minimum distances for each center
-		min_ver = dist_matrix.min(axis=0)
-		min_hor = dist_matrix.min(axis=1)
-		widths = np.vstack((min_ver, min_hor)).min(axis=0)
-		widths = np.vstack(
-			[widths for i in range(self.centers.shape[1])]
-		)  # Replicate for each dimension in the data
+		if per_dimension is None:
+			per_dimension = self.per_dimension_widths
+		centers = np.asarray(self.centers, dtype=float)
+		n_centers, n_features = centers.shape
+
+		if n_centers < 2:
+			self.widths = np.full((n_centers, n_features), np.inf)
+			return
+
+		if per_dimension:
+			# nearest neighbour along each column: the closest of the two adjacent values in sorted order
+			order = np.argsort(centers, axis=0)
+			sorted_centers = np.take_along_axis(centers, order, axis=0)
+			gaps = np.diff(sorted_centers, axis=0)
+			inf_row = np.full((1, n_features), np.inf)
+			nearest = np.minimum(np.vstack((inf_row, gaps)), np.vstack((gaps, inf_row)))
+			widths = np.empty_like(centers)
+			np.put_along_axis(widths, order, nearest, axis=0)
+			self.widths = widths
+			return
+
+		if n_centers > 256:
+			# the KD-tree avoids the quadratic distance matrix for many centers
+			distances, _ = cKDTree(centers).query(centers, k=2)
+			nearest = distances[:, 1]
+		else:
+			distances = cdist(centers, centers)
+			np.fill_diagonal(distances, np.inf)
+			nearest = distances.min(axis=1)
 
-		self.widths = widths.T
+		# Replicate for each dimension in the data
+		self.widths = np.repeat(nearest[:, None], n_features, axis=1)
 
 	def add_linguistic_variables(self):
 
@@ -896,9 +1610,19 @@ class ProbaFuzzySystem(FuzzySystem, RuleGen):
 		# check if centers need to be estimated
 		if isinstance(self.centers, (np.ndarray)) is True:
 			pass
-		else:
+		elif self.cluster_cache is None:
 			self.estimate_centers()
 			self.estimate_widths()
+		else:
+			self.seed = randint(1, 10)
+			key = self.cluster_cache.make_key(var_names, self.centers, self._X, self.seed, bool(self.per_dimension_widths))
+			cached = self.cluster_cache.get(key)
+			if cached is None:
+				self.estimate_centers(seed=self.seed)
+				self.estimate_widths()
+				self.cluster_cache.put(key, (self.centers.copy(), self.widths.copy()))
+			else:
+				self.centers, self.widths = cached[0].copy(), cached[1].copy()
 
 		#Setup fuzzysets
 		for i, ling_var in enumerate(var_names):
@@ -938,12 +1662,8 @@ class ProbaFuzzySystem(FuzzySystem, RuleGen):
 		"""
 		
 		probs = self.probas_
-		rule_outputs = np.array(self.get_firing_strengths())
-		normalized_activation_rule = np.divide(rule_outputs, np.sum(rule_outputs))
-		
-		# identified exception handling; class zero division
-		if np.isnan(np.min(normalized_activation_rule)):
-			normalized_activation_rule = np.divide(rule_outputs, 0.01)
+		data = {name: np.array([value]) for name, value in self._variables.items()}
+		normalized_activation_rule = self.normalize_log_activations(self.get_log_firing_strengths_array(data))[0]
 		
 		return np.matmul(normalized_activation_rule, probs)
 
@@ -969,23 +1689,22 @@ class ProbaFuzzySystem(FuzzySystem, RuleGen):
 		else:
 			var_names = self.var_names
 
-		for instance in self._X:
-			for var_name, feat_val in zip(var_names, instance):
-				self.set_variable(var_name, feat_val)
-			rule_outputs = np.array(self.get_firing_strengths())
-			normalized_activation_rule = np.divide(rule_outputs, np.sum(rule_outputs))
-			
-			if np.isnan(np.min(normalized_activation_rule)):
-				normalized_activation_rule = np.divide(rule_outputs, 0.01)
+		if self.sparse:
+			self.log_firing_ = None
+			self.A = self._sparse_activation_matrix(self._X, var_names)
+			return self.A
 
-			# save rule outputs for estimating probas later
-			self.A.append(normalized_activation_rule)
-		
-		#fake copy (meaning not a deepcopy)
-		copy_of_A = self.A
-		
-		return copy_of_A
+		# the buffers of previous fits are reused when the shape does not change
+		shape = (len(self._X), len(self._rules))
+		if not isinstance(self.A, np.ndarray) or self.A.shape != shape:
+			self.A = np.empty(shape)
+		if self.log_firing_ is None or self.log_firing_.shape != shape:
+			self.log_firing_ = np.empty(shape)
 
+		self.get_log_firing_strengths_array(self._X, var_names=var_names, out=self.log_firing_)
+		self.normalize_log_activations(self.log_firing_, out=self.A)
+		
+		return self.A
 
 	def loss(self, b, x=None, y=None):
 
@@ -1002,50 +1721,202 @@ class ProbaFuzzySystem(FuzzySystem, RuleGen):
 			x = self.A
 		if y is None:
 			y = self.y
-		return (y-np.dot(x, b))**2
+		return (y-x @ b)**2
 
 	
 	def estimate_probas(self):
 
 		"""
-		The probabilities are estimated using ordinary least squares using scipy. At this moment only binary classification is supported.
-
-		NOTE:
-		
-		One could implement multiclass estimation of probabilities by remodelling the class of interest as 1 and setting the other classes to 0.
-		After this just use the same logic as for the binary case.
+		The probabilities are estimated using ordinary least squares. The solve only uses A^T A and A^T y, 
+		so that its cost does not depend on the number of samples; the solver diagnostics are saved in self.solver_info_.
 
-		Raises:
-			NotImplementedError: Only the binary case is supported right now. 
+		In the binary case, the probability of the second class is bounded to [0, 1]. 
+		In the multiclass case, the probabilities of all classes are estimated together, 
+		constraining the probabilities of each rule to be non-negative and to sum up to 1.
+		The classes, sorted, are saved in self.classes_.
 
 		Returns:
-			[ndarray]: ndarray containing probabilities.
+			[ndarray]: ndarray containing probabilities, shape (n_rules, n_classes).
 		"""		
 		
-		A = self.prepare_a()
-		
-		init_mat = np.full((len(self._rules),), random.uniform(0.01, 1), dtype=float)
+		return self._solve_probas(self.prepare_a())
+
+	def _solve_probas(self, A):
+		# estimation of the probabilities given the activation matrix, see estimate_probas
+		self.classes_ = np.unique(self.y)
+		gram = A.T @ A
+		if issparse(gram):
+			gram = gram.toarray()
+
+		if len(self.classes_) > 2:
+			# one-hot encoding of the classes, solved at once sharing the Gram matrix
+			Y = (np.asarray(self.y)[:, None] == self.classes_).astype(float)
+			probas, self.solver_info_ = simplex_least_squares(gram, A.T @ Y, float(np.sum(Y)))
+			return probas
+
+		# indicator of the last class, so that the probabilities do not depend on the labels' values
+		y = (np.asarray(self.y) == self.classes_[-1]).astype(float)
 		
 		try:
-			res = least_squares(self.loss, x0=init_mat, bounds=[0, 1])
-			probas = res.x
+			probas, self.solver_info_ = bounded_least_squares(gram, A.T @ y, y @ y, bounds=(0, 1))
 		
-		except ValueError:
-			probas = proba_generator(len(self.n_consequents))
+		except ValueError as e:
+			raise Exception("ERROR: the probabilities could not be estimated (%s)" % e)
 		
 		probas = probas.T
 		
-		if len(np.unique(self.y)) == 2:
+		if len(self.classes_) == 2:
 			binary_case = np.vstack((1-probas, probas))
 			binary_case = binary_case.T
 			probas = binary_case
-		
-		if len(np.unique(self.y)) >2:
-			raise NotImplementedError
-
 
 		return probas
 
+	def partial_fit(self, X_chunk, y_chunk, classes=None, forgetting=1., regularization=1e-3):
+
+		"""
+
+		Updates the probabilities of the rules with a chunk of labelled samples, by recursive least squares 
+		on the normalized activations (the same problem as estimate_probas, for all classes at once, without 
+		the bounds), so that the cost of each update does not depend on the number of samples seen before. 
+		The probabilities (self.probas_) are the estimates clipped to [0, 1] and normalized.
+		The linguistic variables must be defined before the first update.
+
+		Args:
+			X_chunk (ndarray): shape (n_samples, n_variables), columns ordered as the variables of the rules.
+			y_chunk (array): the classes of the samples.
+			classes (array, optional): all the classes; required at the first update if the first chunk 
+			does not contain all of them. Defaults to the classes of the first chunk.
+			forgetting (float, optional): weight of each sample relative to the following one, in (0, 1]; 
+			values smaller than 1 let the probabilities track changes in the data. Defaults to 1.
+			regularization (float, optional): weight of the prior (uniform probabilities), i.e., the inverse 
+			of the initial variance of the estimates. Defaults to 1e-3.
+
+		Returns:
+			[ndarray]: the probabilities, shape (n_rules, n_classes).
+
+		"""
+
+		if self._rls is None or len(self._rls[0]) != len(self._rules):
+			self.classes_ = np.unique(y_chunk if classes is None else classes)
+			n_rules, n_classes = len(self._rules), len(self.classes_)
+			self._rls = (np.eye(n_rules)/regularization, np.full((n_rules, n_classes), 1./n_classes), 0)
+		P, B, n_seen = self._rls
+
+		A = self.activation_matrix(np.asarray(X_chunk))
+		if issparse(A):
+			A = A.toarray()
+		y_chunk = np.asarray(y_chunk)
+		if not np.all(np.isin(y_chunk, self.classes_)):
+			raise Exception("ERROR: unknown classes " + str(np.setdiff1d(y_chunk, self.classes_)))
+		# samples which do not activate any rule carry no information
+		informative = A.sum(axis=1) > 0
+		A, y_chunk = A[informative], y_chunk[informative]
+		Y = (y_chunk[:, None] == self.classes_).astype(float)
+
+		P, B = recursive_least_squares(P, B, A, Y, forgetting=forgetting)
+		self._rls = (P, B, n_seen+len(A))
+
+		probas = np.clip(B, 0, 1)
+		sums = probas.sum(axis=1, keepdims=True)
+		self.probas_ = np.divide(probas, sums, out=np.full_like(probas, 1./probas.shape[1]), where=sums>0)
+		self.solver_info_ = {"method": "recursive least squares", "samples": self._rls[2]}
+		self.__estimate = False
+		return self.probas_
+
+	def get_proba_gradients(self, X, layout=None):
+
+		"""
+
+		Computes the probabilities of the classes for a whole dataset together with their analytic 
+		derivatives with respect to the parameters of the membership functions of the rules.
+		The derivatives with respect to the probabilities of the rules are the normalized activations: 
+		d probas[n, k] / d probas_[r, k] = activations[n, r].
+
+		Args:
+			X (ndarray): shape (n_samples, n_variables), columns ordered as the variables of the rules.
+			layout (ParameterLayout, optional): the order of the parameters. Defaults to ParameterLayout(self).
+
+		Returns:
+			[tuple]: the probabilities, shape (n_samples, n_classes), their derivatives, shape 
+			(n_samples, n_classes, layout.size), and the normalized activations, shape (n_samples, n_rules).
+
+		"""
+
+		self._set_probas()
+		if layout is None: layout = ParameterLayout(self)
+		var_names = self.unique_vars if self.unique_vars is not None else self.var_names
+		# in log space, as get_log_firing_strengths_array, so that the products of many memberships do not underflow
+		log_firing, gradients = log_firing_strengths_gradients(self, self._named_columns(np.asarray(X), var_names), layout)
+		activations = self.normalize_log_activations(log_firing)
+		probas = activations @ self.probas_
+		result = np.empty(probas.shape + (layout.size,))
+		# dP_k/dtheta = sum_r dw_r/dtheta * (p_rk - P_k) / sum_r w_r = sum_r a_r * dlog w_r/dtheta * (p_rk - P_k)
+		for k in range(probas.shape[1]):
+			result[:, k] = jacobian(gradients, activations*(self.probas_[:, k]-probas[:, k, None]), layout.size)
+		return probas, result, activations
+
+	def tune(self, epochs=30, learning_rate=0.01, batch_size=None, tune_probas=True, seed=None, verbose=False):
+
+		"""
+
+		Tunes the centers and widths of the Gaussian membership functions (and the probabilities of 
+		the rules) on the training set, minimizing the cross-entropy by gradient descent (Adam) with 
+		analytic derivatives, as in ANFIS. After each step the probabilities of each rule are projected 
+		onto the probability simplex.
+
+		Args:
+			epochs (int, optional): number of passes over the training set. Defaults to 30.
+			learning_rate (float, optional): step size of the optimizer. Defaults to 0.01.
+			batch_size (int, optional): number of samples of each step. Defaults to None (whole training set).
+			tune_probas (bool, optional): whether the probabilities are tuned as well. Defaults to True.
+			seed (int, optional): seed of the random number generator shuffling the mini-batches.
+			verbose (bool, optional): prints the loss of each epoch. Defaults to False.
+
+		Returns:
+			[list]: the cross-entropy of each epoch (averaged over the steps).
+
+		"""
+
+		self._set_probas()
+		classes = self.classes_ if self.classes_ is not None else np.arange(self.probas_.shape[1])
+		y = np.asarray(self.y)
+		labels = np.searchsorted(classes, y)
+		if np.any(classes[np.minimum(labels, len(classes)-1)] != y):
+			raise Exception("ERROR: some classes of the training set have no probability in the rules")
+		layout = ParameterLayout(self)
+		n_parameters = layout.size
+		theta = np.concatenate((layout.get_vector(), self.probas_.ravel() if tune_probas else []))
+		optimizer = Adam(learning_rate=learning_rate)
+		rng = np.random.default_rng(seed)
+		history = []
+		for epoch in range(epochs):
+			losses = []
+			for batch in minibatches(len(self._X), batch_size, rng):
+				probas, gradients, activations = self.get_proba_gradients(self._X[batch], layout=layout)
+				rows = np.arange(len(batch))
+				likelihoods = np.maximum(probas[rows, labels[batch]], 1e-12)
+				losses.append(-np.mean(np.log(likelihoods)))
+				# d(-mean log P_y)/dtheta
+				gradient = -np.einsum("n,np->p", 1./likelihoods, gradients[rows, labels[batch]]) / len(batch)
+				if tune_probas:
+					targets = np.zeros_like(probas)
+					targets[rows, labels[batch]] = 1./likelihoods
+					gradient = np.concatenate((gradient, -(activations.T @ targets).ravel() / len(batch)))
+				theta = optimizer.step(theta, gradient)
+				theta[:n_parameters] = layout.set_vector(theta[:n_parameters])
+				if tune_probas:
+					self.probas_ = project_rows_to_simplex(theta[n_parameters:].reshape(self.probas_.shape))
+					theta[n_parameters:] = self.probas_.ravel()
+			history.append(float(np.mean(losses)))
+			if verbose: print(" * Epoch %d, cross-entropy: %f" % (epoch+1, history[-1]))
+
+		# the cached activations and the state of the online updates refer to the old parameters
+		self.log_firing_ = None
+		self.log_firing_test_ = None
+		self._rls = None
+		return history
+
 	def get_probas(self):
 		
 		""" 
@@ -1101,41 +1972,85 @@ class ProbaFuzzySystem(FuzzySystem, RuleGen):
 			return np.argmax(result)
 		return result
 	
-	# alternative to sklearn but slower in performance. Would eliminate the need for sklearn dependency.
-	
-	# def perf_measure(y_actual, y_hat):
-	#     TP = 0
-	#     FP = 0
-	#     TN = 0
-	#     FN = 0
-
-	#     for i in range(len(y_hat)):
-	#         if y_actual[i]==y_hat[i]==1:
-	#            TP += 1
-	#         if y_hat[i]==1 and y_actual[i]!=y_hat[i]:
-	#            FP += 1
-	#         if y_actual[i]==y_hat[i]==0:
-	#            TN += 1
-	#         if y_hat[i]==0 and y_actual[i]!=y_hat[i]:
-	#            FN += 1
-
-	#     return(TP, FP, TN, FN)
+	def get_confusion_matrix(self):
+
+		"""
+
+		Returns the confusion matrix of the last predictions on the test set (see predict_pfs). 
+		It is computed once for each prediction, and shared by evaluate_fitness and evaluate_accuracy.
+
+		Returns:
+			<class 'numpy.ndarray'>: shape (n_classes, n_classes), rows are the true classes.
+
+		"""
+
+		if self._confusion is None or self._confusion[0] is not self.preds:
+			self._confusion = (self.preds, metrics.confusion_matrix(self._y_test, self.preds))
+		return self._confusion[1]
 
 	def evaluate_fitness(self):
 		
-		tn, fp, fn, tp = confusion_matrix(self._y_test, self.preds).ravel()
+		self.fitness_ = metrics.fitness(self.get_confusion_matrix())
 		
-		self.fitness_ = self.fitness(tn, fp, fn, tp)
-		
-		return self.fitness(tn, fp, fn, tp)
+		return self.fitness_
 	
 	def evaluate_accuracy(self):
 		
-		tn, fp, fn, tp = confusion_matrix(self._y_test, self.preds).ravel()
-		
-		self.accuracy_ = self.accuracy(tn, fp, fn, tp)
+		self.accuracy_ = metrics.accuracy(self.get_confusion_matrix())
 		
-		return self.accuracy(tn, fp, fn, tp)
+		return self.accuracy_
+
+	def evaluate_racing(self, threshold, chunk_size=256, confidence=0.95, seed=None):
+
+		"""
+
+		Scores the test set incrementally, in chunks of random samples, keeping running counts of the 
+		correct predictions of each class, and stops as soon as the fitness (product of the recalls of the 
+		classes, i.e., sensitivity times specificity in the binary case) cannot reach the threshold 
+		with the given confidence. The upper confidence bound of each recall is given by Hoeffding's 
+		inequality, with a union bound over the classes and the chunks.
+
+		Args:
+			threshold (float): the fitness to beat, e.g. the fitness of the worst individual kept by the search.
+			chunk_size (int, optional): number of test samples scored at each step. Defaults to 256.
+			confidence (float, optional): confidence of the decision to stop. Defaults to 0.95.
+			seed (int, optional): seed of the random order of the test samples.
+
+		Returns:
+			tuple: the fitness and the accuracy on the scored samples, the number of scored samples 
+			and whether the evaluation stopped early.
+
+		"""
+
+		self._set_probas()
+		var_names = self.unique_vars if self.unique_vars is not None else self.var_names
+		y_test = np.asarray(self._y_test)
+		# predictions are the classes if known, otherwise their indices
+		labels = np.union1d(y_test, self.classes_ if self.classes_ is not None else np.arange(self.probas_.shape[1]))
+		n_samples, n_classes = len(y_test), len(labels)
+		n_chunks = -(-n_samples // chunk_size)
+		log_term = np.log(n_classes*n_chunks/(1-confidence))
+
+		cm = np.zeros((n_classes, n_classes), dtype=int)
+		order = np.random.default_rng(seed).permutation(n_samples)
+		stopped_early = False
+		for start in range(0, n_samples, chunk_size):
+			chunk = order[start:start+chunk_size]
+			log_firing = self.get_log_firing_strengths_array(self._X_test[chunk], var_names=var_names)
+			preds = self._to_classes(self.normalize_log_activations(log_firing) @ self.probas_)
+			cm += metrics.confusion_matrix(y_test[chunk], preds, labels=labels)
+
+			if start+chunk_size < n_samples:
+				totals = cm.sum(axis=1)
+				with np.errstate(divide="ignore", invalid="ignore"):
+					upper = np.where(totals > 0, metrics.recalls(cm) + np.sqrt(log_term/(2*totals)), 1)
+				if np.prod(np.minimum(upper, 1)) < threshold:
+					stopped_early = True
+					break
+
+		self.fitness_ = metrics.fitness(cm)
+		self.accuracy_ = metrics.accuracy(cm)
+		return self.fitness_, self.accuracy_, int(cm.sum()), stopped_early
 
 	@staticmethod
 	def fitness(tn, fp, fn, tp):
@@ -1147,24 +2062,15 @@ class ProbaFuzzySystem(FuzzySystem, RuleGen):
 		
 		return (tn+tp)/(tn+fp+fn+tp)
 
-	def predict_pfs(self):
-		
+	def _set_probas(self):
+
 		"""
 		
-		Given a list of variables and a numpy matrix with (n_samples, n_variables) return predictions.
+		Helper method that makes the probabilities available before predicting, either 
+		taking them from the rules or estimating them.
 
-		Returns:
-			[ndarray]: a list of predictions.
-		
 		"""
 
-		if self.unique_vars is not None:
-			var_names = self.unique_vars
-		
-		else:
-			var_names = self.var_names
-
-		
 		if self.__estimate == False:
 			
 			if self.probas_ is None:
@@ -1174,27 +2080,176 @@ class ProbaFuzzySystem(FuzzySystem, RuleGen):
 			
 			self.probas_ = self.estimate_probas()
 			self.__estimate = False
+
+	def activation_matrix(self, X):
+
+		"""
+
+		Computes the normalized rule activations for a whole dataset at once.
+
+		Args:
+			X (ndarray): shape (n_samples, n_variables), columns ordered as the variables of the rules.
+
+		Returns:
+			[ndarray]: shape (n_samples, n_rules).
+
+		"""
+
+		var_names = self.unique_vars if self.unique_vars is not None else self.var_names
+		if self.sparse:
+			return self._sparse_activation_matrix(X, var_names)
+		return self.normalize_log_activations(self.get_log_firing_strengths_array(X, var_names=var_names))
+
+	# maximum number of dense entries of a block of samples, when building sparse activation matrices
+	_sparse_block_size = 1 << 20
+
+	def _sparse_activation_matrix(self, X, var_names):
+		# normalized activations of blocks of samples, each converted to CSR and then stacked
+		rows = max(1, self._sparse_block_size // max(1, len(self._rules)))
+		blocks = []
+		for start in range(0, len(X), rows):
+			log_firing = self.get_log_firing_strengths_array(X[start:start+rows], var_names=var_names)
+			blocks.append(csr_matrix(self.normalize_log_activations(log_firing, out=log_firing)))
+		return sparse_vstack(blocks, format="csr") if blocks else csr_matrix((0, len(self._rules)))
+
+	def predict_proba(self, X):
+
+		"""
+
+		Given a numpy matrix with (n_samples, n_variables) returns the probabilities of each class, 
+		computing the activation matrix once and multiplying it by the rule probabilities.
+
+		Args:
+			X (ndarray): shape (n_samples, n_variables), columns ordered as the variables of the rules.
+
+		Returns:
+			[ndarray]: shape (n_samples, n_classes).
+
+		"""
+
+		self._set_probas()
+		return self.activation_matrix(X) @ self.probas_
+
+	def predict(self, X):
+
+		"""
+
+		Given a numpy matrix with (n_samples, n_variables) returns the most probable class of each sample.
+
+		Args:
+			X (ndarray): shape (n_samples, n_variables), columns ordered as the variables of the rules.
+
+		Returns:
+			[ndarray]: shape (n_samples,). The classes if they are known (i.e., probabilities were estimated), 
+			otherwise the indices of the classes.
+
+		"""
+
+		return self._to_classes(self.predict_proba(X))
+
+	def _to_classes(self, probas):
+		indices = np.argmax(probas, axis=1)
+		if self.classes_ is not None and len(self.classes_) == self.probas_.shape[1]:
+			return self.classes_[indices]
+		return indices
+
+	def _predict_from_log_firing(self, log_firing):
+		self._set_probas()
+		probas = self.normalize_log_activations(log_firing) @ self.probas_
+		return self._to_classes(probas) if self._return_class else probas
+
+	def predict_pfs(self):
 		
-		if self.predict_test is False:
-			
-			preds_ = []
-			
-			for instance in self._X:
-				for var_name, feat_val in zip(var_names, instance):
-					self.set_variable(var_name, feat_val)
-				preds_.append(self.probabilistic_inference())
-			return preds_
+		"""
+		
+		Given a list of variables and a numpy matrix with (n_samples, n_variables) return predictions, 
+		either on the training set or on the test set (see pred_test). Depending on _return_class, 
+		either the classes or the probabilities of each class are returned.
+
+		Returns:
+			[ndarray]: the predictions.
 		
+		"""
+
+		X = self._X_test if self.predict_test else self._X
+		if self.sparse:
+			preds_ = self.predict(X) if self._return_class else self.predict_proba(X)
 		else:
-			
-			preds_ = []
-			
-			for instance in self._X_test:
-				for var_name, feat_val in zip(var_names, instance):
-					self.set_variable(var_name, feat_val)
-				preds_.append(self.probabilistic_inference())
+			var_names = self.unique_vars if self.unique_vars is not None else self.var_names
+			log_firing = self.get_log_firing_strengths_array(X, var_names=var_names)
+			preds_ = self._predict_from_log_firing(log_firing)
+			if self.predict_test:
+				self.log_firing_test_ = log_firing
+		if self.predict_test:
 			self.preds = preds_
-			return preds_
+		return preds_
+
+	def update_rules(self, changes, log_firing=None, log_firing_test=None):
+
+		"""
+
+		Replaces some rules and updates the model evaluating only the replaced rules: the corresponding 
+		columns of the (log) firing strengths are recomputed, the activations are normalized again and the 
+		probabilities re-estimated. If the firing strengths on the test set are available, the predictions 
+		on the test set (self.preds) are updated as well. Useful for evaluating mutations of a candidate 
+		during rule search, e.g.:
+
+			child = deepcopy(parent)
+			child.update_rules({2: new_rule})
+			child.evaluate_fitness()
+
+		The new rules must use the linguistic variables and terms already defined.
+
+		Args:
+			changes (dict): maps the indices of the rules to replace to the new rules, either as strings 
+			or as antecedents (Clause/Functional trees), which keep the consequent of the replaced rule.
+			log_firing (ndarray, optional): log firing strengths on the training set before the changes, e.g. 
+			taken from a parent candidate, which is not modified. Defaults to self.log_firing_ (updated in place).
+			log_firing_test (ndarray, optional): same for the test set. Defaults to self.log_firing_test_.
+
+		Returns:
+			[ndarray]: the updated activation matrix, shape (n_samples, n_rules).
+
+		"""
+
+		if self.sparse:
+			raise Exception("ERROR: update_rules requires dense activation matrices (sparse=False)")
+		if log_firing is None:
+			log_firing, A = self.log_firing_, self.A
+		else:
+			log_firing, A = np.array(log_firing, dtype=float), None
+		if log_firing is None:
+			raise Exception("ERROR: no firing strengths to update, please call prepare_a or estimate_probas first")
+		if log_firing_test is None:
+			log_firing_test = self.log_firing_test_
+		else:
+			log_firing_test = np.array(log_firing_test, dtype=float)
+
+		for index, rule in changes.items():
+			if isinstance(rule, str):
+				self._rules[index] = [curparse(preparse(rule), operators=self._operators), np.array(postparse(rule))]
+			else:
+				self._rules[index] = [rule, self._rules[index][1]]
+		self._rule_index = None
+
+		indices = sorted(changes)
+		var_names = self.unique_vars if self.unique_vars is not None else self.var_names
+		log_firing[:, indices] = self.get_log_firing_strengths_array(self._X, var_names=var_names, rules=indices)
+		self.log_firing_ = log_firing
+		self.A = self.normalize_log_activations(log_firing, out=A)
+
+		if self.classes_ is not None or self.__estimate:
+			self.probas_ = self._solve_probas(self.A)
+			self.__estimate = False
+		else:
+			self.probas_ = self.get_probas()
+
+		if log_firing_test is not None:
+			log_firing_test[:, indices] = self.get_log_firing_strengths_array(self._X_test, var_names=var_names, rules=indices)
+			self.log_firing_test_ = log_firing_test
+			self.preds = self._predict_from_log_firing(log_firing_test)
+
+		return self.A
 
 
 	def aggregate(self, list_variables, function):
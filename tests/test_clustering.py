@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+from simpful import FuzzyCMeans
+
+def make_blobs(n_per_cluster=200, seed=0):
+    rng = np.random.default_rng(seed)
+    means = np.array([[0, 0], [5, 5], [-5, 5]])
+    X = np.vstack([mean + 0.5*rng.standard_normal((n_per_cluster, 2)) for mean in means])
+    return X[rng.permutation(len(X))], means
+
+def match(centers, means):
+    return np.array([centers[np.argmin(np.linalg.norm(centers - mean, axis=1))] for mean in means])
+
+def test_fit():
+    X, means = make_blobs()
+    fcm = FuzzyCMeans(n_clusters=3, seed=1).fit(X)
+    assert fcm.converged_
+    assert match(fcm.cluster_centers_, means) == pytest.approx(means, abs=0.2)
+    U = fcm.memberships(X)
+    assert U.shape == (len(X), 3)
+    assert U.sum(axis=1) == pytest.approx(np.ones(len(X)))
+    assert fcm.memberships(fcm.cluster_centers_).max(axis=1) == pytest.approx(np.ones(3))
+
+def test_mini_batch_and_streaming():
+    X, means = make_blobs()
+    fcm = FuzzyCMeans(n_clusters=3, batch_size=64, seed=1, dtype=np.float32).fit(X)
+    assert fcm.cluster_centers_.dtype == np.float32
+    assert match(fcm.cluster_centers_, means) == pytest.approx(means, abs=0.3)
+    fcm = FuzzyCMeans(n_clusters=3, seed=1)
+    for chunk in np.array_split(X, 10):
+        fcm.partial_fit(chunk)
+    assert fcm.n_samples_seen_ == len(X)
+    assert match(fcm.cluster_centers_, means) == pytest.approx(means, abs=0.3)
+
+def test_mini_batch_stopping():
+    """Check that mini-batch fits stop on the smoothed objective, whatever the scale of the data"""
+    X, means = make_blobs()
+    fits = [FuzzyCMeans(n_clusters=3, batch_size=32, seed=2).fit(scale*X) for scale in [1, 1e-3]]
+    assert fits[0].converged_ and FuzzyCMeans._patience < fits[0].n_iter_ < fits[0].max_iter
+    assert fits[1].n_iter_ == fits[0].n_iter_
+    assert 1e3*fits[1].cluster_centers_ == pytest.approx(fits[0].cluster_centers_)
+    assert match(fits[0].cluster_centers_, means) == pytest.approx(means, abs=0.3)
+
+def test_clustering_cache():
+    from simpful import ClusteringCache
+    from test_proba_fuzzy_system import build_pfs
+    cache = ClusteringCache(max_size=2)
+    first = build_pfs(cluster_cache=cache)
+    second = build_pfs(cluster_cache=cache)
+    assert (cache.hits, cache.misses) == (1, 1)
+    assert cache.hit_rate == pytest.approx(0.5)
+    assert np.array_equal(first.centers, second.centers) and np.array_equal(first.widths, second.widths)
+    assert first.centers is not second.centers
+    for seed in range(3):
+        cache.put(("key", seed), seed)
+    assert len(cache) == 2 and cache.get(("key", 0)) is None and cache.get(("key", 2)) == 2
@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+import scipy.integrate as integrate
+from simpful import fuzzy_sets
+from simpful import FuzzySet, Triangular_MF, Trapezoidal_MF, Gaussian_MF, DoubleGaussian_MF
+
+def test_closed_form_moments():
+    """Check that closed-form areas and centroids agree with numerical integration"""
+    mfs = [Triangular_MF(1, 3, 6), Trapezoidal_MF(0, 2, 3, 7), Gaussian_MF(2, 1.5), 
+           DoubleGaussian_MF(1, 0.5, 3, 2), fuzzy_sets.Crisp_MF(1, 4)]
+    for mf in mfs:
+        for cut in [1, 0.6, 0.2]:
+            area = integrate.quad(lambda x: min(cut, mf(x)), -5, 10, points=[1, 2, 3, 4, 6], limit=200)[0]
+            moment = integrate.quad(lambda x: x*min(cut, mf(x)), -5, 10, points=[1, 2, 3, 4, 6], limit=200)[0]
+            assert mf.get_area(cut, -5, 10) == pytest.approx(area, abs=1e-6)
+            assert mf.get_centroid(cut, -5, 10) == pytest.approx(moment/area, abs=1e-6)
+
+def test_support():
+    """Check the support intervals of bounded and shouldered sets"""
+    assert Triangular_MF(1, 3, 6).get_support() == (1, 6)
+    assert Triangular_MF(0, 0, 4).get_support() == (-np.inf, 4)
+    assert Gaussian_MF(0, 1).get_area() == pytest.approx(np.sqrt(2*np.pi))
+    assert np.isinf(Triangular_MF(0, 0, 4).get_area())
+
+def test_pointbased_moments():
+    """Check that point-based fuzzy sets are integrated exactly"""
+    fs = FuzzySet(points=[[0.5, 0], [1.5, 1.], [2.5, 1], [3., 0]], term="medium_flow")
+    assert fs.get_support() == (0.5, 3.)
+    assert fs.get_area() == pytest.approx(1.75)
+    assert fs.integrate(0, 2, cut=0.5) == pytest.approx(integrate.quad(fs.get_value_cut, 0, 2, args=(0.5,))[0])
+
+def test_value_arrays():
+    """Check that vectorized memberships match the scalar ones"""
+    x = np.linspace(-3, 10, 131)
+    sets = [FuzzySet(function=mf, term="t") for mf in [Triangular_MF(1, 3, 6), Triangular_MF(0, 0, 4), 
+            Trapezoidal_MF(0, 2, 3, 7), Gaussian_MF(2, 1.5), DoubleGaussian_MF(1, 0.5, 3, 2), fuzzy_sets.Crisp_MF(1, 4),
+            fuzzy_sets.Sigmoid_MF(2, 1), fuzzy_sets.InvSigmoid_MF(2, 1), fuzzy_sets.InvGaussian_MF(2, 1)]]
+    sets.append(FuzzySet(points=[[0.5, 0], [1.5, 1.], [2.5, 1], [3., 0]], term="medium_flow"))
+    for fs in sets:
+        assert fs.get_value_array(x) == pytest.approx([float(fs.get_value(v)) for v in x])
+
+def test_truncated_polylines():
+    """Check the closed-form moments and supports of truncated piecewise linear sets"""
+    triangle = Triangular_MF(0, 1, 2)
+    triangle.set_truncation(0.5)
+    assert triangle.get_area() == pytest.approx(0.75)
+    assert triangle.get_support() == (0.5, 1.5)
+    for mf in [Triangular_MF(1, 3, 6), Triangular_MF(0, 0, 4), Trapezoidal_MF(0, 2, 3, 7), fuzzy_sets.Crisp_MF(1, 4)]:
+        mf.set_truncation(0.3)
+        for cut in [1, 0.6, 0.2]:
+            area = integrate.quad(lambda x: min(cut, mf(x)), -5, 10, points=[0.6, 1, 1.6, 2, 3, 4, 5.1, 5.8], limit=200)[0]
+            moment = integrate.quad(lambda x: x*min(cut, mf(x)), -5, 10, points=[0.6, 1, 1.6, 2, 3, 4, 5.1, 5.8], limit=200)[0]
+            assert mf.get_area(cut, -5, 10) == pytest.approx(area, abs=1e-6)
+            assert mf.get_centroid(cut, -5, 10) == pytest.approx(moment/area, abs=1e-6)
+        left, right = mf.get_support()
+        assert np.isinf(left) or mf(left - 1e-9) == 0
+        assert np.isinf(right) or mf(right + 1e-9) == 0
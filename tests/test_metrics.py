@@ -0,0 +1,26 @@
+import numpy as np
+import pytest
+from simpful import metrics
+
+def test_confusion_matrix():
+    y_true = np.array([0, 0, 1, 1, 1, 2])
+    y_pred = np.array([0, 1, 1, 1, 0, 2])
+    cm = metrics.confusion_matrix(y_true, y_pred)
+    assert np.array_equal(cm, [[1, 1, 0], [1, 2, 0], [0, 0, 1]])
+    assert metrics.accuracy(cm) == pytest.approx(4/6)
+    assert metrics.fitness(cm) == pytest.approx(1/2 * 2/3 * 1)
+    binary = metrics.confusion_matrix([0, 0, 1, 1], [0, 1, 1, 1])
+    (tn, fp), (fn, tp) = binary
+    assert metrics.fitness(binary) == pytest.approx(tp/(tp+fn) * tn/(tn+fp))
+
+def test_batch():
+    rng = np.random.default_rng(0)
+    y_true = rng.integers(0, 3, 50)
+    y_pred = rng.integers(0, 3, (4, 50))
+    batch = metrics.confusion_matrix(y_true, y_pred, labels=[0, 1, 2])
+    assert batch.shape == (4, 3, 3)
+    for cm, preds in zip(batch, y_pred):
+        assert np.array_equal(cm, metrics.confusion_matrix(y_true, preds, labels=[0, 1, 2]))
+    assert metrics.accuracy(batch) == pytest.approx((y_pred == y_true).mean(axis=1))
+    with pytest.raises(Exception):
+        metrics.confusion_matrix(y_true, y_pred, labels=[0, 1])
@@ -0,0 +1,237 @@
+import random
+import numpy as np
+import pytest
+from simpful import ProbaFuzzySystem
+
+def build_pfs(n_samples=300, n_rules=4, seed=0, **kwargs):
+    np.random.seed(seed)
+    random.seed(seed)
+    X = np.random.randn(n_samples, 4)
+    y = (X[:, 0] + X[:, 1] > 0).astype(int)
+    X_test = np.random.randn(n_samples//3, 4)
+    y_test = (X_test[:, 0] + X_test[:, 1] > 0).astype(int)
+    names = ["a", "b", "c", "d"]
+    pfs = ProbaFuzzySystem(var_names=names, all_var_names=names, consequents=["0", "1"], X=X, X_test=X_test, 
+                           y=y, y_test=y_test, pred_test=True, numb_rules=n_rules, _return_class=True, **kwargs)
+    pfs.add_proba_rules(pfs.generate_proba_rules())
+    pfs.X_reformatter()
+    pfs.add_linguistic_variables()
+    return pfs
+
+def test_prepare_a():
+    """Check the vectorized activation matrix against the per-sample evaluation"""
+    pfs = build_pfs()
+    expected = []
+    for instance in pfs._X:
+        for var_name, feat_val in zip(pfs.unique_vars, instance):
+            pfs.set_variable(var_name, feat_val)
+        firing = np.array(pfs.get_firing_strengths())
+        expected.append(firing/firing.sum() if firing.sum() > 0 else firing)
+    A = pfs.prepare_a()
+    assert A.shape == (len(pfs._X), len(pfs._rules))
+    assert A == pytest.approx(np.array(expected))
+    assert pfs.prepare_a() is A
+
+def test_estimate_probas():
+    """Check the Gram-based bounded least squares against a direct solve on the activation matrix"""
+    from scipy.optimize import lsq_linear
+    pfs = build_pfs()
+    probas = pfs.estimate_probas()
+    expected = lsq_linear(pfs.A, pfs.y.astype(float), bounds=(0, 1)).x
+    assert probas.shape == (len(pfs._rules), 2)
+    assert probas[:, 1] == pytest.approx(expected, abs=1e-6)
+    assert probas.sum(axis=1) == pytest.approx(1)
+    assert pfs.solver_info_["cost"] == pytest.approx(np.sum((pfs.A @ expected - pfs.y)**2))
+
+def test_estimate_probas_labels(monkeypatch):
+    """Check that binary probabilities do not depend on the values of the labels and that failures are raised"""
+    import simpful.simpful
+    pfs = build_pfs()
+    expected = pfs.estimate_probas()
+    pfs.y = pfs.y + 1
+    assert pfs.estimate_probas() == pytest.approx(expected)
+    def failing_solver(*args, **kwargs):
+        raise ValueError("infeasible")
+    monkeypatch.setattr(simpful.simpful, "bounded_least_squares", failing_solver)
+    with pytest.raises(Exception, match="could not be estimated"):
+        pfs.estimate_probas()
+
+def test_estimate_probas_multiclass():
+    """Check that multiclass probabilities lie on the simplex and match a constrained solve"""
+    from scipy.optimize import minimize
+    pfs = build_pfs()
+    pfs.y = np.digitize(pfs._X[:, 0], [-0.5, 0.5])
+    probas = pfs.estimate_probas()
+    assert probas.shape == (len(pfs._rules), 3)
+    assert probas.sum(axis=1) == pytest.approx(1)
+    assert np.all(probas >= 0)
+    Y = np.eye(3)[pfs.y]
+    loss = lambda b: np.sum((pfs.A @ b.reshape(-1, 3) - Y)**2)
+    constraints = [{"type": "eq", "fun": lambda b: b.reshape(-1, 3).sum(axis=1) - 1}]
+    reference = minimize(loss, np.full(probas.size, 1/3), bounds=[(0, 1)]*probas.size, constraints=constraints, 
+                         method="SLSQP", options={"ftol": 1e-12, "maxiter": 1000})
+    assert pfs.solver_info_["cost"] == pytest.approx(reference.fun, rel=1e-5)
+
+def test_predict():
+    """Check batch predictions against the per-sample probabilistic inference"""
+    pfs = build_pfs()
+    preds = pfs.predict_pfs()
+    expected = []
+    for instance in pfs._X_test:
+        for var_name, feat_val in zip(pfs.unique_vars, instance):
+            pfs.set_variable(var_name, feat_val)
+        expected.append(pfs.probabilistic_inference(return_class=False))
+    assert pfs.predict_proba(pfs._X_test) == pytest.approx(np.array(expected))
+    assert np.array_equal(preds, np.argmax(expected, axis=1))
+    assert pfs.evaluate_accuracy() == pytest.approx(np.mean(preds == pfs._y_test))
+
+def test_log_activations():
+    """Check that products of many Gaussian clauses are evaluated in log space without underflow"""
+    from simpful import FuzzySystem, LinguisticVariable, FuzzySet, Gaussian_MF
+    n_vars = 120
+    fs = FuzzySystem(show_banner=False)
+    for i in range(n_vars):
+        fs.add_linguistic_variable("x%d" % i, LinguisticVariable([FuzzySet(function=Gaussian_MF(0, 0.1), term="low"),
+                                                                  FuzzySet(function=Gaussian_MF(1, 0.1), term="high")]))
+    for term in ["low", "high"]:
+        fs.add_rules(["IF " + " AND_p ".join("(x%d IS %s)" % (i, term) for i in range(n_vars)) + " THEN (y IS %s)" % term])
+    X = np.full((2, n_vars), 0.5)
+    X[1, 0] = 0.51
+    var_names = ["x%d" % i for i in range(n_vars)]
+    assert np.all(fs.get_firing_strengths_array(X, var_names=var_names) == 0)
+    log_firing = fs.get_log_firing_strengths_array(X, var_names=var_names)
+    assert log_firing[0] == pytest.approx([-n_vars*12.5, -n_vars*12.5])
+    activations = ProbaFuzzySystem.normalize_log_activations(log_firing)
+    assert activations == pytest.approx(np.array([[0.5, 0.5], [1/(1+np.e), np.e/(1+np.e)]]))
+    assert np.all(ProbaFuzzySystem.normalize_log_activations(np.full((1, 2), -np.inf)) == 0)
+
+def test_estimate_widths():
+    """Check nearest-center widths against a brute force computation, for few and many centers"""
+    pfs = build_pfs()
+    for n_centers in [5, 300]:
+        centers = np.random.randn(n_centers, 3)
+        distances = np.linalg.norm(centers[:, None, :] - centers[None, :, :], axis=2)
+        np.fill_diagonal(distances, np.inf)
+        pfs.centers = centers
+        pfs.estimate_widths()
+        assert pfs.widths.shape == (n_centers, 3)
+        assert pfs.widths == pytest.approx(np.repeat(distances.min(axis=1)[:, None], 3, axis=1))
+        pfs.estimate_widths(per_dimension=True)
+        gaps = np.abs(centers[:, None, :] - centers[None, :, :])
+        gaps[np.arange(n_centers), np.arange(n_centers)] = np.inf
+        assert pfs.widths == pytest.approx(gaps.min(axis=1))
+    pfs.centers = np.zeros((1, 3))
+    pfs.estimate_widths()
+    assert np.all(np.isinf(pfs.widths))
+
+def test_update_rules():
+    """Check that replacing a rule gives the same model as evaluating the new rule base from scratch"""
+    from copy import deepcopy
+    from simpful import Clause, Functional
+    parent = build_pfs()
+    parent.predict_pfs()
+    A, log_firing = parent.A.copy(), parent.log_firing_.copy()
+    child = deepcopy(parent)
+    var = parent.unique_vars[0]
+    new_rule = Functional("AND_p", Clause(var, "cluster1"), Functional("NOT", "", Clause(var, "cluster3")))
+    child.update_rules({1: new_rule}, log_firing=parent.log_firing_, log_firing_test=parent.log_firing_test_)
+    assert np.array_equal(parent.A, A) and np.array_equal(parent.log_firing_, log_firing)
+    reference = deepcopy(child)
+    reference.probas_ = reference.estimate_probas()
+    reference.predict_pfs()
+    assert child.A == pytest.approx(reference.A)
+    assert child.probas_ == pytest.approx(reference.probas_)
+    assert np.array_equal(child.preds, reference.preds)
+    assert child.evaluate_accuracy() == pytest.approx(np.mean(reference.preds == reference._y_test))
+
+def test_evaluate_racing():
+    """Check that racing scores the whole test set when the threshold is reachable, and stops early otherwise"""
+    pfs = build_pfs(n_samples=3000)
+    pfs.predict_pfs()
+    fitness, accuracy = pfs.evaluate_fitness(), pfs.evaluate_accuracy()
+    result = pfs.evaluate_racing(threshold=0., chunk_size=100, seed=0)
+    assert result == pytest.approx((fitness, accuracy, len(pfs._X_test), False))
+    fitness_, accuracy_, n_scored, stopped_early = pfs.evaluate_racing(threshold=1., chunk_size=100, seed=0)
+    assert stopped_early and n_scored < len(pfs._X_test)
+    assert 0 <= fitness_ <= 1 and 0 <= accuracy_ <= 1
+
+def test_partial_fit():
+    """Check that streaming chunks gives the least squares estimates of the whole history"""
+    pfs = build_pfs(n_samples=600)
+    A = pfs.prepare_a().copy()
+    Y = (pfs.y[:, None] == np.array([0, 1])).astype(float)
+    for chunk in np.array_split(np.arange(len(pfs._X)), 7):
+        probas = pfs.partial_fit(pfs._X[chunk], pfs.y[chunk], regularization=1e-9)
+    expected = np.linalg.lstsq(A, Y, rcond=None)[0]
+    assert pfs._rls[1] == pytest.approx(expected, abs=1e-5)
+    assert probas.sum(axis=1) == pytest.approx(np.ones(len(probas)))
+    assert np.array_equal(pfs.predict(pfs._X_test), pfs.classes_[np.argmax(pfs.activation_matrix(pfs._X_test) @ probas, axis=1)])
+    # with forgetting, the estimates are those of exponentially weighted least squares
+    pfs._rls = None
+    for chunk in np.array_split(np.arange(len(pfs._X)), 5):
+        pfs.partial_fit(pfs._X[chunk], pfs.y[chunk], forgetting=0.99, regularization=1e-9)
+    weights = np.sqrt(0.99**np.arange(len(A)-1, -1, -1))[:, None]
+    expected = np.linalg.lstsq(weights*A, weights*Y, rcond=None)[0]
+    assert pfs._rls[1] == pytest.approx(expected, abs=1e-4)
+
+def test_sparse():
+    """Check that sparse activation matrices give the same model as dense ones"""
+    from scipy.sparse import issparse
+    dense, sparse = build_pfs(n_rules=6), build_pfs(n_rules=6, sparse=True)
+    for pfs in (dense, sparse):
+        pfs.set_truncation(0.05)
+    sparse._sparse_block_size = 50
+    A = sparse.prepare_a()
+    assert issparse(A) and A.nnz < np.prod(A.shape)
+    assert A.toarray() == pytest.approx(dense.prepare_a())
+    assert sparse.estimate_probas() == pytest.approx(dense.estimate_probas())
+    assert np.array_equal(sparse.predict_pfs(), dense.predict_pfs())
+    assert sparse.predict_proba(sparse._X_test) == pytest.approx(dense.predict_proba(dense._X_test))
+
+def test_tune():
+    """Check the derivatives of the probabilities and that tuning reduces the cross-entropy"""
+    from simpful import ParameterLayout
+    pfs = build_pfs()
+    probas, gradients, activations = pfs.get_proba_gradients(pfs._X[:40])
+    assert probas == pytest.approx(pfs.predict_proba(pfs._X[:40]))
+    layout = ParameterLayout(pfs)
+    theta = layout.get_vector()
+    step = np.zeros(layout.size)
+    step[3] = 1e-6
+    layout.set_vector(theta + step)
+    upper = pfs.get_proba_gradients(pfs._X[:40], layout=layout)[0]
+    layout.set_vector(theta - step)
+    lower = pfs.get_proba_gradients(pfs._X[:40], layout=layout)[0]
+    layout.set_vector(theta)
+    assert (upper - lower) / 2e-6 == pytest.approx(gradients[:, :, 3], abs=1e-6)
+
+    accuracy = np.mean(pfs.predict(pfs._X) == pfs.y)
+    history = pfs.tune(epochs=30, learning_rate=0.05)
+    assert history[-1] < history[0]
+    assert pfs.probas_.sum(axis=1) == pytest.approx(1)
+    assert np.mean(pfs.predict(pfs._X) == pfs.y) >= accuracy
+
+def test_tune_wide_data():
+    """Check that the derivatives do not underflow with products of many memberships"""
+    rng = np.random.default_rng(0)
+    X = rng.standard_normal((300, 150))
+    y = (X[:, 0] + X[:, 1] > 0).astype(int)
+    names = ["v%d" % i for i in range(150)]
+    shared = " AND_p ".join("(%s IS cluster0)" % name for name in names[2:])
+    rules = ["IF (v0 IS cluster%d) AND_p ((v1 IS cluster%d) AND_p (%s)) THEN P(OUTCOME IS 0)=None, P(OUTCOME IS 1)=None" % (k, k, shared)
+             for k in range(3)]
+    pfs = ProbaFuzzySystem(var_names=names, all_var_names=names, consequents=["0", "1"], X=X, y=y, numb_rules=3, _return_class=True)
+    pfs.add_proba_rules(rules)
+    pfs.X_reformatter()
+    pfs.add_linguistic_variables()
+    for name in names:
+        for k, fs in enumerate(pfs._lvs[name]._FSlist):
+            fs._funpointer._mu, fs._funpointer._sigma = (k-1. if name in ("v0", "v1") else 0.), 0.2
+    # the firing strengths are far below the smallest float
+    assert pfs.get_log_firing_strengths_array(X, var_names=names).max() < -745
+    probas, gradients, _ = pfs.get_proba_gradients(X)
+    assert probas == pytest.approx(pfs.predict_proba(X))
+    assert probas.sum(axis=1) == pytest.approx(1)
+    assert np.count_nonzero(gradients) > 0 and np.all(np.isfinite(gradients))
+    history = pfs.tune(epochs=3, learning_rate=0.05)
+    assert history[-1] < history[0]
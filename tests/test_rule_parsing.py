@@ -18,4 +18,13 @@ def test_preparse():
     unparsed = "IF (OXI IS low_flow) THEN (POWER IS LOW_POWER)"
     expected_preparsed = '(OXI IS low_flow)'
     output_preparsed = rule_parsing.preparse(unparsed)
-    assert output_preparsed == expected_preparsed
\ No newline at end of file
+    assert output_preparsed == expected_preparsed
+def test_postparse_round_trip():
+    """Check that rendered probabilities, including small ones in scientific notation, are parsed back"""
+    import numpy as np
+    from simpful import RuleGen, Clause
+    probas = np.array([[1e-05, 1-1e-05], [0.25, 0.75]])
+    rules = RuleGen(["0", "1"], 2).render_proba_rules([Clause("a", "cluster0"), Clause("a", "cluster1")], probas)
+    assert "1e-05" in rules[0]
+    for rule, expected in zip(rules, probas):
+        assert rule_parsing.postparse(rule) == pytest.approx(expected, rel=1e-12)
@@ -0,0 +1,151 @@
+import numpy as np
+import pytest
+from simpful.search import evaluate_population, FitnessMemo
+from simpful import ProbaFuzzySystem, rulebase_hash
+
+def make_data(n_samples=200, seed=0):
+    rng = np.random.default_rng(seed)
+    X = rng.standard_normal((n_samples, 4))
+    y = (X[:, 0] + X[:, 1] > 0).astype(int)
+    return X[:150], y[:150], X[150:], y[150:], ["a", "b", "c", "d"]
+
+RULES = ["IF (a IS cluster0) AND_p (b IS cluster0) THEN P(OUTCOME IS 0)=None, P(OUTCOME IS 1)=None",
+         "IF (a IS cluster1) AND_p ((b IS cluster1) OR (c IS cluster1)) THEN P(OUTCOME IS 0)=None, P(OUTCOME IS 1)=None"]
+# same rule base, with the rules and the operands of commutative operators in a different order
+SHUFFLED = ["IF (a IS cluster1) AND_p ((c IS cluster1) OR (b IS cluster1)) THEN P(OUTCOME IS 0)=None, P(OUTCOME IS 1)=None",
+            "IF (b IS cluster0) AND_p (a IS cluster0) THEN P(OUTCOME IS 0)=None, P(OUTCOME IS 1)=None"]
+
+def test_rulebase_hash():
+    systems = []
+    for rules in [RULES, SHUFFLED, RULES[:1]]:
+        pfs = ProbaFuzzySystem(consequents=["0", "1"])
+        pfs.add_proba_rules(rules)
+        systems.append(pfs)
+    assert systems[0].get_rulebase_hash() == systems[1].get_rulebase_hash()
+    assert systems[0].get_rulebase_hash() != systems[2].get_rulebase_hash()
+    assert rulebase_hash(systems[2]._rules) == systems[2].get_rulebase_hash()
+
+def test_evaluate_population():
+    X, y, X_test, y_test, names = make_data()
+    candidates = [{"numb_rules": 3}, {"numb_rules": 4}, RULES, {"numb_rules": 2}]
+    fitness, accuracy = evaluate_population(candidates, X, y, X_test, y_test, names, n_jobs=1, seed=42)
+    assert fitness.shape == accuracy.shape == (4,)
+    assert np.all((accuracy >= 0) & (accuracy <= 1))
+    parallel = evaluate_population(candidates, X, y, X_test, y_test, names, n_jobs=2, seed=42)
+    assert np.array_equal(parallel[0], fitness, equal_nan=True)
+    assert np.array_equal(parallel[1], accuracy)
+
+def test_population_cluster_cache(monkeypatch):
+    import simpful.search
+    caches = []
+    class RecordingCache(simpful.search.ClusteringCache):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            caches.append(self)
+    monkeypatch.setattr(simpful.search, "ClusteringCache", RecordingCache)
+    X, y, X_test, y_test, names = make_data()
+    # same variables and number of rules, different operators: the clusterings can be shared
+    candidates = [[rule.replace("AND_p", op, 1) for rule, op in zip(RULES, ops)] 
+                  for ops in [("AND_p", "AND_p"), ("AND", "AND_p"), ("OR", "AND_p"), ("AND_p", "AND"), ("AND", "AND"),
+                              ("OR", "AND"), ("AND_p", "OR"), ("AND", "OR"), ("OR", "OR")]]
+    evaluate_population(candidates, X, y, X_test, y_test, names, n_jobs=1, seed=0)
+    assert len(caches) == 1 and caches[0].hits > 0
+    assert caches[0].hits + caches[0].misses == len(candidates)
+
+def test_fitness_memo():
+    X, y, X_test, y_test, names = make_data()
+    memo = FitnessMemo()
+    fitness, accuracy = evaluate_population([RULES, SHUFFLED, RULES], X, y, X_test, y_test, names, n_jobs=1, seed=0, memo=memo)
+    assert len(memo) == 1 and memo.misses == 1
+    assert fitness[0] == fitness[1] == fitness[2] and accuracy[0] == accuracy[1] == accuracy[2]
+    again = evaluate_population([SHUFFLED], X, y, X_test, y_test, names, n_jobs=1, seed=0, memo=memo)
+    assert memo.hits == 1
+    assert again[1][0] == accuracy[0]
+    # other arguments or other data are different candidates
+    widths = evaluate_population([{"rules": RULES, "per_dimension_widths": True}, {"rules": RULES}],
+                                 X, y, X_test, y_test, names, n_jobs=1, seed=0, memo=memo)
+    assert memo.hits == 2 and len(memo) == 2
+    assert widths[1][1] == accuracy[0]
+    evaluate_population([RULES], X[::-1], y[::-1], X_test, y_test, names, n_jobs=1, seed=0, memo=memo)
+    assert memo.hits == 2 and len(memo) == 3
+    # the number of rules of the candidate is that of its rule base, whatever the argument
+    evaluate_population([{"rules": RULES, "numb_rules": 5}], X, y, X_test, y_test, names, n_jobs=1, seed=0, memo=memo)
+    assert memo.hits == 3 and len(memo) == 3
+
+def test_rule_trees():
+    from simpful import curparse, canonical_form
+    from simpful.search import hash_rules, hash_rule_trees
+    np.random.seed(3)
+    pfs = ProbaFuzzySystem(var_names=["a", "b", "c", "d"], consequents=["0", "1"], numb_rules=5)
+    trees, probas = pfs.generate_proba_rule_trees()
+    assert len(trees) == 5 and probas is None
+    rules = pfs.render_proba_rules()
+    for tree, rule in zip(trees, rules):
+        assert canonical_form(curparse(rule[3:rule.find(" THEN")])) == canonical_form(tree)
+    assert hash_rules(rules) == hash_rule_trees(trees, None, 2)
+    pfs.add_proba_rule_trees(trees)
+    assert pfs.get_rulebase_hash() == hash_rules(rules)
+    assert pfs.unique_vars == sorted(pfs.unique_vars)
+
+def test_rule_trees_match_strings():
+    """Check that, with the same random state, the trees are the parsed rules of generate_proba_rules"""
+    import random
+    from simpful import curparse, preparse, postparse
+    for generateprobas in [True, False]:
+        pfs = ProbaFuzzySystem(var_names=["a", "b", "c", "d", "e"], consequents=["0", "1", "2"], numb_rules=20, 
+                               generateprobas=generateprobas)
+        np.random.seed(5)
+        random.seed(5)
+        rules = pfs.generate_proba_rules()
+        np.random.seed(5)
+        random.seed(5)
+        trees, probas = pfs.generate_proba_rule_trees()
+        assert any("NOT" in rule for rule in rules)
+        assert [str(tree) for tree in trees] == [str(curparse(preparse(rule))) for rule in rules]
+        if generateprobas:
+            assert probas == pytest.approx(np.array([postparse(rule) for rule in rules]))
+            assert probas.sum(axis=1) == pytest.approx(1)
+        else:
+            assert probas is None
+
+def test_grid_search():
+    from simpful.search import grid_search, parameter_grid, kfold_indices
+    X, y, X_test, y_test, names = make_data()
+    X, y = np.vstack((X, X_test)), np.concatenate((y, y_test))
+    folds = kfold_indices(len(X), 3, seed=0)
+    assert np.array_equal(np.sort(np.concatenate([test for _, test in folds])), np.arange(len(X)))
+    grid = {"numb_rules": [2, 3], "threshold": [None]}
+    assert parameter_grid(grid) == [{"numb_rules": 2, "threshold": None}, {"numb_rules": 3, "threshold": None}]
+    results = grid_search(grid, X, y, names, n_folds=3, n_jobs=1, seed=0)
+    assert [row["params"]["numb_rules"] for row in results] == [2, 3]
+    assert sorted(row["rank_fitness"] for row in results) == [1, 2]
+    for row in results:
+        assert len(row["fold_fitness"]) == 3
+        assert row["mean_accuracy"] == pytest.approx(np.mean(row["fold_accuracy"]))
+    parallel = grid_search(grid, X, y, names, n_folds=3, n_jobs=2, seed=0)
+    assert [row["fold_accuracy"] for row in parallel] == [row["fold_accuracy"] for row in results]
+
+def test_racing_memo():
+    X, y, X_test, y_test, names = make_data(1000)
+    X, y, X_test, y_test = X[:500], y[:500], np.vstack((X[500:], X_test)), np.concatenate((y[500:], y_test))
+    exact = evaluate_population([RULES], X, y, X_test, y_test, names, n_jobs=1, seed=0)
+    memo = FitnessMemo()
+    raced = evaluate_population([RULES], X, y, X_test, y_test, names, n_jobs=1, seed=0, memo=memo, threshold=1.)
+    assert raced[0][0] < 1. and raced[0][0] != exact[0][0]
+    # the estimates of a candidate stopped early are not served to later exact requests
+    assert len(memo) == 0
+    again = evaluate_population([RULES], X, y, X_test, y_test, names, n_jobs=1, seed=0, memo=memo)
+    assert again[0][0] == exact[0][0] and again[1][0] == exact[1][0]
+    assert len(memo) == 1
+
+def test_global_random_state():
+    import random
+    X, y, X_test, y_test, names = make_data()
+    random.seed(123)
+    np.random.seed(123)
+    expected = random.random(), np.random.rand()
+    random.seed(123)
+    np.random.seed(123)
+    evaluate_population([{"numb_rules": 3}, RULES], X, y, X_test, y_test, names, n_jobs=1, seed=0)
+    # the candidates are seeded without changing the state of the caller's generators
+    assert (random.random(), np.random.rand()) == expected
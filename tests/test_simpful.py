@@ -0,0 +1,231 @@
+import numpy as np
+import pytest
+from simpful import FuzzySystem, AutoTriangle
+
+def build_grid_system(n_sets=5, **kwargs):
+    FS = FuzzySystem(**kwargs)
+    terms = ["t%d" % i for i in range(n_sets)]
+    FS.add_linguistic_variable("x", AutoTriangle(n_sets, terms=terms, universe_of_discourse=[0, 10]))
+    FS.add_linguistic_variable("y", AutoTriangle(n_sets, terms=terms, universe_of_discourse=[0, 10]))
+    rules = []
+    for i in range(n_sets):
+        for j in range(n_sets):
+            FS.set_crisp_output_value("out_%d_%d" % (i, j), i*j)
+            rules.append("IF (x IS t%d) AND (y IS t%d) THEN (z IS out_%d_%d)" % (i, j, i, j))
+    FS.add_rules(rules)
+    return FS
+
+def test_rule_index():
+    """Check that indexed inference only evaluates the active rules and gives the same results"""
+    plain = build_grid_system()
+    indexed = build_grid_system(index_rules=True)
+    for x, y in [(0.3, 9.1), (3.1, 1.2), (7.7, 4.2)]:
+        for FS in [plain, indexed]:
+            FS.set_variable("x", x)
+            FS.set_variable("y", y)
+        assert len(indexed.get_active_rules()) <= 4
+        assert indexed.get_firing_strengths() == pytest.approx(plain.get_firing_strengths())
+        assert indexed.Sugeno_inference(["z"])["z"] == pytest.approx(plain.Sugeno_inference(["z"])["z"])
+
+def test_truncation_error_bound():
+    """Check that truncated Gaussian memberships have finite supports and respect the error bound"""
+    from simpful import FuzzySet, Gaussian_MF, LinguisticVariable
+    systems = []
+    for index_rules in [False, True]:
+        FS = FuzzySystem(index_rules=index_rules)
+        for name in ["x", "y"]:
+            FS.add_linguistic_variable(name, LinguisticVariable(
+                [FuzzySet(function=Gaussian_MF(mu, 1.), term="g%d" % mu) for mu in range(0, 11, 2)], universe_of_discourse=[0, 10]))
+        rules = []
+        for i in range(0, 11, 2):
+            for j in range(0, 11, 2):
+                FS.set_crisp_output_value("out_%d_%d" % (i, j), i+j)
+                rules.append("IF (x IS g%d) AND_p (y IS g%d) THEN (z IS out_%d_%d)" % (i, j, i, j))
+        FS.add_rules(rules)
+        systems.append(FS)
+    exact, truncated = systems
+    truncated.set_truncation(1e-3)
+    left, right = truncated._lvs["x"]._FSlist[0].get_support()
+    assert np.isfinite(left) and np.isfinite(right)
+    for x, y in [(1.3, 8.9), (4.1, 5.5)]:
+        for FS in systems:
+            FS.set_variable("x", x)
+            FS.set_variable("y", y)
+        assert len(truncated.get_active_rules()) < len(truncated._rules)
+        error = abs(exact.Sugeno_inference(["z"])["z"] - truncated.Sugeno_inference(["z"])["z"])
+        assert error <= truncated.get_truncation_error_bound(["z"])["z"]
+
+def test_truncated_triangles():
+    """Check that truncated triangular memberships shrink the supports used by the rule index and the error bound"""
+    exact = build_grid_system()
+    truncated = build_grid_system(index_rules=True)
+    truncated.set_truncation(0.3)
+    left, right = truncated._lvs["x"]._FSlist[2].get_support()
+    assert (left, right) == pytest.approx((2.5 + 0.75, 7.5 - 0.75))
+    for x, y in [(0.3, 9.1), (3.1, 1.2), (7.7, 4.2)]:
+        for FS in [exact, truncated]:
+            FS.set_variable("x", x)
+            FS.set_variable("y", y)
+        assert len(truncated.get_active_rules()) < 4
+        error = abs(exact.Sugeno_inference(["z"])["z"] - truncated.Sugeno_inference(["z"])["z"])
+        assert error <= truncated.get_truncation_error_bound(["z"])["z"]
+    report = truncated.build_lookup_tables(resolution=64, interpolate=False)["x"]
+    values = np.linspace(0, 10, 2001)
+    fs = truncated._lvs["x"]._FSlist[2]
+    exact_values = [float(fs._funpointer(v)) for v in values]
+    lookup_values = truncated._lvs["x"].get_term_values_array(fs._term, values)
+    assert np.max(np.abs(exact_values - lookup_values)) <= report["max_error"] + 1e-12
+
+def test_reorder_rule_clauses():
+    """Check that reordering the clauses does not change the results of the inference"""
+    FS = build_grid_system(n_sets=3)
+    FS.add_rules(["IF (x IS t0) OR ((y IS t1) AND_p (x IS t2)) OR (NOT (y IS t2)) THEN (z IS out_1_1)"])
+    values = np.linspace(0, 10, 7)
+    reference = []
+    for x in values:
+        FS.set_variable("x", x)
+        FS.set_variable("y", 10-x)
+        reference.append(FS.get_firing_strengths())
+    FS.reorder_rule_clauses(data={"x": values, "y": values})
+    for x, expected in zip(values, reference):
+        FS.set_variable("x", x)
+        FS.set_variable("y", 10-x)
+        assert FS.get_firing_strengths() == pytest.approx(expected)
+
+def test_lookup_tables():
+    """Check that inference with lookup tables stays within the reported error"""
+    exact = build_grid_system()
+    tabulated = build_grid_system()
+    reports = tabulated.build_lookup_tables(resolution=1025)
+    assert reports["x"]["memory"] == 5*1025*8
+    assert reports["x"]["max_error"] < 1e-9  # triangles are linear between grid points
+    for x, y in [(0.31, 9.1), (3.14, 1.2), (12, 4.2)]:
+        for FS in [exact, tabulated]:
+            FS.set_variable("x", x)
+            FS.set_variable("y", y)
+        assert tabulated.get_firing_strengths() == pytest.approx(exact.get_firing_strengths(), abs=1e-9)
+    # the error peaks at the vertices and at the discontinuities, not halfway between grid points
+    from simpful import LinguisticVariable, FuzzySet, Triangular_MF
+    from simpful.fuzzy_sets import Crisp_MF
+    triangle = LinguisticVariable([FuzzySet(function=Triangular_MF(0, 3.14159, 10), term="t")], universe_of_discourse=[0, 10])
+    x, grid = np.linspace(0, 10, 100001), np.linspace(0, 10, 11)
+    membership = triangle._FSlist[0].get_value_array
+    expected = np.max(np.abs(np.interp(x, grid, membership(grid)) - membership(x)))
+    assert triangle.build_lookup_table(resolution=11)["max_error"] == pytest.approx(expected, rel=1e-3)
+    crisp = LinguisticVariable([FuzzySet(function=Crisp_MF(2.5, 7.9), term="t")], universe_of_discourse=[0, 10])
+    assert crisp.build_lookup_table(resolution=11)["max_error"] == pytest.approx(0.9)
+
+def test_fit_consequents():
+    """Check the learned consequents against direct least squares and the per-sample inference"""
+    FS = FuzzySystem(show_banner=False)
+    terms = ["low", "mid", "high"]
+    FS.add_linguistic_variable("x", AutoTriangle(3, terms=terms, universe_of_discourse=[0, 10]))
+    FS.add_rules(["IF (x IS %s) THEN (y IS f_%s)" % (term, term) for term in terms])
+    X = np.linspace(0, 10, 101)[:, None]
+    y = np.sin(X[:, 0])
+    fitted = FS.fit_consequents(X, y, "y", ["x"], order=0)
+    W = FS.get_firing_strengths_array(X, var_names=["x"])
+    W /= W.sum(axis=1, keepdims=True)
+    expected = np.linalg.lstsq(W, y, rcond=None)[0]
+    assert [fitted["f_%s" % term] for term in terms] == pytest.approx(expected)
+    FS.set_variable("x", 3.3)
+    assert FS.Sugeno_inference(["y"])["y"] == pytest.approx(np.interp(3.3, X[:, 0], W @ expected))
+    # a linear target is reproduced exactly by first order consequents, both global and local
+    for mode in ["global", "local"]:
+        FS.fit_consequents(X, 2*X[:, 0]+1, "y", ["x"], order=1, mode=mode)
+        for x in [0.7, 4.2, 9.9]:
+            FS.set_variable("x", x)
+            assert FS.Sugeno_inference(["y"])["y"] == pytest.approx(2*x+1)
+
+def test_mamdani_max_aggregation():
+    """Check that Mamdani rules sharing an output term are aggregated by maximum, not by the last rule"""
+    u = np.linspace(0, 10, 1000)
+    def centroid(FS, cuts):
+        fuzzy_sets = FS._lvs["z"]._FSlist
+        values = np.max([np.minimum(cut, fs.get_value_array(u)) for cut, fs in zip(cuts, fuzzy_sets)], axis=0)
+        with np.errstate(invalid="ignore"):
+            return np.sum(values*u) / np.sum(values)
+    for index_rules in [False, True]:
+        FS = FuzzySystem(show_banner=False, index_rules=index_rules)
+        FS.add_linguistic_variable("x", AutoTriangle(2, terms=["t0", "t1"], universe_of_discourse=[0, 10]))
+        FS.add_linguistic_variable("z", AutoTriangle(2, terms=["s0", "s1"], universe_of_discourse=[0, 10]))
+        FS.add_rules(["IF (x IS t1) THEN (z IS s1)", "IF (x IS t0) THEN (z IS s1)", "IF (x IS t0) THEN (z IS s0)"])
+        for x, first, second in [(8., 0.8, 0.2), (10., 1., 0.)]:
+            FS.set_variable("x", x)
+            result = FS.Mamdani_inference(["z"])["z"]
+            # the last rule with output s1 fires less: max aggregation vs the cut of the last rule only
+            assert result == pytest.approx(centroid(FS, [second, first]))
+            assert result != pytest.approx(centroid(FS, [second, second]), abs=0.1)
+
+def test_generate_rules_from_data():
+    """Check the Wang-Mendel rules against the cells of the input partitions"""
+    rng = np.random.default_rng(0)
+    X = rng.uniform(0, 10, size=(20000, 2))
+    y = X[:, 0] + X[:, 1]
+    terms = ["t%d" % i for i in range(5)]
+    FS = FuzzySystem(show_banner=False)
+    for name in ["x", "y"]:
+        FS.add_linguistic_variable(name, AutoTriangle(5, terms=terms, universe_of_discourse=[0, 10]))
+    FS.add_linguistic_variable("z", AutoTriangle(9, terms=["s%d" % i for i in range(9)], universe_of_discourse=[0, 20]))
+    rules = FS.generate_rules_from_data(X, y, ["x", "y"], "z")
+    assert len(rules) == 25
+    # each cell of the grid gets the output term peaking at the sum of the centers
+    assert "IF ((x IS t1) AND (y IS t3)) THEN (z IS s4)" in rules
+    assert "IF ((x IS t4) AND (y IS t4)) THEN (z IS s8)" in rules
+    FS.set_variable("x", 5.)
+    FS.set_variable("y", 2.5)
+    assert FS.Mamdani_inference(["z"])["z"] == pytest.approx(7.5, abs=0.1)
+
+    # without an output variable, the consequents are the weighted averages of the outputs
+    FS = FuzzySystem(show_banner=False)
+    FS.add_linguistic_variable("x", AutoTriangle(5, terms=terms, universe_of_discourse=[0, 10]))
+    rules = FS.generate_rules_from_data(X[:, :1], 3*X[:, 0], ["x"], "z")
+    assert len(rules) == 5
+    assert FS._crispvalues["z_3"] == pytest.approx(15, abs=0.5)
+
+def test_output_gradients():
+    """Check the analytic derivatives of the Sugeno outputs against finite differences"""
+    from simpful import LinguisticVariable, FuzzySet, Gaussian_MF, Triangular_MF
+    FS = FuzzySystem(show_banner=False)
+    FS.add_linguistic_variable("x", LinguisticVariable([FuzzySet(function=Gaussian_MF(2, 1.5), term="a"),
+        FuzzySet(function=Triangular_MF(1, 5, 9), term="b"), FuzzySet(function=Triangular_MF(4, 9, 9), term="c")], universe_of_discourse=[0, 10]))
+    FS.add_linguistic_variable("y", LinguisticVariable([FuzzySet(function=Gaussian_MF(3, 2), term="a"),
+        FuzzySet(function=Triangular_MF(0, 0, 6), term="b")], universe_of_discourse=[0, 10]))
+    FS.add_rules(["IF (x IS a) AND (y IS b) THEN (z IS k1)", "IF ((x IS b) OR (y IS a)) THEN (z IS k2)",
+                  "IF (NOT (x IS c)) AND_p (y IS a) THEN (z IS f)", "IF (x IS c) THEN (z IS k1)"])
+    FS.set_crisp_output_value("k1", 1.)
+    FS.set_crisp_output_value("k2", 4.)
+    FS.set_output_function("f", "2*x - y")
+    X = np.random.default_rng(1).uniform(0, 10, size=(50, 2))
+    outputs, jacobian, layout = FS.get_output_gradients(X, ["x", "y"], "z")
+    FS.set_variable("x", X[0, 0])
+    FS.set_variable("y", X[0, 1])
+    assert outputs[0] == pytest.approx(FS.Sugeno_inference(["z"])["z"])
+    # shoulders of triangles are tied, consequents k1 and k2 come last
+    assert layout.size == 2 + 3 + 2 + 2 + 2 + 2
+    theta = layout.get_vector()
+    for k in range(layout.size):
+        step = np.zeros(layout.size)
+        step[k] = 1e-6
+        layout.set_vector(theta + step)
+        upper = FS.get_output_gradients(X, ["x", "y"], "z", layout=layout)[0]
+        layout.set_vector(theta - step)
+        lower = FS.get_output_gradients(X, ["x", "y"], "z", layout=layout)[0]
+        assert (upper - lower) / 2e-6 == pytest.approx(jacobian[:, k], abs=1e-6)
+    layout.set_vector(theta)
+
+def test_tune():
+    """Check that gradient-based and hybrid tuning reduce the error"""
+    FS = FuzzySystem(show_banner=False)
+    FS.add_linguistic_variable("x", AutoTriangle(4, terms=["t0", "t1", "t2", "t3"], universe_of_discourse=[0, 10]))
+    FS.add_rules(["IF (x IS t%d) THEN (y IS k%d)" % (i, i) for i in range(4)])
+    for i in range(4):
+        FS.set_crisp_output_value("k%d" % i, 0.)
+    X = np.linspace(0, 10, 200)[:, None]
+    y = np.sin(X[:, 0])
+    history = FS.tune(X, y, ["x"], "y", epochs=40, learning_rate=0.1)
+    assert history[-1] < 0.1*history[0]
+    history = FS.tune(X, y, ["x"], "y", epochs=20, learning_rate=0.1, hybrid=True, order=1, batch_size=50, seed=0)
+    assert history[-1] < history[0]
+    outputs = FS.get_output_gradients(X, ["x"], "y")[0]
+    assert np.mean((outputs - y)**2) == pytest.approx(history[-1], rel=0.5)